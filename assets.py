@@ -0,0 +1,152 @@
+# Central image loading with memoized scaled and rotated variants
+from collections import OrderedDict
+import threading
+import pygame
+
+
+# Define a class that loads every image once and caches derived variants
+class AssetManager:
+    def __init__(self, max_variants=128):
+        self.max_variants = max_variants
+        self.images = {}  # Source images by path, in display format once a display exists
+        self.converted = set()  # Paths whose image has been converted to the display format
+        self.variants = OrderedDict()  # Scaled/rotated images by (path, size, angle), least recently used first
+
+    # Convert a surface to the display pixel format, keeping per-pixel alpha where it has any
+    @staticmethod
+    def to_display_format(surface):
+        if pygame.display.get_surface() is None:
+            return surface
+        if surface.get_flags() & pygame.SRCALPHA:
+            return surface.convert_alpha()
+        return surface.convert()
+
+    # Get the source image at `path`, decoding it from disk only the first time
+    def image(self, path):
+        surface = self.images.get(path)
+        if surface is None:
+            surface = pygame.image.load(path)
+            self.images[path] = surface
+        if path not in self.converted and pygame.display.get_surface() is not None:
+            # Match the display pixel format as soon as there is a display, so blits are straight copies
+            surface = self.to_display_format(surface)
+            self.images[path] = surface
+            self.converted.add(path)
+        return surface
+
+    # Get the image at `path` scaled to `size` and then rotated by `angle` degrees
+    def variant(self, path, size=None, angle=0):
+        key = (path, tuple(size) if size is not None else None, angle)
+        surface = self.variants.get(key)
+        if surface is not None:
+            self.variants.move_to_end(key)
+            return surface
+
+        surface = self.image(path)
+        if size is not None and surface.get_size() != tuple(size):
+            surface = pygame.transform.scale(surface, size)
+        if angle:
+            surface = pygame.transform.rotate(surface, angle)
+
+        self.variants[key] = surface
+        if len(self.variants) > self.max_variants:
+            self.variants.popitem(last=False)  # Evict the least recently used variant
+        return surface
+
+    # Get the image at `path` scaled to `size`
+    def scaled(self, path, size):
+        return self.variant(path, size)
+
+    # Get the image at `path` scaled to `size` and rotated by `angle` degrees
+    def rotated(self, path, size, angle):
+        return self.variant(path, size, angle)
+
+    # Forget converted images and variants, e.g. after the display mode changed
+    def clear(self):
+        self.images.clear()
+        self.converted.clear()
+        self.variants.clear()
+
+
+# Shared by all menu screens
+ASSETS = AssetManager()
+
+
+# Define a class that builds registered assets lazily, in order, on a background thread
+class BackgroundLoader:
+    PENDING, LOADING, DONE = range(3)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.factories = OrderedDict()  # Asset builders by key, in loading order
+        self.states = {}
+        self.results = {}
+        self.errors = {}
+        self.done_events = {}
+        self.thread = None
+
+    # Register how to build an asset; nothing is built until start() or get()
+    def register(self, key, factory):
+        with self.lock:
+            if key not in self.factories:
+                self.factories[key] = factory
+                self.states[key] = self.PENDING
+                self.done_events[key] = threading.Event()
+
+    # Start building every pending asset on a daemon thread
+    def start(self):
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self._run, name="asset-loader", daemon=True)
+            self.thread.start()
+
+    # Claim the next pending asset, or None when there is nothing left to build
+    def _claim(self):
+        with self.lock:
+            for key, state in self.states.items():
+                if state == self.PENDING:
+                    self.states[key] = self.LOADING
+                    return key
+        return None
+
+    # Build one claimed asset and wake up anyone waiting for it
+    def _build(self, key):
+        try:
+            self.results[key] = self.factories[key]()
+        except Exception as error:  # Re-raised by get() on the thread that needs the asset
+            self.errors[key] = error
+        with self.lock:
+            self.states[key] = self.DONE
+        self.done_events[key].set()
+
+    def _run(self):
+        key = self._claim()
+        while key is not None:
+            self._build(key)
+            key = self._claim()
+
+    # Check whether an asset has been built
+    def ready(self, key):
+        return self.states.get(key) == self.DONE
+
+    # Fraction of the registered assets that have been built
+    def progress(self):
+        with self.lock:
+            if not self.states:
+                return 1.0
+            return sum(state == self.DONE for state in self.states.values()) / len(self.states)
+
+    # Get an asset, building it right here if the loader has not got to it yet,
+    # or blocking only until the background thread finishes it
+    def get(self, key):
+        with self.lock:
+            claimed = self.states[key] == self.PENDING
+            if claimed:
+                self.states[key] = self.LOADING
+        if claimed:
+            self._build(key)
+        self.done_events[key].wait()
+        if key in self.errors:
+            raise self.errors[key]
+        return self.results[key]
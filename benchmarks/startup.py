@@ -0,0 +1,86 @@
+# Measure how long the game takes to show its menu and to finish loading the race assets.
+#
+# Every run starts a fresh interpreter, so imports and image decoding are measured cold.
+# The sprite and track caches stay warm between runs unless --cold is given:
+#   python benchmarks/startup.py --runs 5 --width 3840 --height 2160 --cold
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter: the same steps as menu.main_menu, timed
+LAZY_STARTUP = """
+import time
+start = time.perf_counter()
+import pygame
+import menu
+imported = time.perf_counter()
+screen = pygame.display.set_mode(({width}, {height}))
+menu.preload(*screen.get_size())
+menu.Menu(None, screen).draw()
+first_frame = time.perf_counter()
+while menu.ASSET_LOADER.progress() < 1:
+    menu.Menu(None, screen).draw()
+assets_ready = time.perf_counter()
+print({{"import": imported - start, "first_menu_frame": first_frame - start, "assets_ready": assets_ready - start}})
+"""
+
+# Runs in the child interpreter: building every race asset up front, as importing main.py used to
+EAGER_STARTUP = """
+import time
+start = time.perf_counter()
+import os
+import pygame
+pygame.init()
+screen = pygame.display.set_mode(({width}, {height}))
+from simulation import Track, load_car_image
+Track({width}, {height})
+for filename in os.listdir("imgs/cars"):
+    load_car_image(filename, 0.7)
+print({{"eager_assets": time.perf_counter() - start}})
+"""
+
+
+# Run one snippet in a fresh interpreter with the SDL dummy drivers and return its timings
+def run_child(code, width, height, cold=False):
+    if cold:
+        shutil.rmtree(os.path.join(ROOT, ".cache", "sprites"), ignore_errors=True)
+        shutil.rmtree(os.path.join(ROOT, ".cache", "tracks"), ignore_errors=True)
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy", PYGAME_HIDE_SUPPORT_PROMPT="1")
+    output = subprocess.run([sys.executable, "-c", code.format(width=width, height=height)],
+                            cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+    return eval(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure menu and asset startup times.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--cold", action="store_true", help="empty the sprite and track caches before every run")
+    parser.add_argument("--json", action="store_true", help="print the medians as JSON")
+    args = parser.parse_args(argv)
+
+    samples = {}
+    for _ in range(args.runs):
+        for code in (LAZY_STARTUP, EAGER_STARTUP):
+            for name, seconds in run_child(code, args.width, args.height, args.cold).items():
+                samples.setdefault(name, []).append(seconds)
+
+    medians = {name: round(statistics.median(values) * 1000, 1) for name, values in samples.items()}
+    if args.json:
+        print(json.dumps(medians, indent=2))
+        return
+    cache = "cold" if args.cold else "warm"
+    print(f"Startup at {args.width}x{args.height} with {cache} caches, median of {args.runs} runs (ms):")
+    for name, milliseconds in medians.items():
+        print(f"  {name:<18} {milliseconds:>8}")
+
+
+if __name__ == "__main__":
+    main()
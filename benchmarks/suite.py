@@ -0,0 +1,205 @@
+# Time the hot paths of the game at several resolutions and compare them with a stored baseline.
+#
+# Every resolution runs in a fresh interpreter with the SDL dummy drivers:
+#   python benchmarks/suite.py                      # compare with benchmarks/baseline.json
+#   python benchmarks/suite.py --save-baseline      # record this machine's numbers as the baseline
+#   python benchmarks/suite.py --only draw_dirty level --resolutions 1920x1080
+#
+# Each resolution runs in several fresh interpreters (--rounds) and keeps the best of them, because
+# one process can land on a busy or throttled core and run slow throughout.
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+RESOLUTIONS = ("1920x1080", "2560x1440", "3840x2160")
+
+# A benchmark slower than the baseline by more than this share counts as a regression. The best time of
+# the repeats is compared, as it is far less noisy than the median on a busy machine.
+TOLERANCE = 0.15
+
+
+# Call `function` `number` times per repeat and return the median and best time per call in microseconds
+def measure(function, number, repeat=7):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        times.append((time.perf_counter() - start) / number * 1e6)
+    return {"median_us": round(statistics.median(times), 2), "min_us": round(min(times), 2)}
+
+
+# Runs in the child interpreter: build the game at one resolution and time every benchmark in `only`
+def run_benchmarks(width, height, only=None):
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)  # Images are loaded from paths relative to the game
+    import pygame
+    pygame.init()
+    win = pygame.display.set_mode((width, height))
+    import main
+    from utils import blit_rotate_center
+    from render import StaticBackground, DirtyRectRenderer
+    from hud import RaceHud
+    from headless import AutoPilot
+    from simulation import Track, Simulation, LEVEL_COMPLETE, LOST, GAME_WON
+
+    track = Track(width, height)
+    simulation = Simulation(track, "red_bull.png")
+    player_car, computer_car = simulation.player_car, simulation.computer_car
+
+    # Spin the car through every angle so caches and masks are exercised, not one lucky frame
+    angles = iter(range(10 ** 9))
+
+    def rotate_blit():
+        blit_rotate_center(win, player_car.img, (player_car.x, player_car.y), next(angles) % 360)
+
+    def update_mask():
+        player_car.angle = next(angles) % 360
+        player_car.update_mask()
+
+    def collide_border():
+        player_car.collide(track.border_mask, *track.border_pos)
+
+    def collide_finish():
+        player_car.collide(track.finish_mask, *track.finish_pos)
+
+    def wall_contact():
+        player_car.wall_contact(track.border_field)
+
+    def computer_move():
+        computer_car.move()
+        if computer_car.progress > 10 * computer_car.line.count:
+            computer_car.next_level(1)
+
+    background = StaticBackground(track.images())
+    background.build(win)
+    hud = RaceHud(pygame.font.SysFont("comicsans", 44))
+    full_renderer = DirtyRectRenderer(background, enabled=False)
+    dirty_renderer = DirtyRectRenderer(background, enabled=True)
+
+    def draw(renderer):
+        main.draw(win, renderer, hud, player_car, computer_car, simulation.game_info, alpha=0.5)
+
+    # A whole level driven by the headless autopilot, from the start to the finish line
+    def level():
+        race = Simulation(track, "red_bull.png")
+        autopilot = AutoPilot(track)
+        race.game_info.start_level()
+        for _ in range(100000):
+            if race.step(autopilot(race.player_car)) in (LEVEL_COMPLETE, LOST, GAME_WON):
+                break
+
+    benchmarks = {
+        "blit_rotate_center": (rotate_blit, 200),
+        "update_mask": (update_mask, 2000),
+        "collide_border": (collide_border, 2000),
+        "collide_finish": (collide_finish, 2000),
+        "wall_contact": (wall_contact, 5000),
+        "computer_move": (computer_move, 2000),
+        "draw_full": (lambda: draw(full_renderer), 20),
+        "draw_dirty": (lambda: draw(dirty_renderer), 100),
+        "level": (level, 1),
+    }
+    results = {}
+    for name, (function, number) in benchmarks.items():
+        if only and name not in only:
+            continue
+        results[name] = measure(function, number, repeat=1 if name == "level" else 7)
+    return results
+
+
+# Run the benchmarks of one resolution in `rounds` fresh interpreters and keep the best of each
+def run_child(resolution, only, rounds=3):
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy", PYGAME_HIDE_SUPPORT_PROMPT="1")
+    command = [sys.executable, os.path.abspath(__file__), "--child", resolution]
+    if only:
+        command += ["--only", *only]
+    results = {}
+    for _ in range(rounds):
+        output = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+        for name, timing in json.loads(output.strip().splitlines()[-1]).items():
+            best = results.setdefault(name, timing)
+            if timing["min_us"] < best["min_us"]:
+                results[name] = timing
+    return results
+
+
+# Microseconds as a short readable string
+def format_time(microseconds):
+    if microseconds >= 10000:
+        return f"{microseconds / 1000:.1f} ms"
+    return f"{microseconds:.2f} us"
+
+
+def machine():
+    return {"python": platform.python_version(), "platform": platform.platform(), "processor": platform.processor()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the game's hot paths at several resolutions.")
+    parser.add_argument("--resolutions", nargs="+", default=RESOLUTIONS, help="e.g. 1920x1080 3840x2160")
+    parser.add_argument("--only", nargs="+", help="run only these benchmarks")
+    parser.add_argument("--rounds", type=int, default=3, help="fresh interpreters per resolution")
+    parser.add_argument("--baseline", default=BASELINE, help="baseline file to compare with or save to")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="slowdown that counts as a regression")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        width, height = map(int, args.child.split("x"))
+        print(json.dumps(run_benchmarks(width, height, args.only)))
+        return 0
+
+    results = {resolution: run_child(resolution, args.only, args.rounds) for resolution in args.resolutions}
+
+    if args.save_baseline:
+        baseline = {"machine": machine(), "results": results}
+        if os.path.exists(args.baseline) and args.only:
+            with open(args.baseline) as f:
+                baseline["results"] = json.load(f)["results"]  # Only replace what was run
+            for resolution, benchmarks in results.items():
+                baseline["results"].setdefault(resolution, {}).update(benchmarks)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+            f.write("\n")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    # Best and median times per call, with the change of the best time from the baseline where there is one
+    regressions = []
+    for resolution, benchmarks in results.items():
+        print(f"{resolution} (per call: best, median):")
+        for name, timing in benchmarks.items():
+            line = f"  {name:<20} {format_time(timing['min_us']):>12} {format_time(timing['median_us']):>12}"
+            before = baseline.get(resolution, {}).get(name)
+            if before:
+                change = timing["min_us"] / before["min_us"] - 1
+                line += f"   {change:+7.1%} vs baseline {format_time(before['min_us'])}"
+                if change > args.tolerance:
+                    line += "  REGRESSION"
+                    regressions.append(f"{resolution} {name}")
+            print(line)
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+# Collision world: bodies bucketed in a uniform spatial hash grid, so exact mask tests only run
+# for bodies that share a cell and whose bounding boxes overlap
+from collections import defaultdict
+
+
+# Define a class for one collidable thing: a bounding rect on the screen and the mask drawn at its top-left
+class Body:
+    def __init__(self, kind, rect=None, mask=None, bump=None):
+        self.kind = kind  # "player", "computer" or "fleet"
+        self.rect = rect
+        self.mask = mask
+        self.bump = bump  # Called with a WallContact-like push when another car hits this one
+        self.serial = None  # Registration order, which keeps every query deterministic
+        self.bounds = None  # First and last (column, row) of the cells the body is in
+        self.cells = ()
+
+
+# Define a class holding every body in a uniform grid of `cell_size` pixel cells
+class CollisionWorld:
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = defaultdict(dict)  # Bodies by (column, row), in registration order
+        self.bodies = []
+        self.next_serial = 0
+
+    # First and last (column, row) of the cells covered by a rect
+    def bounds_of(self, rect):
+        size = self.cell_size
+        return (int(rect.left // size), int(rect.top // size),
+                int((rect.right - 1) // size), int((rect.bottom - 1) // size))
+
+    # Put a body into the cells within `bounds`
+    def _insert(self, body, bounds):
+        first_column, first_row, last_column, last_row = bounds
+        body.bounds = bounds
+        body.cells = tuple((column, row) for column in range(first_column, last_column + 1)
+                           for row in range(first_row, last_row + 1))
+        for cell in body.cells:
+            self.cells[cell][body] = None
+
+    # Take a body out of all its cells
+    def _discard(self, body):
+        for cell in body.cells:
+            del self.cells[cell][body]
+            if not self.cells[cell]:
+                del self.cells[cell]
+        body.bounds, body.cells = None, ()
+
+    # Register a body at its current rect
+    def add(self, body):
+        body.serial = self.next_serial
+        self.next_serial += 1
+        self.bodies.append(body)
+        self._insert(body, self.bounds_of(body.rect))
+        return body
+
+    def remove(self, body):
+        self._discard(body)
+        self.bodies.remove(body)
+
+    # Move a body to a new rect and mask, re-bucketing it only if it crossed into other cells
+    def move(self, body, rect, mask):
+        body.rect, body.mask = rect, mask
+        bounds = self.bounds_of(rect)
+        if bounds != body.bounds:
+            self._discard(body)
+            self._insert(body, bounds)
+
+    # Exact test of two bodies: the first overlapping point in `a`'s mask, or None
+    @staticmethod
+    def overlap(a, b):
+        if not a.rect.colliderect(b.rect):
+            return None
+        return a.mask.overlap(b.mask, (b.rect.left - a.rect.left, b.rect.top - a.rect.top))
+
+    # Bodies sharing a cell with `body`, in registration order
+    def neighbours(self, body):
+        found = {}
+        for cell in body.cells:
+            found.update(self.cells[cell])
+        found.pop(body, None)
+        return sorted(found, key=lambda other: other.serial)
+
+    # Every body overlapping `body` (optionally only of the given kinds), with the point of contact in `body`'s mask
+    def collisions(self, body, kinds=None):
+        hits = []
+        for other in self.neighbours(body):
+            if kinds is None or other.kind in kinds:
+                poi = self.overlap(body, other)
+                if poi is not None:
+                    hits.append((other, poi))
+        return hits
+
+    # Every overlapping pair of bodies whose kinds are both in `kinds`, each pair once, lower serial first
+    def pairs(self, kinds):
+        seen = set()
+        found = []
+        for bodies in self.cells.values():
+            members = [body for body in bodies if body.kind in kinds]
+            for i, first in enumerate(members):
+                for second in members[i + 1:]:
+                    a, b = (first, second) if first.serial < second.serial else (second, first)
+                    key = (a.serial, b.serial)
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    poi = self.overlap(a, b)
+                    if poi is not None:
+                        found.append((a, b, poi))
+        found.sort(key=lambda pair: (pair[0].serial, pair[1].serial))
+        return found
+
@@ -0,0 +1,162 @@
+# Signed distance field of the track walls, for constant-time collision queries with normals
+from collections import namedtuple
+import math  # Math module for mathematical operations
+import numpy as np  # NumPy for building and sampling the field
+import pygame  # Pygame library for collision masks
+
+# Cell size and clamping distance of the field at 1920x1080. Both grow with the screen, so the grid,
+# its build cost and its memory stay the same at every resolution.
+FIELD_CELL_PX = 2
+FIELD_BAND_PX = 40
+
+# Wall contact of one body: how deep it is in the wall and the unit normal pointing out of it
+WallContact = namedtuple("WallContact", ["depth", "normal_x", "normal_y"])
+
+
+# Distance (in cells) from every cell to the nearest True cell, exact up to `band` cells and
+# clamped beyond it. Separable: a vertical scan per column, then a windowed minimum along the rows.
+def _distance_to(cells, band):
+    height, width = cells.shape
+    far = np.float32(band + 1)
+
+    vertical = np.empty(cells.shape, np.float32)
+    previous = np.full(width, far, np.float32)
+    for y in range(height):
+        previous = np.where(cells[y], 0, np.minimum(previous + 1, far))
+        vertical[y] = previous
+    for y in range(height - 1, -1, -1):
+        previous = np.minimum(vertical[y], np.minimum(previous + 1, far))
+        vertical[y] = previous
+
+    padded = np.pad(vertical * vertical, ((0, 0), (band, band)), constant_values=far * far)
+    squared = padded[:, band:band + width].copy()
+    for shift in range(1, band + 1):
+        np.minimum(squared, padded[:, band - shift:band - shift + width] + shift * shift, out=squared)
+        np.minimum(squared, padded[:, band + shift:band + shift + width] + shift * shift, out=squared)
+    return np.minimum(np.sqrt(squared), far)
+
+
+# Define a class holding the signed distance (pixels, negative inside walls) and its gradient
+# on a grid laid over a wall mask placed at `pos`, for a screen `scale` times 1920 px wide
+class DistanceField:
+    def __init__(self, mask, pos, scale=1.0):
+        mask_width, mask_height = mask.get_size()
+        grid_width = max(2, round(mask_width / (FIELD_CELL_PX * scale)))
+        grid_height = max(2, round(mask_height * grid_width / mask_width))
+        self.cell = mask_width / grid_width  # Pixels per cell
+        self.origin = pos
+        self.band = FIELD_BAND_PX * scale  # Distances beyond this are clamped
+
+        # Wall cells from the mask scaled down to the grid
+        small = mask.scale((grid_width, grid_height))
+        walls = pygame.surfarray.array_red(small.to_surface()).T > 0
+        band = max(2, int(np.ceil(self.band / self.cell)))
+
+        # Positive outside the walls, negative inside, zero half a cell from the wall cells' centres
+        outside = _distance_to(walls, band)
+        inside = _distance_to(~walls, band)
+        self.distance = np.where(walls, 0.5 - inside, outside - 0.5) * np.float32(self.cell)
+
+        # Unit gradients, pointing away from the walls
+        gradient_y, gradient_x = np.gradient(self.distance)
+        length = np.hypot(gradient_x, gradient_y)
+        length[length == 0] = 1
+        self.gradient_x = (gradient_x / length).astype(np.float32)
+        self.gradient_y = (gradient_y / length).astype(np.float32)
+        self.index_grids()
+
+    # Rebuild a field from the grids of a built one, e.g. read back from a track bundle
+    @classmethod
+    def from_grids(cls, distance, gradient_x, gradient_y, cell, origin, band):
+        field = cls.__new__(cls)
+        field.cell, field.origin, field.band = cell, origin, band
+        field.distance, field.gradient_x, field.gradient_y = distance, gradient_x, gradient_y
+        field.index_grids()
+        return field
+
+    # Flat views for single-point queries, which are cheaper than NumPy calls on a few points
+    def index_grids(self):
+        self.grids = [memoryview(grid.ravel()) for grid in (self.distance, self.gradient_x, self.gradient_y)]
+        self.grid_height, self.grid_width = self.distance.shape
+
+    # Bilinearly sample distance and wall normal at many screen points at once, like distance_at and normal_at
+    def sample(self, x, y):
+        x = (np.asarray(x, np.float64) - self.origin[0]) / self.cell - 0.5
+        y = (np.asarray(y, np.float64) - self.origin[1]) / self.cell - 0.5
+        height, width = self.distance.shape
+        clamped_x = np.clip(x, 0, width - 1)
+        clamped_y = np.clip(y, 0, height - 1)
+        outside = np.hypot(x - clamped_x, y - clamped_y) * self.cell
+
+        x0 = np.minimum(clamped_x.astype(np.intp), width - 2)
+        y0 = np.minimum(clamped_y.astype(np.intp), height - 2)
+        x1, y1 = x0 + 1, y0 + 1
+        fx, fy = clamped_x - x0, clamped_y - y0
+
+        def bilinear(grid):
+            top = grid[y0, x0] * (1 - fx) + grid[y0, x1] * fx
+            bottom = grid[y1, x0] * (1 - fx) + grid[y1, x1] * fx
+            return top * (1 - fy) + bottom * fy
+
+        normal_x, normal_y = bilinear(self.gradient_x), bilinear(self.gradient_y)
+        length = np.hypot(normal_x, normal_y)
+        length = np.where(length == 0, 1, length)
+        return bilinear(self.distance) + outside, normal_x / length, normal_y / length
+
+    # Signed distance of the nearest cell to many screen points at once, clamped to the grid's edge.
+    # Coarser than sample, but one lookup per point, for ray marching.
+    def nearest(self, x, y):
+        column = np.clip(((x - self.origin[0]) / self.cell).astype(np.intp), 0, self.grid_width - 1)
+        row = np.clip(((y - self.origin[1]) / self.cell).astype(np.intp), 0, self.grid_height - 1)
+        return self.distance[row, column]
+
+    # Grid index of the top-left of the 2x2 cells around a screen point, the bilinear weights and
+    # how far (in pixels) the point lies off the grid
+    def _cell(self, x, y):
+        width, height = self.grid_width, self.grid_height
+        x = (x - self.origin[0]) / self.cell - 0.5
+        y = (y - self.origin[1]) / self.cell - 0.5
+        if 0 <= x < width - 1 and 0 <= y < height - 1:
+            x0, y0 = int(x), int(y)
+            return y0 * width + x0, width, x - x0, y - y0, 0.0
+
+        clamped_x = min(max(x, 0.0), width - 1.0)
+        clamped_y = min(max(y, 0.0), height - 1.0)
+        x0 = min(int(clamped_x), width - 2)
+        y0 = min(int(clamped_y), height - 2)
+        outside = math.hypot(x - clamped_x, y - clamped_y) * self.cell
+        return y0 * width + x0, width, clamped_x - x0, clamped_y - y0, outside
+
+    @staticmethod
+    def _bilinear(grid, cell):
+        top_left, width, fx, fy, _ = cell
+        bottom_left = top_left + width
+        return ((grid[top_left] * (1 - fx) + grid[top_left + 1] * fx) * (1 - fy)
+                + (grid[bottom_left] * (1 - fx) + grid[bottom_left + 1] * fx) * fy)
+
+    # Signed distance at one screen point; off the grid, the distance to the grid's edge is added
+    def distance_at(self, x, y):
+        cell = self._cell(x, y)
+        return self._bilinear(self.grids[0], cell) + cell[4]
+
+    # Unit wall normal at one screen point
+    def normal_at(self, x, y):
+        cell = self._cell(x, y)
+        normal_x, normal_y = self._bilinear(self.grids[1], cell), self._bilinear(self.grids[2], cell)
+        length = math.hypot(normal_x, normal_y) or 1.0
+        return normal_x / length, normal_y / length
+
+    # Check whether a circle is clear of every wall, allowing for the interpolation error of one cell
+    def clear_of_walls(self, x, y, radius):
+        return self.distance_at(x, y) >= radius + self.cell
+
+    # Deepest contact of circles of `radius` centred on `points`, or None if none touches a wall
+    def contact(self, points, radius):
+        deepest, deepest_point = 0.0, None
+        for x, y in points:
+            depth = radius - self.distance_at(x, y)
+            if depth > deepest:
+                deepest, deepest_point = depth, (x, y)
+        if deepest_point is None:
+            return None
+        return WallContact(deepest, *self.normal_at(*deepest_point))
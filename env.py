@@ -0,0 +1,340 @@
+# The race as a reinforcement-learning environment, with a vectorized version stepping many races
+# in worker processes that write straight into shared memory
+#   python env.py --envs 64 --workers 4 --steps 2000     # random actions, reports steps per second
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")  # Never open a real window
+
+import argparse  # Command line parsing
+import multiprocessing  # Worker processes for the vector environment
+import time  # Time module for measuring the run
+from functools import lru_cache
+from multiprocessing import shared_memory
+import numpy as np  # NumPy for observations and the shared buffers
+from trackbundle import DEFAULT_TRACK  # Track raced unless another one is given
+from simulation import original_width, PHYSICS_HZ, Track, Simulation, Controls, PLAYER_INDEX, LOST
+
+# Directions of the distance rays, in degrees from the car's heading (positive to the left), and
+# how far they reach at 1920x1080
+RAY_ANGLES = (-90, -60, -35, -15, 0, 15, 35, 60, 90)
+RAY_LENGTH_PX = 300
+RAY_ITERATIONS = 12  # Most marching steps per ray; open track needs RAY_LENGTH_PX / FIELD_BAND_PX of them
+
+# Observation: ray distances (0 to 1 of the ray length), speed (share of top speed), sine and cosine of the heading
+OBSERVATION_SIZE = len(RAY_ANGLES) + 3
+
+# Discrete actions: no steering, left or right, each with no throttle, forward or backward
+ACTIONS = tuple(Controls(left=steer == "left", right=steer == "right",
+                         forward=throttle == "forward", backward=throttle == "backward")
+                for steer in (None, "left", "right") for throttle in (None, "forward", "backward"))
+
+# Rewards: per lap of progress along the track, per step touching a wall, and for the end of the level
+PROGRESS_REWARD = 100.0
+WALL_PENALTY = 0.05
+FINISH_REWARD = 10.0
+LOST_PENALTY = -10.0
+
+# Physics ticks per environment step (60 decisions a second, the game's original frame rate) and the
+# race time after which an episode is cut off
+FRAME_SKIP = 2
+MAX_EPISODE_TIME = 90
+
+
+# Tracks are shared by every environment of a process on the same track at the same resolution
+@lru_cache(maxsize=None)
+def load_track(width, height, name=DEFAULT_TRACK):
+    return Track(width, height, name)
+
+
+# March rays from (x, y) along the unit directions (dx, dy) through a wall distance field, each step as far
+# as the distance to the nearest wall allows, and return how far each got before a wall or `length`.
+# All arguments broadcast, so the rays of many cars are cast together.
+def cast_rays(field, x, y, dx, dy, length, iterations=RAY_ITERATIONS):
+    travelled = np.zeros(np.broadcast(x, dx).shape)
+    for _ in range(iterations):
+        step = np.maximum(field.nearest(x + dx * travelled, y + dy * travelled), 0)
+        travelled = np.minimum(travelled + step, length)
+        if not np.any((step >= field.cell) & (travelled < length)):
+            break
+    return travelled
+
+
+# Write the observations of environments sharing one track into the rows of `out`, casting all their rays at once
+def observe(envs, out):
+    track = envs[0].track
+    cars = [env.simulation.player_car for env in envs]
+    width, height = cars[0].img.get_size()
+    x = np.array([car.x for car in cars]) + width / 2
+    y = np.array([car.y for car in cars]) + height / 2
+    heading = np.radians([car.angle for car in cars])
+    length = envs[0].ray_length
+
+    directions = heading[:, None] + np.radians(RAY_ANGLES)
+    rays = cast_rays(track.border_field, x[:, None], y[:, None], -np.sin(directions), -np.cos(directions), length)
+    out[:, :len(RAY_ANGLES)] = rays / length
+    out[:, -3] = [car.vel / car.max_vel for car in cars]
+    out[:, -2] = np.sin(heading)
+    out[:, -1] = np.cos(heading)
+
+
+# Define a class running one race level as an episode with a gym-style reset/step interface.
+# Actions index ACTIONS. An episode ends when the level is completed or lost, or after MAX_EPISODE_TIME;
+# the race puts the cars back on the grid at the end of a level, so the last observation shows them there.
+class RaceEnv:
+    def __init__(self, width=1920, height=1080, sponsor_name="red_bull.png", grid_size=1, level=1,
+                 frame_skip=FRAME_SKIP, max_steps=None, track=DEFAULT_TRACK):
+        self.track = load_track(width, height, track)
+        self.simulation = Simulation(self.track, sponsor_name, grid_size)
+        self.level = level
+        self.frame_skip = frame_skip
+        self.max_steps = max_steps or MAX_EPISODE_TIME * PHYSICS_HZ // frame_skip
+        self.ray_length = RAY_LENGTH_PX * width / original_width
+        self.lap_length = self.track.sectors.lap_length
+        self.action_count = len(ACTIONS)
+        self.observation_shape = (OBSERVATION_SIZE,)
+        self.start()
+
+    # Distance the player car has covered along the track since the start of the level, in laps
+    def covered(self):
+        progress = self.simulation.progress
+        return float(progress.laps[PLAYER_INDEX] * self.lap_length + progress.distance[PLAYER_INDEX]) / self.lap_length
+
+    # Put every car back on the grid of `level` with the clock running
+    def start(self, level=None):
+        simulation = self.simulation
+        game_info = simulation.game_info
+        game_info.reset()
+        game_info.level = level or self.level
+        game_info.start_level()
+        simulation.player_car.reset()
+        simulation.computer_car.next_level(game_info.level)
+        if simulation.fleet is not None:
+            simulation.fleet.next_level(game_info.level)
+        simulation.progress.reset(*simulation.car_centers())
+        self.last_covered = self.covered()
+        self.steps = 0
+        self.episode_return = 0.0
+
+    # Start a new episode and return its first observation and an info dict. The race has no randomness,
+    # so `seed` is only accepted for compatibility; options may hold the "level" to race.
+    def reset(self, seed=None, options=None):
+        self.start((options or {}).get("level"))
+        observation = np.empty((1, OBSERVATION_SIZE), np.float32)
+        observe([self], observation)
+        return observation[0], {"level": self.simulation.game_info.level}
+
+    # Run `frame_skip` physics ticks with the controls of `action` and return the reward, whether the
+    # level ended, whether the episode was cut off, and an info dict. Does not observe or reset.
+    def advance(self, action):
+        simulation = self.simulation
+        controls = ACTIONS[action]
+        level = simulation.game_info.level
+        reward = 0.0
+        event = None
+        for _ in range(self.frame_skip):
+            event = simulation.step(controls)
+            if event is not None:
+                break
+            if simulation.wall_contact is not None:
+                reward -= WALL_PENALTY / self.frame_skip
+
+        if event is None:
+            covered = self.covered()
+            reward += (covered - self.last_covered) * PROGRESS_REWARD
+            self.last_covered = covered
+        else:
+            reward += LOST_PENALTY if event == LOST else FINISH_REWARD
+
+        self.steps += 1
+        self.episode_return += reward
+        terminated = event is not None
+        truncated = not terminated and self.steps >= self.max_steps
+        info = {"event": event, "level": level}
+        if terminated or truncated:
+            info["episode"] = {"return": self.episode_return, "length": self.steps}
+        return reward, terminated, truncated, info
+
+    # Gym-style step: the next observation, the reward, terminated, truncated and an info dict
+    def step(self, action):
+        reward, terminated, truncated, info = self.advance(action)
+        observation = np.empty((1, OBSERVATION_SIZE), np.float32)
+        observe([self], observation)
+        return observation[0], reward, terminated, truncated, info
+
+
+# Shapes and types of the vector environment's shared arrays
+BUFFERS = (("observations", np.float32, (OBSERVATION_SIZE,)), ("rewards", np.float32, ()),
+           ("terminated", np.bool_, ()), ("truncated", np.bool_, ()), ("actions", np.int64, ()))
+
+
+# Size in bytes of the arrays of `num_envs` environments, each starting on an 8-byte boundary
+def buffers_size(num_envs):
+    return sum(-(-np.dtype(dtype).itemsize * num_envs * int(np.prod(shape)) // 8) * 8 for _, dtype, shape in BUFFERS)
+
+
+# NumPy views of the arrays of `num_envs` environments laid out in `buffer` (None to allocate them)
+def buffers_view(num_envs, buffer=None):
+    buffer = buffer if buffer is not None else bytearray(buffers_size(num_envs))
+    views = {}
+    offset = 0
+    for name, dtype, shape in BUFFERS:
+        views[name] = np.ndarray((num_envs,) + shape, dtype, buffer, offset)
+        offset += -(-views[name].nbytes // 8) * 8
+    return views
+
+
+# Define a class stepping the environments start to stop of a vector environment, reading their actions
+# from and writing their results to the shared arrays. Finished episodes start again straight away.
+class EnvSlice:
+    def __init__(self, buffers, start, stop, env_kwargs):
+        self.envs = [RaceEnv(**env_kwargs) for _ in range(start, stop)]
+        self.start = start
+        self.views = {name: array[start:stop] for name, array in buffers.items()}
+
+    def reset(self):
+        for env in self.envs:
+            env.start()
+        observe(self.envs, self.views["observations"])
+
+    # Step every environment and return {index: info} of the episodes that ended
+    def step(self):
+        rewards, terminated, truncated = self.views["rewards"], self.views["terminated"], self.views["truncated"]
+        finished = {}
+        for i, (env, action) in enumerate(zip(self.envs, self.views["actions"].tolist())):
+            rewards[i], terminated[i], truncated[i], info = env.advance(action)
+            if terminated[i] or truncated[i]:
+                finished[self.start + i] = info
+                env.start()
+        observe(self.envs, self.views["observations"])
+        return finished
+
+
+# Worker process: attach to the shared arrays and run commands from the pipe until told to close
+def run_worker(pipe, name, num_envs, start, stop, env_kwargs):
+    memory = shared_memory.SharedMemory(name=name)
+    envs = EnvSlice(buffers_view(num_envs, memory.buf), start, stop, env_kwargs)
+    try:
+        while True:
+            command = pipe.recv()
+            if command == "step":
+                pipe.send(envs.step())
+            elif command == "reset":
+                envs.reset()
+                pipe.send({})
+            else:
+                break
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        del envs  # Drop the views before closing the memory under them
+        memory.close()
+
+
+# Define a class running `num_envs` RaceEnvs split over `workers` processes (0 to step them in this one).
+# Observations, rewards and flags live in shared memory that the workers write into, so a step sends
+# one short message per worker and copies no arrays. Environments whose episode ended start the next one
+# at once: their observation is the first of the new episode and the info of the old one is returned.
+class VectorRaceEnv:
+    def __init__(self, num_envs, workers=None, context="spawn", **env_kwargs):
+        if workers is None:
+            workers = min(num_envs, os.cpu_count() or 1)
+        self.num_envs = num_envs
+        self.action_count = len(ACTIONS)
+        self.observation_shape = (num_envs, OBSERVATION_SIZE)
+        self.memory = None
+        self.pipes, self.processes, self.local = [], [], None
+
+        if workers == 0:
+            self.buffers = buffers_view(num_envs)
+            self.local = EnvSlice(self.buffers, 0, num_envs, env_kwargs)
+            return
+
+        self.memory = shared_memory.SharedMemory(create=True, size=buffers_size(num_envs))
+        self.buffers = buffers_view(num_envs, self.memory.buf)
+        multiprocessing_context = multiprocessing.get_context(context)
+        bounds = np.linspace(0, num_envs, workers + 1).astype(int)
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            pipe, worker_pipe = multiprocessing_context.Pipe()
+            process = multiprocessing_context.Process(
+                target=run_worker, args=(worker_pipe, self.memory.name, num_envs, start, stop, env_kwargs), daemon=True)
+            process.start()
+            self.pipes.append(pipe)
+            self.processes.append(process)
+
+    # Send a command to every worker and merge their replies
+    def broadcast(self, command):
+        for pipe in self.pipes:
+            pipe.send(command)
+        replies = {}
+        for pipe in self.pipes:
+            replies.update(pipe.recv())
+        return replies
+
+    # Start every environment's episode again and return the observations, shape (num_envs, OBSERVATION_SIZE)
+    def reset(self, seed=None):
+        if self.local is not None:
+            self.local.reset()
+        else:
+            self.broadcast("reset")
+        return self.buffers["observations"].copy(), {}
+
+    # Step every environment with its action and return observations, rewards, terminated and truncated
+    # flags, and {env index: info} for the episodes that ended
+    def step(self, actions):
+        self.buffers["actions"][:] = actions
+        finished = self.local.step() if self.local is not None else self.broadcast("step")
+        buffers = self.buffers
+        return (buffers["observations"].copy(), buffers["rewards"].copy(),
+                buffers["terminated"].copy(), buffers["truncated"].copy(), finished)
+
+    def close(self):
+        for pipe in self.pipes:
+            try:
+                pipe.send("close")
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.pipes, self.processes = [], []
+        if self.memory is not None:
+            self.buffers = None
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Step many races with random actions and report the throughput.")
+    parser.add_argument("--envs", type=int, default=32, help="number of environments")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU, 0 for none)")
+    parser.add_argument("--steps", type=int, default=1000, help="vector steps to run")
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--grid-size", type=int, default=1, help="computer cars per race")
+    parser.add_argument("--track", default=DEFAULT_TRACK, help="track in tracks/")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    with VectorRaceEnv(args.envs, args.workers, width=args.width, height=args.height, grid_size=args.grid_size,
+                       track=args.track) as envs:
+        envs.reset()
+        episodes = 0
+        start = time.perf_counter()
+        for _ in range(args.steps):
+            episodes += len(envs.step(rng.integers(len(ACTIONS), size=args.envs))[4])
+        elapsed = time.perf_counter() - start
+
+    steps = args.steps * args.envs
+    print(f"{steps} steps of {args.envs} environments in {elapsed:.2f} s: {steps / elapsed:,.0f} steps/s, "
+          f"{steps * FRAME_SKIP / elapsed:,.0f} physics ticks/s, {episodes} episodes ended")
+
+
+if __name__ == "__main__":
+    main()
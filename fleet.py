@@ -0,0 +1,109 @@
+# A field of computer-controlled cars stepped together on NumPy arrays
+from functools import partial
+import numpy as np  # NumPy for the struct-of-arrays car state
+from utils import rotation_cache  # Pre-baked rotations shared by the whole field
+from collision import Body  # One collision body per car
+
+
+# Starting grid of `count` cars of the given size: three abreast, rows filling the straight behind and
+# ahead of the start line. Returns the top-left corners of the cars.
+def grid_positions(track, width, height, count):
+    scale = track.width / 1920
+    start_x, _ = track.player_start
+    row_gap = width + 2 * scale  # Side by side, with a small gap so neighbours do not touch
+    row_ys = [track.height * 0.87 - row_gap, track.height * 0.87, track.height * 0.87 + row_gap]
+    column_gap = 85 * scale
+
+    # Columns behind the start line (towards the finish line) first, then ahead of it
+    behind = []
+    x = start_x + column_gap
+    while x + (width + height) / 2 < track.finish_pos[0] - 10 * scale:
+        behind.append(x)
+        x += column_gap
+    ahead = []
+    x = start_x - column_gap
+    while len(behind) + len(ahead) < -(-count // len(row_ys)):
+        ahead.append(x)
+        x -= column_gap
+
+    slots = [(x, y) for x in behind + ahead for y in row_ys][:count]
+    return np.array([x for x, _ in slots]), np.array([y for _, y in slots])
+
+
+# Define a class for N computer cars that follow the track path in one batched step
+class NpcFleet:
+    # The first `skip` grid slots are left free for other cars
+    def __init__(self, count, img, max_vel, rotation_vel, track, rotation_step, rotation_cache_max_bytes, skip=0):
+        self.count = count
+        self.img = img
+        self.max_vel = max_vel
+        self.rotation_vel = rotation_vel
+        self.track = track
+        self.line = track.racing_line(img.get_size())
+        self.rotations = rotation_cache(img, rotation_step, rotation_cache_max_bytes)
+        self.width, self.height = img.get_size()
+
+        # Spread the base speeds a little so the field does not drive in formation
+        self.speed_spread = np.linspace(-0.3, 0.3, count) if count > 1 else np.zeros(1)
+        start_x, start_y = grid_positions(track, self.width, self.height, skip + count)
+        self.start_x, self.start_y = start_x[skip:], start_y[skip:]
+        self.start_progress = self.line.nearest(self.start_x + self.width / 2, self.start_y + self.height / 2)
+
+        self.x = np.empty(count)
+        self.y = np.empty(count)
+        self.angle = np.empty(count)
+        self.vel = np.empty(count)
+        self.progress = np.empty(count, dtype=np.int64)  # Racing line entry each car has reached
+        self.next_level(1)
+
+        # Collision bodies, kept at the cars' poses by the simulation
+        self.bodies = [Body("fleet", rect, mask, bump=partial(self.bump, i))
+                       for i, (mask, rect) in enumerate(self.shapes())]
+
+    # Put the field back on the grid with the speed of the given level
+    def next_level(self, level):
+        self.x[:] = self.start_x
+        self.y[:] = self.start_y
+        self.angle[:] = 90
+        self.vel[:] = self.max_vel + (level - 1) * 0.2 + self.speed_spread
+        self.progress[:] = self.start_progress
+        self.save_pose()
+
+    # Remember the poses at the start of a physics tick, for render interpolation
+    def save_pose(self):
+        self.prev_x, self.prev_y, self.prev_angle = self.x.copy(), self.y.copy(), self.angle.copy()
+
+    # Steer, move the whole field by one tick, scaled from per-frame speeds, and advance along the racing line
+    def move(self, scale=1.0):
+        # Same steering rule as ComputerCar.calculate_angle, for every car at once
+        target_x, target_y = self.line.targets(self.progress)
+        desired_angle = np.degrees(np.arctan2(self.x + self.width / 2 - target_x, self.y + self.height / 2 - target_y))
+        difference_in_angle = (desired_angle - self.angle + 180) % 360 - 180
+        self.angle = self.angle + np.copysign(np.minimum(self.rotation_vel * scale, np.abs(difference_in_angle)),
+                                              difference_in_angle)
+
+        radians = np.radians(self.angle)
+        self.y = self.y - np.cos(radians) * self.vel * scale
+        self.x = self.x - np.sin(radians) * self.vel * scale
+
+        # Same rule as ComputerCar.update_path_point
+        self.progress = self.line.advance_many(self.progress, self.x + self.width / 2, self.y + self.height / 2)
+
+    # Collision mask and rect of every car at its current pose
+    def shapes(self):
+        return [self.rotations.lookup((x, y), angle)[1:]
+                for x, y, angle in zip(self.x.tolist(), self.y.tolist(), self.angle.tolist())]
+
+    # Push car `index` out of another car
+    def bump(self, index, contact):
+        self.x[index] += contact.normal_x * contact.depth
+        self.y[index] += contact.normal_y * contact.depth
+
+    # Draw every car of the field, `alpha` of the way from the previous tick's poses to the current ones,
+    # and return the rects they cover
+    def draw(self, win, alpha=1.0):
+        x = self.prev_x + (self.x - self.prev_x) * alpha
+        y = self.prev_y + (self.y - self.prev_y) * alpha
+        angle = self.prev_angle + (self.angle - self.prev_angle) * alpha
+        return [self.rotations.blit(win, (car_x, car_y), car_angle)[1]
+                for car_x, car_y, car_angle in zip(x.tolist(), y.tolist(), angle.tolist())]
@@ -0,0 +1,314 @@
+# Run full races without a window, as fast as the CPU allows
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")  # Never open a real window
+
+import argparse  # Command line parsing
+import json  # JSON output of the report
+import math  # Math module for mathematical operations
+import struct  # Checksum files
+import sys
+import time  # Time module for measuring the run
+import numpy as np  # NumPy for the lap check's positions
+import pygame  # Pygame library for collision masks
+from trackbundle import DEFAULT_TRACK, COMMON_RESOLUTIONS  # Track raced unless another one is given
+from progress import SectorMap, RaceProgress  # Lap counting, for the lap check
+from simulation import original_width, PHYSICS_HZ, TICK_SCALE, Track, Simulation, GameInfo, Controls, LOST, LEVEL_COMPLETE, GAME_WON
+from inputs import ScriptedInput, ReplayInput  # Scripted and recorded controls
+from replay import Replay  # Recorded races to drive with
+
+# Distance from (x, y) along the unit direction (dx, dy) to the first wall or off-track pixel
+def wall_distance(track, track_mask, x, y, dx, dy, limit):
+    border_x, border_y = track.border_pos
+    track_x, track_y = track.track_pos
+    for distance in range(0, limit, 2):
+        px, py = x + dx * distance, y + dy * distance
+        border_point = (int(px - border_x), int(py - border_y))
+        track_point = (int(px - track_x), int(py - track_y))
+        if not track_mask.get_rect().collidepoint(track_point) or not track_mask.get_at(track_point):
+            return distance
+        if track.border_mask.get_rect().collidepoint(border_point) and track.border_mask.get_at(border_point):
+            return distance
+    return limit
+
+
+# Resample the track path every `spacing` pixels and pull each point towards the middle of the road
+def centerline(track, spacing=15, iterations=20):
+    scale = track.width / original_width
+    spacing = max(2, round(spacing * scale))
+    limit = round(300 * scale)
+    max_shift = 10 * scale
+    track_mask = pygame.mask.from_surface(track.image)
+
+    points = []
+    path = track.path
+    for i, (x0, y0) in enumerate(path):
+        x1, y1 = path[(i + 1) % len(path)]
+        length = math.hypot(x1 - x0, y1 - y0)
+        for step in range(max(1, int(length // spacing))):
+            t = step * spacing / length
+            points.append((x0 + (x1 - x0) * t, y0 + (y1 - y0) * t))
+
+    count = len(points)
+    for _ in range(iterations):
+        shifted = []
+        for i, (x, y) in enumerate(points):
+            (x0, y0), (x1, y1) = points[i - 2], points[(i + 2) % count]
+            length = math.hypot(x1 - x0, y1 - y0) or 1
+            dx, dy = (x1 - x0) / length, (y1 - y0) / length
+            left = wall_distance(track, track_mask, x, y, -dy, dx, limit)
+            right = wall_distance(track, track_mask, x, y, dy, -dx, limit)
+            shift = max(-max_shift, min(max_shift, (left - right) / 2))
+            shifted.append((x - dy * shift, y + dx * shift))
+
+        # Smooth each point with its neighbours
+        points = [((shifted[i - 1][0] + shifted[i][0] + shifted[(i + 1) % count][0]) / 3,
+                   (shifted[i - 1][1] + shifted[i][1] + shifted[(i + 1) % count][1]) / 3) for i in range(count)]
+    return points
+
+
+# Drive the player car along the middle of the road, replacing the keyboard
+class AutoPilot:
+    def __init__(self, track, cruise_vel=5, corner_vel=2, reach_distance=30):
+        self.path = centerline(track)
+        self.cruise_vel = cruise_vel
+        self.corner_vel = corner_vel
+        self.reach_distance = reach_distance * track.width / original_width
+        self.current_point = 0
+
+    # Start again from the first path point
+    def reset(self):
+        self.current_point = 0
+
+    # Choose the controls for the next physics tick
+    def __call__(self, car):
+        center_x = car.x + car.img.get_width() / 2
+        center_y = car.y + car.img.get_height() / 2
+
+        target_x, target_y = self.path[self.current_point]
+        while math.hypot(target_x - center_x, target_y - center_y) < self.reach_distance:
+            self.current_point = (self.current_point + 1) % len(self.path)
+            target_x, target_y = self.path[self.current_point]
+
+        # Cars move along (-sin(angle), -cos(angle)), so this is the heading that faces the target
+        desired_angle = math.degrees(math.atan2(center_x - target_x, center_y - target_y))
+        difference_in_angle = (desired_angle - car.angle + 180) % 360 - 180
+
+        target_vel = self.corner_vel if abs(difference_in_angle) > 30 else self.cruise_vel
+        return Controls(left=difference_in_angle > car.rotation_vel * TICK_SCALE / 2,
+                        right=difference_in_angle < -car.rotation_vel * TICK_SCALE / 2,
+                        forward=car.vel < target_vel)
+
+
+# Run one race from level 1 until the game is won, lost or max_ticks is reached.
+# With `checksums` (a list), the chained checksum of the state after every tick is appended to it.
+def run_race(track, sponsor_name, controller, max_ticks, grid_size=1, checksums=None):
+    simulation = Simulation(track, sponsor_name, grid_size)
+    game_info = simulation.game_info
+    controller.reset()
+
+    levels = []
+    outcome = None
+    checksum = 0
+    for tick in range(max_ticks):
+        if not game_info.started:
+            game_info.start_level()
+
+        level_ticks = game_info.level_ticks + 1
+        event = simulation.step(controller(simulation.player_car))
+        if checksums is not None:
+            checksum = simulation.checksum(checksum)
+            checksums.append(checksum)
+
+        if event in (LEVEL_COMPLETE, GAME_WON):
+            levels.append(level_ticks)
+            controller.reset()
+        if event in (LOST, GAME_WON):
+            outcome = event
+            break
+
+    result = {"outcome": outcome or "timeout", "ticks": tick + 1,
+              "levels_completed": len(levels), "level_times": [round(ticks / PHYSICS_HZ, 2) for ticks in levels]}
+    if checksums is not None:
+        result["checksum"] = f"{checksum:08x}"
+    return result
+
+
+# Run many races and summarize the results; with `checksums` (a list), one list of per-tick checksums per race
+def run_races(races, track, sponsor_name="red_bull.png", controller=None, max_ticks=400000, grid_size=1,
+              checksums=None):
+    controller = controller or AutoPilot(track)
+
+    results = []
+    start = time.perf_counter()
+    for _ in range(races):
+        race_checksums = [] if checksums is not None else None
+        results.append(run_race(track, sponsor_name, controller, max_ticks, grid_size, race_checksums))
+        if checksums is not None:
+            checksums.append(race_checksums)
+    elapsed = time.perf_counter() - start
+
+    total_ticks = sum(result["ticks"] for result in results)
+    level_reached = [0] * (GameInfo.LEVELS + 1)
+    for result in results:
+        level_reached[result["levels_completed"]] += 1
+
+    return {
+        "races": races,
+        "ticks": total_ticks,
+        "seconds": round(elapsed, 3),
+        "ticks_per_second": round(total_ticks / elapsed) if elapsed else 0,
+        "outcomes": {outcome: sum(result["outcome"] == outcome for result in results)
+                     for outcome in (GAME_WON, LOST, "timeout")},
+        "levels_completed": {level: count for level, count in enumerate(level_reached) if count},
+        "results": results,
+    }
+
+
+# Split every segment of a closed path into pieces no longer than `spacing`
+def subdivide(path, spacing):
+    points = np.array(path, dtype=np.float64)
+    ends = np.roll(points, -1, axis=0)
+    return np.vstack([np.linspace(start, end, max(1, int(np.ceil(np.hypot(*(end - start)) / spacing))), endpoint=False)
+                      for start, end in zip(points, ends)])
+
+
+# Drive one car along the sectors' path at `step` pixels per tick, from just past the finish line round to
+# it again, with its progress tracked as Simulation tracks it: allowed to drive `max_step` per tick. Returns
+# the ticks it took RaceProgress to count the lap, or None if it never did.
+def lap_ticks(sectors, step, max_step):
+    progress = RaceProgress(sectors, 1, max_step)
+    ends = np.roll(sectors.checkpoints, -1, axis=0)
+
+    def position(distance):
+        distance %= sectors.lap_length
+        sector = np.searchsorted(sectors.sector_start, distance, side="right") - 1
+        t = (distance - sectors.sector_start[sector]) / (sectors.sector_end[sector] - sectors.sector_start[sector])
+        x, y = sectors.checkpoints[sector] + (ends[sector] - sectors.checkpoints[sector]) * t
+        return np.array([x]), np.array([y])
+
+    progress.reset(*position(sectors.sector_end[0] / 2))
+    for tick in range(1, int(sectors.lap_length / step) + 2):
+        if progress.update(*position(sectors.sector_end[0] / 2 + tick * step), tick):
+            return tick
+    return None
+
+
+# Check lap counting at every common resolution, with the player cars' top speed as the farthest a car
+# drives in a tick, like Simulation:
+#  - a lap at top speed counts on the track's sectors;
+#  - it also counts on sectors a third of a tick's drive long, skipped three at a time (smallest
+#    resolution only, as the lookup grid of so many sectors takes a few seconds to build);
+#  - a car jumping three of the longest sectors every tick is taking shortcuts, and its lap is rejected.
+# Returns the number of cases that did not go as expected.
+def lap_check(track_name, sponsor_name="red_bull.png"):
+    failures = 0
+    for width, height in COMMON_RESOLUTIONS:
+        track = Track(width, height, track_name)
+        max_step = Simulation(track, sponsor_name).player_car.max_vel * TICK_SCALE
+        cases = [("top speed", track.sectors, max_step, True)]
+        if (width, height) == COMMON_RESOLUTIONS[0]:
+            finish = (track.finish_pos[0] + track.finish.get_width() / 2,
+                      track.finish_pos[1] + track.finish.get_height() / 2)
+            dense = SectorMap(subdivide(track.path, max_step / 3), finish, width, height, width / track.reference_width)
+            cases.append(("top speed, short sectors", dense, max_step, True))
+        shortcut = 3 * float((track.sectors.sector_end - track.sectors.sector_start).max())
+        cases.append(("shortcut", track.sectors, shortcut, False))
+
+        for name, sectors, step, counts in cases:
+            ticks = lap_ticks(sectors, step, max_step)
+            failures += (ticks is not None) != counts
+            result = f"lap in {ticks} ticks" if ticks is not None else "lap not counted"
+            expected = "" if (ticks is not None) == counts else " (UNEXPECTED)"
+            print(f"{track_name} {width}x{height}, {name} ({sectors.count} sectors, {step:.1f} px/tick): "
+                  f"{result}{expected}")
+    return failures
+
+
+# Print a human readable summary of a report
+def print_report(report):
+    print(f"{report['races']} races, {report['ticks']} physics ticks in {report['seconds']}s "
+          f"({report['ticks_per_second']} ticks/s, {report['ticks_per_second'] / PHYSICS_HZ:.0f}x real time)")
+    print("Outcomes: " + ", ".join(f"{name} {count}" for name, count in report["outcomes"].items()))
+    print("Levels completed: " + ", ".join(f"{level}: {count}" for level, count in report["levels_completed"].items()))
+    for i, result in enumerate(report["results"]):
+        checksum = f", checksum {result['checksum']}" if "checksum" in result else ""
+        print(f"  race {i + 1}: {result['outcome']} after {result['levels_completed']} levels, "
+              f"level times {result['level_times']}{checksum}")
+
+
+# Write per-tick checksums as little-endian uint32s
+def save_checksums(path, checksums):
+    with open(path, "wb") as f:
+        f.write(struct.pack(f"<{len(checksums)}I", *checksums))
+
+
+def load_checksums(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    return list(struct.unpack(f"<{len(data) // 4}I", data[:len(data) // 4 * 4]))
+
+
+# First tick (counting from 1) where two runs' checksums differ, or None if they match
+def first_divergence(expected, actual):
+    for tick, (a, b) in enumerate(zip(expected, actual), 1):
+        if a != b:
+            return tick
+    if len(expected) != len(actual):
+        return min(len(expected), len(actual)) + 1
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run races headless and report the results.")
+    parser.add_argument("--races", type=int, default=1, help="number of races to run")
+    parser.add_argument("--width", type=int, default=1920, help="simulated screen width")
+    parser.add_argument("--height", type=int, default=1080, help="simulated screen height")
+    parser.add_argument("--sponsor", default="red_bull.png", help="player car image in imgs/cars")
+    parser.add_argument("--track", default=DEFAULT_TRACK, help="track in tracks/")
+    parser.add_argument("--grid-size", type=int, default=1, help="number of computer-controlled opponents")
+    parser.add_argument("--cruise-vel", type=float, default=5, help="autopilot speed on straights")
+    parser.add_argument("--max-ticks", type=int, default=400000, help="physics tick limit per race")
+    parser.add_argument("--script", help="drive with a JSON key script instead of the autopilot")
+    parser.add_argument("--replay", help="drive with the controls recorded in a replay, on its track, resolution and car")
+    parser.add_argument("--checksum", action="store_true", help="checksum the state after every tick")
+    parser.add_argument("--save-checksums", help="write the first race's per-tick checksums to this file")
+    parser.add_argument("--verify", help="compare the first race's per-tick checksums with this file")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--lap-check", action="store_true",
+                        help="check that laps count at top speed at every common resolution, instead of racing")
+    args = parser.parse_args(argv)
+
+    if args.lap_check:
+        return 1 if lap_check(args.track, args.sponsor) else 0
+
+    sponsor, width, height, track_name = args.sponsor, args.width, args.height, args.track
+    if args.replay:
+        replay = Replay(args.replay)
+        sponsor, width, height, track_name = replay.sponsor, replay.width, replay.height, replay.track
+        controller = ReplayInput(replay)
+    track = Track(width, height, track_name)
+    if args.script:
+        controller = ScriptedInput.from_file(args.script)
+    elif not args.replay:
+        controller = AutoPilot(track, cruise_vel=args.cruise_vel)
+
+    checksums = [] if args.checksum or args.save_checksums or args.verify else None
+    report = run_races(args.races, track, sponsor, controller, args.max_ticks, args.grid_size, checksums)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    if args.save_checksums:
+        save_checksums(args.save_checksums, checksums[0])
+    if args.verify:
+        tick = first_divergence(load_checksums(args.verify), checksums[0])
+        if tick is not None:
+            print(f"Diverged from {args.verify} at tick {tick}")
+            return 1
+        print(f"Matches {args.verify}: {len(checksums[0])} ticks")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
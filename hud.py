@@ -0,0 +1,121 @@
+# Cached text rendering for the HUD and overlay messages
+from collections import OrderedDict
+import pygame
+
+WHITE = (255, 255, 255)
+
+# Characters a DigitAtlas can compose without rasterizing
+DIGITS = "0123456789.-/"
+
+
+# Define a class that keeps rendered text surfaces, keyed by font, string and colour
+class TextCache:
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.surfaces = OrderedDict()
+
+    # Get the rendered surface for `text`, rasterizing it only the first time it is asked for
+    def render(self, font, text, color, antialias=True):
+        key = (font, text, color, antialias)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = font.render(text, antialias, color)
+            self.surfaces[key] = surface
+            if len(self.surfaces) > self.max_entries:
+                self.surfaces.popitem(last=False)  # Drop the least recently used string
+        else:
+            self.surfaces.move_to_end(key)
+        return surface
+
+
+# Shared by the HUD and the centred overlay messages
+TEXT_CACHE = TextCache()
+
+
+# Blit `surface` at `pos` on the transparent `target`, keeping the larger value of every channel. Alpha
+# blending would darken glyph edges against the transparent black; the maximum keeps their own alpha and
+# colour, and glyphs that overlap where their advance is narrower than them do not cut into each other.
+def _copy_onto(target, surface, pos):
+    target.blit(surface, pos, special_flags=pygame.BLEND_RGBA_MAX)
+
+
+# Define a class holding one pre-rendered glyph per digit, to compose numbers without the font
+class DigitAtlas:
+    def __init__(self, font, color):
+        self.height = font.get_height()
+        self.glyphs = {char: (font.render(char, True, color), font.metrics(char)[0][4]) for char in DIGITS}
+
+    # Check whether every character of `text` has a glyph
+    def can_render(self, text):
+        return all(char in self.glyphs for char in text)
+
+    # Width of `text` when composed from glyph advances
+    def width(self, text):
+        return sum(self.glyphs[char][1] for char in text)
+
+    # Blit the glyphs of `text` onto `target` starting at `pos`
+    def compose(self, target, text, pos):
+        x, y = pos
+        for char in text:
+            glyph, advance = self.glyphs[char]
+            _copy_onto(target, glyph, (x, y))
+            x += advance
+
+
+# Define a class for one HUD string such as "Time: 12s" that re-renders only when its value changes
+class HudField:
+    def __init__(self, font, prefix, suffix="", color=WHITE, atlas=None):
+        self.font = font
+        self.prefix = prefix
+        self.suffix = suffix
+        self.color = color
+        self.atlas = atlas or DigitAtlas(font, color)
+        self.value = None
+        self.surface = None
+
+    # Get the surface showing `value`, composing a new one only if the displayed text changed
+    def render(self, value):
+        if self.surface is not None and value == self.value:
+            return self.surface
+        self.value = value
+
+        number = str(value)
+        if not self.atlas.can_render(number):
+            self.surface = TEXT_CACHE.render(self.font, self.prefix + number + self.suffix, self.color)
+            return self.surface
+
+        # Prefix and suffix come from the text cache, the number from the digit atlas
+        prefix = TEXT_CACHE.render(self.font, self.prefix, self.color)
+        suffix = TEXT_CACHE.render(self.font, self.suffix, self.color)
+        number_width = self.atlas.width(number)
+        height = max(prefix.get_height(), suffix.get_height(), self.atlas.height)
+
+        surface = pygame.Surface((prefix.get_width() + number_width + suffix.get_width(), height), pygame.SRCALPHA)
+        _copy_onto(surface, prefix, (0, 0))
+        self.atlas.compose(surface, number, (prefix.get_width(), 0))
+        _copy_onto(surface, suffix, (prefix.get_width() + number_width, 0))
+        self.surface = surface
+        return surface
+
+
+# Define a class for the race HUD: level and time along the top, speed and race position in the bottom corners
+class RaceHud:
+    def __init__(self, font):
+        self.font = font
+        digits = DigitAtlas(font, WHITE)
+        self.level_field = HudField(font, "Level ", atlas=digits)
+        self.time_field = HudField(font, "Time: ", "s", atlas=digits)
+        self.vel_field = HudField(font, "Vel: ", "px/s", atlas=digits)
+        self.position_field = HudField(font, "Pos: ", atlas=digits)
+
+    # Draw the game information texts and return the rects they cover
+    def draw(self, win, game_info, player_car):
+        level_text = self.level_field.render(game_info.level)
+        time_text = self.time_field.render(game_info.get_level_time())
+        vel_text = self.vel_field.render(round(player_car.vel, 1))
+        position_text = self.position_field.render(f"{game_info.position}/{game_info.cars}")
+        return [win.blit(level_text, (10, 10)),
+                win.blit(time_text, (win.get_width() - time_text.get_width() - 10, 10)),
+                win.blit(vel_text, (10, win.get_height() - vel_text.get_height() - 10)),
+                win.blit(position_text, (win.get_width() - position_text.get_width() - 10,
+                                         win.get_height() - position_text.get_height() - 10))]
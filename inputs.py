@@ -0,0 +1,82 @@
+# Sources of the player's controls and of the frame clock. The game loop takes any of them, so a race
+# can be driven by the keyboard, a script or a recorded replay, on real or simulated time.
+import json  # JSON key scripts
+import time  # Time module for the real clock
+import pygame  # Pygame library for the keyboard
+from simulation import Controls
+
+
+# Define a class reading the controls from the keyboard (W, A, S, D)
+class KeyboardInput:
+    def reset(self):
+        pass
+
+    # Choose the controls for the next physics tick
+    def __call__(self, car):
+        keys = pygame.key.get_pressed()
+        return Controls(left=keys[pygame.K_a], right=keys[pygame.K_d],
+                        forward=keys[pygame.K_w], backward=keys[pygame.K_s])
+
+
+# Define a class that plays a fixed sequence of (tick_count, Controls) segments, then coasts
+class ScriptedInput:
+    def __init__(self, segments):
+        self.segments = segments
+        self.reset()
+
+    # Load segments from a JSON list of [tick_count, "keys"] pairs, e.g. [[240, "w"], [30, "wa"], [60, ""]]
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            segments = json.load(f)
+        return cls([(count, Controls(left="a" in keys, right="d" in keys, forward="w" in keys, backward="s" in keys))
+                    for count, keys in segments])
+
+    # Start again from the first segment
+    def reset(self):
+        self.ticks = [controls for count, controls in self.segments for _ in range(count)]
+        self.tick = 0
+
+    # Choose the controls for the next physics tick
+    def __call__(self, car):
+        if self.tick >= len(self.ticks):
+            return Controls()
+        controls = self.ticks[self.tick]
+        self.tick += 1
+        return controls
+
+
+# Define a class that replays the controls of every tick of a Replay, then coasts
+class ReplayInput:
+    def __init__(self, replay):
+        self.replay = replay
+        self.tick = 0
+
+    # A replay covers the whole race, so a new level does not start it again
+    def reset(self):
+        pass
+
+    # Choose the controls for the next physics tick
+    def __call__(self, car):
+        if self.tick >= len(self.replay):
+            return Controls()
+        controls = self.replay[self.tick].controls
+        self.tick += 1
+        return controls
+
+
+# The real clock: seconds from perf_counter
+def real_clock():
+    return time.perf_counter()
+
+
+# Define a clock that moves on by exactly `step` seconds every time it is read, so a game loop reading
+# it once per frame runs the same number of physics ticks every frame on every machine
+class FixedClock:
+    def __init__(self, step, start=0.0):
+        self.step = step
+        self.time = start
+
+    def __call__(self):
+        self.time += self.step
+        return self.time
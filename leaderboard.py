@@ -0,0 +1,215 @@
+# Persistent leaderboard of level times in SQLite, keyed by track, level, username and car.
+# The game queues times and a background thread writes them in batches, one transaction per batch, so
+# the game loop never waits for the disk. Top-N reads go through an index and include queued times.
+#
+#   python leaderboard.py                        # best times of every level of the default track
+#   python leaderboard.py --track classic --level 3 --top 10
+#   python leaderboard.py --bench                # time the results screen's queries
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from simulation import PHYSICS_HZ  # Times are stored in physics ticks
+from trackbundle import DEFAULT_TRACK
+
+LEADERBOARD_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "leaderboard.db")
+
+FLUSH_INTERVAL = 0.5  # Seconds the writer gathers times after the first one before it writes them
+TOP_COUNT = 5  # Times shown on the results screen
+
+# One row per driver and car on each level of each track, holding the best time. The rank index covers
+# the top-N query: WITHOUT ROWID tables keep the primary key in every index, so the username and car
+# come from the index too.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS best_times (
+    track TEXT NOT NULL,
+    level INTEGER NOT NULL,
+    username TEXT NOT NULL,
+    sponsor TEXT NOT NULL,
+    ticks INTEGER NOT NULL,
+    laps INTEGER NOT NULL,
+    recorded REAL NOT NULL,
+    PRIMARY KEY (track, level, username, sponsor)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS best_times_rank ON best_times (track, level, ticks);
+"""
+
+# Keep the faster of the stored and the new time and count every lap
+UPSERT = """
+INSERT INTO best_times (track, level, username, sponsor, ticks, laps, recorded) VALUES (?, ?, ?, ?, ?, 1, ?)
+ON CONFLICT (track, level, username, sponsor) DO UPDATE SET
+    laps = laps + 1,
+    recorded = CASE WHEN excluded.ticks < ticks THEN excluded.recorded ELSE recorded END,
+    ticks = min(ticks, excluded.ticks)
+"""
+TOP = "SELECT username, sponsor, ticks FROM best_times WHERE track = ? AND level = ? ORDER BY ticks LIMIT ?"
+BEST = "SELECT ticks FROM best_times WHERE track = ? AND level = ? AND username = ? AND sponsor = ?"
+LEVELS = "SELECT DISTINCT level FROM best_times WHERE track = ? ORDER BY level"
+
+# One line of the leaderboard
+LeaderboardEntry = namedtuple("LeaderboardEntry", ["username", "sponsor", "ticks"])
+
+
+# Open the database, creating the table and index on first use
+def connect(path):
+    connection = sqlite3.connect(path, timeout=5)
+    connection.execute("PRAGMA journal_mode = WAL")  # Readers never wait for the writer
+    connection.execute("PRAGMA synchronous = NORMAL")  # A crash may lose the last batch, never corrupt the file
+    connection.executescript(SCHEMA)
+    return connection
+
+
+# Define a class queueing level times for a writer thread and answering top-N queries from any thread
+class Leaderboard:
+    def __init__(self, path=LEADERBOARD_PATH, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.pending = []  # Rows queued but not committed yet, oldest first
+        self.condition = threading.Condition()
+        self.urgent = False  # Set by wait() to write the queued rows without gathering more
+        self.thread = None
+        self.writable = True  # Cleared when the database cannot be opened; times are then only kept in memory
+        self.local = threading.local()  # One reading connection per thread
+        self.batches = 0
+        self.errors = 0
+
+    # Queue a level time, starting the writer thread on first use
+    def submit(self, username, sponsor, track, level, ticks):
+        with self.condition:
+            self.pending.append((track, level, username, sponsor, ticks, time.time()))
+            self.condition.notify_all()
+            if self.writable and (self.thread is None or not self.thread.is_alive()):
+                self.thread = threading.Thread(target=self._run, name="leaderboard-writer", daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        try:
+            connection = connect(self.path)
+        except sqlite3.Error:
+            # A read-only directory or a bad path only costs the times of this session their persistence
+            with self.condition:
+                self.writable = False
+                self.condition.notify_all()
+            return
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending)
+                self.condition.wait_for(lambda: self.urgent, self.flush_interval)  # Gather a batch
+                batch = list(self.pending)
+            try:
+                with connection:  # One transaction for the whole batch
+                    connection.executemany(UPSERT, batch)
+            except sqlite3.Error:
+                self.errors += 1  # A locked or full disk only costs these times
+            # Rows leave the queue only once committed, so a reader always finds them in one or the other
+            with self.condition:
+                del self.pending[:len(batch)]
+                self.batches += 1
+                if not self.pending:
+                    self.urgent = False
+                self.condition.notify_all()
+
+    # Block until every queued time is written, e.g. before the game exits, or the database turns out to be
+    # unwritable
+    def wait(self, timeout=None):
+        with self.condition:
+            if not self.pending or not self.writable:
+                return
+            self.urgent = True
+            self.condition.notify_all()
+            self.condition.wait_for(lambda: not self.pending or not self.writable, timeout)
+
+    def reader(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = self.local.connection = connect(self.path)
+        return connection
+
+    # Rows of `query`, or none if the database cannot be read
+    def _read(self, query, parameters):
+        try:
+            return self.reader().execute(query, parameters).fetchall()
+        except sqlite3.Error:
+            return []
+
+    # Queued rows of a level; read before the database, see _run
+    def _queued(self, track, level):
+        with self.condition:
+            return [row for row in self.pending if row[0] == track and row[1] == level]
+
+    # The `count` fastest drivers and cars of a level, fastest first
+    def top(self, track, level, count=TOP_COUNT):
+        queued = self._queued(track, level)
+        rows = self._read(TOP, (track, level, count + len(queued)))
+        best = {}
+        for username, sponsor, ticks in rows + [row[2:5] for row in queued]:
+            key = (username, sponsor)
+            best[key] = min(ticks, best.get(key, ticks))
+        entries = [LeaderboardEntry(username, sponsor, ticks) for (username, sponsor), ticks in best.items()]
+        return sorted(entries, key=lambda entry: entry.ticks)[:count]
+
+    # Best time of a driver and car on a level, in ticks, or None
+    def best(self, username, sponsor, track, level):
+        times = [row[4] for row in self._queued(track, level) if row[2] == username and row[3] == sponsor]
+        times += [ticks for ticks, in self._read(BEST, (track, level, username, sponsor))]
+        return min(times) if times else None
+
+    # Levels of a track with at least one time
+    def levels(self, track):
+        return [level for level, in self._read(LEVELS, (track,))]
+
+
+# Shared by every race of the game
+LEADERBOARD = Leaderboard()
+
+
+# Time `runs` results screens' worth of queries against a copy of the leaderboard filled with `drivers`
+# drivers on every level, and return the mean microseconds per top-N and personal best query
+def benchmark(path, drivers=10000, runs=1000):
+    leaderboard = Leaderboard(path, flush_interval=0)
+    for level in range(1, 11):
+        for driver in range(drivers):
+            leaderboard.submit(f"driver{driver}", "red_bull.png", DEFAULT_TRACK, level, 1000 + (driver * 7919) % 5000)
+    leaderboard.wait()
+
+    start = time.perf_counter()
+    for run in range(runs):
+        leaderboard.top(DEFAULT_TRACK, run % 10 + 1)
+    top_time = (time.perf_counter() - start) / runs
+    start = time.perf_counter()
+    for run in range(runs):
+        leaderboard.best(f"driver{run}", "red_bull.png", DEFAULT_TRACK, run % 10 + 1)
+    best_time = (time.perf_counter() - start) / runs
+    return top_time * 1e6, best_time * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show the best level times.")
+    parser.add_argument("--track", default=DEFAULT_TRACK, help="track in tracks/")
+    parser.add_argument("--level", type=int, help="only this level")
+    parser.add_argument("--top", type=int, default=10, help="times per level")
+    parser.add_argument("--bench", action="store_true", help="time the queries on a scratch database")
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        path = os.path.join(os.path.dirname(LEADERBOARD_PATH), f"leaderboard-bench-{os.getpid()}.db")
+        try:
+            top_us, best_us = benchmark(path)
+        finally:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+        print(f"top {TOP_COUNT}: {top_us:.1f} us, personal best: {best_us:.1f} us (10 levels of 10000 drivers)")
+        return
+
+    for level in [args.level] if args.level else LEADERBOARD.levels(args.track):
+        print(f"Level {level}:")
+        for place, entry in enumerate(LEADERBOARD.top(args.track, level, args.top), 1):
+            print(f"  {place:>2}. {entry.username:<16} {os.path.splitext(entry.sponsor)[0]:<12} "
+                  f"{entry.ticks / PHYSICS_HZ:7.2f} s")
+
+
+if __name__ == "__main__":
+    main()
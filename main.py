@@ -1,388 +1,421 @@
 # Import the necessary libraries and utilities
 import pygame  # Pygame library for game development
-import time  # Time module for time-related functions
+import os  # OS module to list the car images
+import time  # Time module for the replay clock
 import math  # Math module for mathematical operations
-from utils import scale_image, blit_rotate_center, blit_text_center  # Utility functions
+from utils import blit_text_center, blit_lines_center  # Utility functions
+from render import StaticBackground, DirtyRectRenderer  # Pre-composited track layers and partial updates
+from hud import RaceHud  # Cached HUD text
+from assets import BackgroundLoader  # Lazy, background-threaded asset building
+from replay import Recorder, Replay, BestLaps, GhostCar  # Replay files and best-lap ghosts
+from profiler import PROFILER  # Per-frame phase timings, shown with F3
+from inputs import KeyboardInput, real_clock  # Default control and time sources
+from scenes import Scene, SceneManager  # One frame loop for every screen
+from trackbundle import DEFAULT_TRACK  # Circuit raced unless another one is chosen
+from leaderboard import LEADERBOARD, TOP_COUNT  # Best level times of every player
+from simulation import (Track, Simulation, PHYSICS_HZ, TICK_SCALE, LOST, LEVEL_COMPLETE, GAME_WON,  # Display-independent game state
+                        load_car_image, CARS_DIR, NPC_CAR_IMAGE, NPC_CAR_SCALE, PLAYER_CAR_SCALE)
 
 # Initialize pygame
 pygame.init()
 
-# Set the window to fullscreen
-WIN = pygame.display.set_mode((0,0), pygame.FULLSCREEN)
+# Define the FPS
+FPS = 60
 
-# Get the width and height of the window
-WIDTH, HEIGHT = WIN.get_width(), WIN.get_height()
+# Length of one physics tick, and the most frame time the physics will try to catch up on
+TICK_TIME = 1 / PHYSICS_HZ
+MAX_FRAME_TIME = 0.25
 
-# Load the track image
-TRACK = pygame.image.load("imgs/track3.png")
+# Repaint and flip only the regions that changed instead of the whole window
+DIRTY_RECTS = True
 
-# Load and scale the grass image
-GRASS = scale_image(pygame.image.load("imgs/grass3.jpg"), 3.5)
+# Record every race to replays/ and show a ghost of the best lap of each level
+RECORD_REPLAYS = True
+SHOW_GHOST = True
 
-# Load and scale the track border image
-TRACK_BORDER = scale_image(pygame.image.load("imgs/border2.png"), (WIDTH / TRACK.get_width()) * 0.8)
+# Seconds counted down before each level, and seconds the result of a game is shown
+COUNTDOWN_SECONDS = 3
+RESULT_SECONDS = 5
 
-# Create a mask from the track border image
-TRACK_BORDER_MASK = pygame.mask.from_surface(TRACK_BORDER)
+# Share of one CPU core the game tries to stay under by lowering the frame rate (e.g. 0.5), or None
+CPU_TARGET = None
 
-# Scale the track image
-TRACK = scale_image(TRACK, (WIDTH / TRACK.get_width()) * 0.8)
+# Seconds a replay jumps per press of the left or right arrow key
+REPLAY_SEEK_TIME = 5
 
-# Load the finish line image
-FINISH = pygame.image.load("imgs/finish.png")
+# Track and car images are decoded and scaled on demand, or ahead of time on a background thread
+ASSET_LOADER = BackgroundLoader()
 
-# Create a mask from the finish line image
-FINISH_MASK = pygame.mask.from_surface(FINISH)
+# Register the race assets for a window size and start building them in the background
+def preload(width, height, track=DEFAULT_TRACK):
+    ASSET_LOADER.register(("track", track, width, height), lambda: Track(width, height, track))
+    ASSET_LOADER.register(("car", NPC_CAR_IMAGE), lambda: load_car_image(NPC_CAR_IMAGE, NPC_CAR_SCALE))
+    for filename in sorted(os.listdir(CARS_DIR)):
+        ASSET_LOADER.register(("car", filename), lambda filename=filename: load_car_image(filename, PLAYER_CAR_SCALE))
+    ASSET_LOADER.start()
 
-# Load and scale the player car image
-PLAYER_CAR = scale_image(pygame.image.load("imgs/cars/red_bull.png"), 0.7)
+# Function to draw the game elements, with cars `alpha` of the way between the last two physics ticks
+# (rivals are the cars of other players in an online race)
+def draw(win, renderer, hud, player_car, computer_car, game_info, fleet=None, alpha=1.0, ghost=None, rivals=()):
+    # Restore the pre-composited track images (all of them, or only where things were drawn last frame)
+    renderer.begin(win)
 
-# Load and scale the NPC car image
-NPC_CAR = scale_image(pygame.image.load("imgs/cars/mclaren.png"), 0.8)
+    # Draw the game information texts
+    rects = hud.draw(win, game_info, player_car)
 
-# Calculate the positions to center the images
-grass_x = (WIDTH - GRASS.get_width()) / 2
-grass_y = (HEIGHT - GRASS.get_height()) / 2
+    #WIN.blit(TRACK_BORDER_MASK.to_surface(), (track_border_x, track_border_y))
+    #WIN.blit(FINISH_MASK.to_surface(), FINISH_POSITION)
 
-track_x = (WIDTH - TRACK.get_width()) / 2
-track_y = (HEIGHT - TRACK.get_height()) / 2
+    if fleet is not None:
+        rects.extend(fleet.draw(win, alpha))
+    if ghost is not None:
+        ghost_rect = ghost.draw(win, game_info.level_ticks, alpha)
+        if ghost_rect is not None:
+            rects.append(ghost_rect)
+    for car in rivals:
+        rects.append(car.draw(win, alpha))
+    rects.append(player_car.draw(win, alpha))
+    rects.append(computer_car.draw(win, alpha))
+
+    overlay_rect = PROFILER.draw(win)
+    if overlay_rect is not None:
+        rects.append(overlay_rect)
+    PROFILER.mark("draw")
+
+    renderer.end(rects)
+    PROFILER.mark("display_update")
+
+# Define a class holding what a race needs across its scenes: the window, track, simulation, replay
+# recorder, ghost and the player's controls. `back` makes the scene to return to when the race is
+# left (None to quit).
+class RaceSession:
+    def __init__(self, win, username, sponsor_name, grid_size=1, profile=False, controller=None, back=None, fps=FPS,
+                 track=DEFAULT_TRACK):
+        self.win = win
+        self.fps = fps
+        self.font = pygame.font.SysFont("comicsans", 44)
+        self.small_font = pygame.font.SysFont("comicsans", 32)
+        self.hud = RaceHud(self.font)
+        self.back = back
+        self.username = username
+        self.sponsor_name = sponsor_name
+
+        # Wait only for the assets the background loader has not finished yet
+        preload(*win.get_size(), track)
+        self.track = ASSET_LOADER.get(("track", track, *win.get_size()))
+
+        # Composite the static images with their calculated positions once
+        self.background = StaticBackground(self.track.images())
+        self.background.build(win)
+        self.renderer = DirtyRectRenderer(self.background, DIRTY_RECTS)
+
+        self.simulation = Simulation(self.track, sponsor_name, grid_size)
+        self.game_info = self.simulation.game_info
+
+        # Record the race, and race against the best lap of each level
+        self.best_laps = BestLaps(track=track)
+        self.recorder = Recorder(self.simulation, username, sponsor_name, best_laps=self.best_laps) if RECORD_REPLAYS else None
+        self.ghost = GhostCar(self.simulation.player_car.img, self.track.width) if SHOW_GHOST else None
+
+        self.controller = controller or KeyboardInput()
+        self.controller.reset()
+        self.accumulator = 0  # Real time not yet simulated
+        self.closed = False
+        PROFILER.enable(profile)
+
+    # Draw the race with the cars `alpha` of the way between the last two physics ticks
+    def draw(self, alpha=1.0):
+        simulation = self.simulation
+        draw(self.win, self.renderer, self.hud, simulation.player_car, simulation.computer_car, self.game_info,
+             simulation.fleet, alpha, self.ghost)
+
+    # Draw a message over the race, flipping only its rect
+    def message(self, text):
+        self.renderer.overlay(blit_text_center(self.win, self.font, text))
+
+    # Scene to go to when the race is left
+    def leave(self):
+        self.close()
+        return self.back() if self.back is not None else None
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.recorder is not None:
+            self.recorder.close(wait=True)
+        LEADERBOARD.wait()
+        if PROFILER.count:
+            print("Frame profile written to %s and %s" % PROFILER.export())
+        PROFILER.enable(False)
+
+# Scene waiting for a key before a level, then counting down COUNTDOWN_SECONDS before it starts.
+# `remaining` starts the countdown straight away, e.g. after a key already closed the level results.
+class CountdownScene(Scene):
+    def __init__(self, manager, session, remaining=None):
+        super().__init__(manager)
+        self.session = session
+        self.fps = session.fps
+        self.remaining = remaining  # Seconds to the start, once a key was pressed
+
+    # Nothing moves until a key is pressed
+    @property
+    def static(self):
+        return self.remaining is None
+
+    def enter(self):
+        session = self.session
+        if session.ghost is not None:
+            session.ghost.set_lap(session.best_laps.ghost(session.game_info.level))
+        session.renderer.invalidate()
+
+    def handle_event(self, event):
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_ESCAPE:
+                leave_race(self.manager, self.session)
+            elif self.remaining is None:
+                self.remaining = COUNTDOWN_SECONDS
+
+    def update(self, dt):
+        if self.remaining is None:
+            return
+        self.remaining -= dt
+        if self.remaining <= 0:
+            self.session.game_info.start_level()
+            self.manager.switch(RacingScene(self.manager, self.session))
+
+    def draw(self):
+        self.session.draw()
+        if self.remaining is None:
+            self.session.message(f"Press any key to start level {self.session.game_info.level}!")
+        else:
+            self.session.message(str(math.ceil(self.remaining)))
+
+# Scene running the fixed physics ticks the frame time covers, and drawing the race between them
+class RacingScene(Scene):
+    def __init__(self, manager, session):
+        super().__init__(manager)
+        self.session = session
+        self.fps = session.fps
+
+    def enter(self):
+        self.session.accumulator = 0
+        self.session.renderer.invalidate()  # Clear the overlay text
+
+    def handle_event(self, event):
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_F3:
+                PROFILER.toggle_overlay()
+            elif event.key == pygame.K_p:
+                self.manager.switch(PauseScene(self.manager, self.session))
+            elif event.key == pygame.K_ESCAPE:
+                leave_race(self.manager, self.session)
+        elif event.type == pygame.WINDOWFOCUSLOST:
+            # The keys are released with the focus, so stop the race rather than drive on blind
+            self.manager.switch(PauseScene(self.manager, self.session))
+
+    def update(self, dt):
+        session = self.session
+        simulation = session.simulation
+        session.accumulator += min(dt, MAX_FRAME_TIME)
+        while session.accumulator >= TICK_TIME:
+            session.accumulator -= TICK_TIME
+            controls = session.controller(simulation.player_car)
+            # The level and its time as they stand after this tick; finishing the game resets them
+            level, level_ticks = simulation.game_info.level, simulation.game_info.level_ticks + 1
+            outcome = simulation.step(controls)
+            if session.recorder is not None:
+                session.recorder.record(controls, outcome)
+
+            if outcome is not None:
+                session.controller.reset()
+                session.accumulator = 0
+                if outcome in (LEVEL_COMPLETE, GAME_WON):
+                    LEADERBOARD.submit(session.username, session.sponsor_name, session.track.name, level, level_ticks)
+                    self.manager.switch(LevelResultScene(self.manager, session, level, level_ticks, outcome))
+                elif outcome == LOST:
+                    self.manager.switch(ResultScene(self.manager, session, outcome))
+                else:
+                    self.manager.switch(CountdownScene(self.manager, session))
+                break
 
-track_border_pos = ((WIDTH - TRACK_BORDER.get_width()) / 2, (HEIGHT - TRACK_BORDER.get_height()) / 2)
+    def draw(self):
+        self.session.draw(self.session.accumulator / TICK_TIME)
 
-FINISH_POSITION = (WIDTH * 0.6, HEIGHT * 0.86)
+# Scene holding the race still until P is pressed again; the window is only redrawn on events
+class PauseScene(Scene):
+    static = True
 
-# Set the window caption
-pygame.display.set_caption("Racing Game!")
+    def __init__(self, manager, session):
+        super().__init__(manager)
+        self.session = session
 
-# Define the main font and FPS
-MAIN_FONT = pygame.font.SysFont("comicsans", 44)
-FPS = 60
+    def enter(self):
+        self.session.renderer.invalidate()
 
-# Define the path points for the game track
-PATH = [(794, 983), (314, 895), (229, 543), (279, 310), (358, 238), (610, 348), (704, 89), (883, 134), 
-        (1120, 271), (1643, 284), (1645, 386), (1290, 510), (1153, 435), (1007, 502), (894, 394), (804, 360), 
-        (686, 500), (457, 471), (420, 660), (490, 807), (730, 850), (1257, 823), (1500, 606), (1598, 643), (1668, 735), 
-        (1670, 858), (1562, 974), (1374, 988), (979, 988)]
+    def handle_event(self, event):
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_p:
+                self.manager.switch(RacingScene(self.manager, self.session))
+            elif event.key == pygame.K_ESCAPE:
+                leave_race(self.manager, self.session)
 
-# Calculate scaling factors
-original_width, original_height = 1920, 1080  # Original width and height of the screen
-width_scale_factor = WIDTH / original_width
-height_scale_factor = HEIGHT / original_height
+    def draw(self):
+        self.session.draw()
+        self.session.message("Paused, press P to continue")
 
-# Scale the path coordinates
-scaled_path = [(int(point[0] * width_scale_factor), int(point[1] * height_scale_factor)) for point in PATH]
+# Scene showing the player's time on a finished level next to the best TOP_COUNT times of the level, until
+# a key starts the countdown to the next level (or shows that the game is won)
+class LevelResultScene(Scene):
+    static = True
 
-# Define a class to store game information
-class GameInfo:
-    LEVELS = 10  # Number of levels in the game
-    def __init__(self, level=1):
+    def __init__(self, manager, session, level, ticks, outcome):
+        super().__init__(manager)
+        self.session = session
         self.level = level
-        self.started = False
-        self.level_start_time = 0
-
-    # Move to the next level
-    def next_level(self):
-        self.level += 1
-        self.started = False
-
-    # Reset the game information
-    def reset(self):
-        self.level = 1
-        self.started = False
-        self.level_start_time = 0
-
-    # Check if the game is finished
-    def game_finished(self):
-        return self.level > self.LEVELS
-
-    # Start the current level
-    def start_level(self):
-        self.started = True
-        self.level_start_time = time.time()
-
-    # Get the time elapsed in the current level
-    def get_level_time(self):
-        if not self.started:
-            return 0
-        return round(time.time() - self.level_start_time)
-
-# Define an abstract class for cars
-class AbstractCar:
-    def __init__(self, max_vel, rotation_vel):
-        self.img = self.IMG
-        self.max_vel = max_vel
-        self.vel = 0
-        self.rotation_vel = rotation_vel
-        self.angle = 90
-        self.x, self.y = self.START_POS
-        self.acceleration = 0.1
-        self.update_mask() # Update the mask initially
-
-    # Rotate the car
-    def rotate(self, left=False, right=False):
-        if left:
-            self.angle += self.rotation_vel
-        elif right:
-            self.angle -= self.rotation_vel
-
-    # Update the collision mask of the car
-    def update_mask(self):
-        rotated_car_img, new_rect = blit_rotate_center(WIN, self.img, (self.x, self.y), self.angle)
-        self.mask = pygame.mask.from_surface(rotated_car_img)
-        self.mask_rect = new_rect
-
-    # Draw the car on the window
-    def draw(self, win):
-        blit_rotate_center(win, self.img, (self.x, self.y), self.angle)
-        #WIN.blit(self.mask.to_surface(), self.mask_rect.topleft)
-
-    # Move the car forward
-    def move_forward(self):
-        self.vel = min(self.vel + self.acceleration, self.max_vel)
-        self.move()
-
-    # Move the car backward
-    def move_backward(self):
-        self.vel = max(self.vel - self.acceleration, -self.max_vel/2)
-        self.move()
-
-    # Move the car based on its velocity and angle
-    def move(self):
-        radians = math.radians(self.angle)
-        vertical = math.cos(radians) * self.vel
-        horizontal = math.sin(radians) * self.vel
-
-        self.y -= vertical
-        self.x -= horizontal
-        self.update_mask() # Update the mask after rotation
-
-    # Check for collision between the car and an obstacle
-    def collide(self, mask, x=0, y=0):
-        if mask == TRACK_BORDER_MASK:
-            offset_x = int(self.mask_rect.left - x)
-            offset_y = int(self.mask_rect.top - y)
-        elif mask == FINISH_MASK:
-            offset_x = int(self.mask_rect.left - x )
-            offset_y = int(self.mask_rect.top - y)
-        else: print("NOT FOUND")
-        
-        poi = mask.overlap(self.mask, (offset_x, offset_y))
-        return poi
-
-    # Reset the car position and attributes
-    def reset(self):
-        self.x, self.y = self.START_POS
-        self.angle = 90
-        self.vel = 0
-
-# Define the player car class
-class PlayerCar(AbstractCar):
-    IMG = PLAYER_CAR
-    START_POS = (WIDTH * 0.45, HEIGHT * 0.86)
-
-    def __init__(self, max_vel, rotation_vel, sponsor_name):
-        self.IMG = scale_image(pygame.image.load(f"imgs/cars/{sponsor_name}"), 0.7)
-        super().__init__(max_vel, rotation_vel)
-        self.START_POS = (WIDTH * 0.45, HEIGHT * 0.86)
-
-    # Reduce the speed of the player car
-    def reduce_speed(self):
-        self.vel = max(self.vel - self.acceleration / 2, 0)
-        self.move()
-
-    # Bounce the player car
-    def bounce(self):
-        self.vel = -self.vel * 0.8
-        self.move()
-
-# Define the computer-controlled car class
-class ComputerCar(AbstractCar):
-    IMG = NPC_CAR
-    START_POS = (WIDTH * 0.45, HEIGHT * 0.88)
-
-    def __init__(self, max_vel, rotation_vel, path=[]):
-        super().__init__(max_vel, rotation_vel)
-        self.path = path
-        self.current_point = 0
-        self.vel = max_vel
-
-    # def draw_points(self, win):
-    #    for point in self.path:
-    #        pygame.draw.circle(win, (255, 0, 0), point, 5)
-
-    # def draw(self, win):
-    #    super().draw(win)
-    #    self.draw_points(win)
-
-    # Calculate the angle of the car based on the path
-    def calculate_angle(self):
-        target_x, target_y = self.path[self.current_point]
-        x_diff = target_x - self.x
-        y_diff = target_y - self.y
-
-        if y_diff == 0:
-            desired_radian_angle = math.pi / 2
-        else:
-            desired_radian_angle = math.atan(x_diff / y_diff)
-
-        if target_y > self.y:
-            desired_radian_angle += math.pi
-
-        difference_in_angle = self.angle - math.degrees(desired_radian_angle)
-        if difference_in_angle >= 180:
-            difference_in_angle -= 360
-
-        if difference_in_angle > 0:
-            self.angle -= min(self.rotation_vel, abs(difference_in_angle))
-        else:
-            self.angle += min(self.rotation_vel, abs(difference_in_angle))
-
-    # Update the target point on the path
-    def update_path_point(self):
-        target = self.path[self.current_point]
-        rect = pygame.Rect(
-            self.x, self.y, self.img.get_width(), self.img.get_height())
-        if rect.collidepoint(*target):
-            self.current_point += 1
-
-    # Move the car along the path
-    def move(self):
-        if self.current_point >= len(self.path):
+        self.ticks = ticks
+        self.outcome = outcome
+        self.lines = []
+        self.highlight = None
+
+    # The leaderboard includes the time just submitted, so it is only read once here
+    def enter(self):
+        session = self.session
+        session.renderer.invalidate()
+        track = session.track.name
+        best = LEADERBOARD.best(session.username, session.sponsor_name, track, self.level)
+        self.lines = [f"Level {self.level}: {self.ticks / PHYSICS_HZ:.2f} s"]
+        if best is not None:  # None if the time could not be kept
+            self.lines.append(f"Personal best: {best / PHYSICS_HZ:.2f} s")
+        self.lines.append("")
+        for place, entry in enumerate(LEADERBOARD.top(track, self.level, TOP_COUNT), 1):
+            if (entry.username, entry.sponsor) == (session.username, session.sponsor_name):
+                self.highlight = len(self.lines)
+            self.lines.append(f"{place}. {entry.username} ({os.path.splitext(entry.sponsor)[0]})  "
+                              f"{entry.ticks / PHYSICS_HZ:.2f} s")
+        self.lines += ["", "Press any key to continue"]
+
+    def handle_event(self, event):
+        if event.type != pygame.KEYDOWN:
             return
-
-        self.calculate_angle()
-        self.update_path_point()
-        super().move()
-
-    # Move to the next level
-    def next_level(self, level):
-        self.reset()
-        self.vel = self.max_vel + (level - 1) * 0.2
-        self.current_point = 0
-
-# Function to draw the game elements
-def draw(win, images, player_car, computer_car, game_info):
-    win.fill((0, 0, 0))  # Fill the window with a background color
-
-    # Draw all the images on the window
-    for img, pos in images:
-        win.blit(img, pos)
-
-    # Render and draw the game information texts
-    level_text = MAIN_FONT.render(
-        f"Level {game_info.level}", 1, (255, 255, 255))
-    win.blit(level_text, (10, 10))  
-
-    time_text = MAIN_FONT.render(
-        f"Time: {game_info.get_level_time()}s", 1, (255, 255, 255))
-    win.blit(time_text, (WIDTH - time_text.get_width() - 10, 10))  
-
-    vel_text = MAIN_FONT.render(
-        f"Vel: {round(player_car.vel, 1)}px/s", 1, (255, 255, 255))
-    win.blit(vel_text, (10, HEIGHT - vel_text.get_height() - 10))  
-
-    #WIN.blit(TRACK_BORDER_MASK.to_surface(), (track_border_x, track_border_y))
-    #WIN.blit(FINISH_MASK.to_surface(), FINISH_POSITION)
-
-    player_car.draw(win)
-    computer_car.draw(win)
-
-    pygame.display.update()
-
-# Function to handle player car movement
-def move_player(player_car):
-    keys = pygame.key.get_pressed()
-    moved = False
-
-    if keys[pygame.K_a]:
-        player_car.rotate(left=True)
-    if keys[pygame.K_d]:
-        player_car.rotate(right=True)
-    if keys[pygame.K_w]:
-        moved = True
-        player_car.move_forward()
-    if keys[pygame.K_s]:
-        moved = True
-        player_car.move_backward()
-
-    if not moved:
-        player_car.reduce_speed()
-
-# Function to handle collisions between cars and obstacles
-def handle_collision(player_car, computer_car, game_info):
-    if player_car.collide(TRACK_BORDER_MASK, *track_border_pos) is not None:
-        player_car.bounce()
-
-    computer_finish_poi_collide = computer_car.collide(
-        FINISH_MASK, *FINISH_POSITION)
-    if computer_finish_poi_collide is not None:
-        blit_text_center(WIN, MAIN_FONT, "You lost!")
-        pygame.display.update()
-        pygame.time.wait(5000)
-        game_info.reset()
-        player_car.reset()
-        computer_car.reset()
-
-    player_finish_poi_collide = player_car.collide(
-        FINISH_MASK, *FINISH_POSITION)
-    if player_finish_poi_collide is not None:
-        if player_finish_poi_collide[0] == 0:
-            player_car.bounce()
+        if event.key == pygame.K_ESCAPE:
+            leave_race(self.manager, self.session)
+        elif self.outcome == GAME_WON:
+            self.manager.switch(ResultScene(self.manager, self.session, self.outcome))
         else:
-            game_info.next_level()
-            player_car.reset()
-            computer_car.next_level(game_info.level)
+            self.manager.switch(CountdownScene(self.manager, self.session, COUNTDOWN_SECONDS))
+
+    def draw(self):
+        session = self.session
+        session.draw()
+        session.renderer.overlay(blit_lines_center(session.win, session.small_font, self.lines, self.highlight))
+
+# Scene showing how the game ended for RESULT_SECONDS, then waiting for the next level
+class ResultScene(Scene):
+    static = True
+    MESSAGES = {LOST: "You lost!", GAME_WON: "You won the game!"}
+
+    def __init__(self, manager, session, outcome):
+        super().__init__(manager)
+        self.session = session
+        self.outcome = outcome
+
+    def enter(self):
+        self.session.renderer.invalidate()
+        self.manager.after(RESULT_SECONDS, lambda: self.manager.switch(CountdownScene(self.manager, self.session)))
+
+    def handle_event(self, event):
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+            leave_race(self.manager, self.session)
+
+    def draw(self):
+        self.session.draw()
+        self.session.message(self.MESSAGES[self.outcome])
+
+# Leave a race for the scene it came from, or quit if it has none
+def leave_race(manager, session):
+    scene = session.leave()
+    if scene is None:
+        manager.quit()
+    else:
+        manager.switch(scene)
 
 # Function to start the game
-def play_game(username, sponsor_name):
-    run = True
-    clock = pygame.time.Clock()
-
-    # Update the images list with the calculated positions
-    images = [(GRASS, (grass_x, grass_y)), (TRACK, (track_x, track_y)),
-            (FINISH, FINISH_POSITION), (TRACK_BORDER, (track_x, track_y))]
-
-    player_car = PlayerCar(7, 4, sponsor_name)
-    computer_car = ComputerCar(2, 4, scaled_path)
-    game_info = GameInfo()
-
-    while run:
-        clock.tick(FPS)
+# grid_size is the number of computer-controlled opponents, fps the render frame rate cap;
+# profile times every frame from the start (F3 shows the timings at any time).
+# controller chooses the player's controls every tick (the keyboard by default) and time_source gives
+# the time in seconds (perf_counter by default); with a script and a FixedClock a race plays out the same every time.
+# cpu_target lowers the frame rate while the game uses more than that share of a CPU core; track names a circuit in tracks/
+def play_game(username, sponsor_name, grid_size=1, fps=FPS, profile=False, controller=None, time_source=real_clock,
+              cpu_target=CPU_TARGET, track=DEFAULT_TRACK):
+    # Use the menu's window, or open a fullscreen one when started on its own
+    pygame.init()
+    win = pygame.display.get_surface() or pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
+    pygame.display.set_caption("Racing Game!")
+
+    manager = SceneManager(time_source, fps, cpu_target)
+    session = RaceSession(win, username, sponsor_name, grid_size, profile, controller, fps=fps, track=track)
+    manager.on_exit(session.close)
+    manager.run(CountdownScene(manager, session))
+    pygame.quit()
 
-        draw(WIN, images, player_car, computer_car, game_info)
-        while not game_info.started:
-            blit_text_center(
-                WIN, MAIN_FONT, f"Press any key to start level {game_info.level}!")
-            pygame.display.update()
-            for event in pygame.event.get():
-                # if event.type == pygame.MOUSEBUTTONDOWN:
-                #    pos = pygame.mouse.get_pos()
-                #    computer_car.path.append(pos)
-                       
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    break
-
-                if event.type == pygame.KEYDOWN:
-                    game_info.start_level()
+# Function to play back a replay file: left and right arrows jump back and forward, space pauses, escape quits
+def watch_replay(path, fps=FPS):
+    clock = pygame.time.Clock()
+    pygame.init()
+    win = pygame.display.get_surface() or pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
+    pygame.display.set_caption("Racing Game! - Replay")
+    hud = RaceHud(pygame.font.SysFont("comicsans", 44))
+
+    replay = Replay(path)
+    preload(*win.get_size(), replay.track)
+    track = ASSET_LOADER.get(("track", replay.track, *win.get_size()))
+    background = StaticBackground(track.images())
+    background.build(win)
+    renderer = DirtyRectRenderer(background, DIRTY_RECTS)
+
+    # The cars of a simulation that is never stepped, posed from the replay instead
+    sponsor_name = replay.sponsor if os.path.exists(os.path.join(CARS_DIR, replay.sponsor)) else NPC_CAR_IMAGE
+    simulation = Simulation(track, sponsor_name)
+    player_car, computer_car, game_info = simulation.player_car, simulation.computer_car, simulation.game_info
+    game_info.started = True
+    scale = track.width / replay.width  # Replays recorded at another resolution are scaled to this one
+
+    position = 0.0  # Ticks into the replay
+    paused = False
+    last_time = time.perf_counter()
+    while len(replay):
+        clock.tick(fps)
+        now = time.perf_counter()
+        if not paused:
+            position = min(position + (now - last_time) * replay.physics_hz, len(replay) - 1)
+        last_time = now
 
         for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                run = False
-                break
-
-        move_player(player_car)
-        computer_car.move()
-
-        handle_collision(player_car, computer_car, game_info)
-
-        if game_info.game_finished():
-            blit_text_center(WIN, MAIN_FONT, "You won the game!")
-            pygame.time.wait(5000)
-            game_info.reset()
-            player_car.reset()
-            computer_car.reset()
-
-        #print(computer_car.path)
-    pygame.quit()
-
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                replay.close()
+                return
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_SPACE:
+                    paused = not paused
+                elif event.key in (pygame.K_LEFT, pygame.K_RIGHT):
+                    seek = REPLAY_SEEK_TIME * replay.physics_hz * (1 if event.key == pygame.K_RIGHT else -1)
+                    position = min(max(position + seek, 0), len(replay) - 1)
+                    renderer.invalidate()
+
+        # Pose the cars between the two ticks around the playback position
+        tick = int(position)
+        previous, current = replay[max(tick - 1, 0)], replay[tick]
+        for car, before, after in ((player_car, previous.player, current.player),
+                                   (computer_car, previous.computer, current.computer)):
+            car.prev_x, car.prev_y, car.prev_angle = before[0] * scale, before[1] * scale, before[2]
+            car.x, car.y, car.angle = after[0] * scale, after[1] * scale, after[2]
+        player_car.vel = math.hypot(player_car.x - player_car.prev_x, player_car.y - player_car.prev_y) / scale / TICK_SCALE
+        game_info.level, game_info.level_ticks = current.level, current.level_ticks
+
+        draw(win, renderer, hud, player_car, computer_car, game_info, alpha=position - tick)
+        if paused or tick == len(replay) - 1:
+            blit_text_center(win, hud.font, "Paused" if paused else "End of replay")
+            pygame.display.update()
+            renderer.invalidate()
+    replay.close()
@@ -0,0 +1,763 @@
+# Online races: an asyncio UDP server runs every race's Simulation and sends each player snapshots of it,
+# delta-compressed against the last snapshot that player acknowledged; clients send their controls and
+# draw the race from the snapshots, a little in the past so they can interpolate between two of them.
+#   python netplay.py server --latency 80 --jitter 20 --loss 5      # host races, with a simulated bad network
+#   python netplay.py play localhost --name alice --car ferrari.png
+#   python netplay.py test --clients 4 --seconds 10 --loss 5        # autopilot clients over localhost
+import os
+import argparse  # Command line parsing
+import asyncio
+import random  # Simulated packet loss and latency
+import socket
+import struct
+import threading
+import time
+from collections import namedtuple
+import numpy as np  # NumPy for the snapshot deltas
+import pygame  # Pygame library for the window, and the errors of car images that cannot be loaded
+from simulation import (Track, Simulation, Controls, PHYSICS_HZ, TICK_SCALE, PLAYER_INDEX,
+                        LOST, LEVEL_COMPLETE, GAME_WON, CARS_DIR, NPC_CAR_IMAGE)
+from trackbundle import DEFAULT_TRACK  # Track raced unless another one is given
+from replay import POSITION_UNIT, ANGLE_UNIT  # Same fixed-point units as the replay files
+
+PORT = 47800
+MAX_PLAYERS = 8
+
+# A snapshot every SNAPSHOT_INTERVAL physics ticks (30 a second). The server keeps the last HISTORY of them
+# as delta bases; a player whose last acknowledged snapshot is older gets a full one.
+SNAPSHOT_INTERVAL = 4
+HISTORY = 64
+
+# Clients draw the race this many ticks behind the newest snapshot, so there is usually a later one to
+# interpolate towards even when one or two are lost
+INTERPOLATION_TICKS = 12
+
+ROSTER_INTERVAL = 1.0  # Seconds between repeats of the roster, which may be lost like any datagram
+JOIN_INTERVAL = 0.5  # Seconds between a client's join requests until it gets a roster
+PLAYER_TIMEOUT = 5.0  # Seconds of silence after which a player is dropped
+
+# Datagrams start with their type. Join: race name, car image, username. Roster: the player's index,
+# roster version, computer cars, track size, player count and track name, then each player's car image and username.
+# Input: input number, newest snapshot received, control bits, key presses so far.
+# Snapshot: number, number of the snapshot it is a delta against (NO_BASE for none), roster version,
+# bytes per value and count of changed values, then a bit per state value that changed and the changes.
+JOIN, ROSTER, INPUT, SNAPSHOT, LEAVE = range(1, 6)
+JOIN_PACKET = struct.Struct("<B16s32s16s")
+ROSTER_HEADER = struct.Struct("<BBBBHHB16s")
+ROSTER_ENTRY = struct.Struct("<32s16s")
+INPUT_PACKET = struct.Struct("<BIIBB")
+SNAPSHOT_HEADER = struct.Struct("<BIIBBH")
+NO_BASE = 0xFFFFFFFF
+VALUE_TYPES = {1: np.dtype("<i1"), 2: np.dtype("<i2"), 4: np.dtype("<i4")}
+
+# Snapshot state: these fields, then each player's race position, then (x, y, angle) of every car:
+# the players in roster order, the computer car, then the rest of the computer cars
+STATE_FIELDS = ("level", "level_ticks", "started", "message", "winner")
+MESSAGES = (None, LEVEL_COMPLETE, LOST, GAME_WON)  # How the last level ended, shown until the next starts
+
+# One player as seen by the server
+RemotePlayer = namedtuple("RemotePlayer", ["address", "sponsor", "username"])
+
+
+# Pack a string into a fixed-size field, and back
+def _text(value, size):
+    return value.encode("utf-8")[:size].decode("utf-8", "ignore").encode("utf-8")  # Never half a character
+
+
+def _untext(value):
+    return value.rstrip(b"\0").decode("utf-8", "replace")
+
+
+# Number of values in the state of a race with `players` players and `grid_size` computer cars
+def state_size(players, grid_size):
+    return len(STATE_FIELDS) + players + 3 * (players + grid_size)
+
+
+# Delta-encode `state` against `base` (None for a full snapshot): a bit per value that changed, and the
+# changes in the narrowest integer type that holds them all
+def encode_snapshot(seq, base_seq, version, state, base):
+    delta = state - base if base is not None else state
+    changed = delta != 0
+    values = delta[changed]
+    largest = int(np.abs(values).max()) if len(values) else 0
+    width = 1 if largest < 128 else 2 if largest < 32768 else 4
+    return (SNAPSHOT_HEADER.pack(SNAPSHOT, seq, NO_BASE if base is None else base_seq, version, width, len(values))
+            + np.packbits(changed).tobytes() + values.astype(VALUE_TYPES[width]).tobytes())
+
+
+# Decode a snapshot datagram against the states received before ({seq: state}), returning
+# (seq, state), or None if it belongs to another roster or its base is no longer known
+def decode_snapshot(data, version, size, states):
+    _, seq, base_seq, snapshot_version, width, count = SNAPSHOT_HEADER.unpack_from(data)
+    if snapshot_version != version:
+        return None
+    if base_seq == NO_BASE:
+        state = np.zeros(size, np.int32)
+    elif base_seq in states:
+        state = states[base_seq].copy()
+    else:
+        return None
+    mask_bytes = (size + 7) // 8
+    changed = np.unpackbits(np.frombuffer(data, np.uint8, mask_bytes, SNAPSHOT_HEADER.size))[:size].astype(bool)
+    state[changed] += np.frombuffer(data, VALUE_TYPES[width], count, SNAPSHOT_HEADER.size + mask_bytes)
+    return seq, state
+
+
+# Define a class that delays and drops datagrams like a poor network, to test over localhost.
+# Latency and jitter are in seconds, loss is the share of datagrams dropped.
+class LinkConditioner:
+    def __init__(self, latency=0.0, jitter=0.0, loss=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.random = random.Random(seed)
+
+    # Seconds to hold a datagram back, or None to drop it
+    def delay(self):
+        if self.random.random() < self.loss:
+            return None
+        return max(self.latency + self.random.uniform(-self.jitter, self.jitter), 0.0)
+
+
+# Define a class holding one race on the server: its players, simulation and recent snapshots
+class Race:
+    def __init__(self, name, track, grid_size):
+        self.name = name
+        self.track = track
+        self.grid_size = grid_size
+        self.players = []  # RemotePlayers, in roster order
+        self.controls = {}  # Latest controls of each address
+        self.presses = {}  # Key presses each address has reported, and those already used to start a level
+        self.used_presses = {}
+        self.pending = []  # Players who joined during a level, added when it ends
+        self.departed = set()  # Addresses of players who left during a level; their cars stay until it ends
+        self.version = 0
+        self.seq = 0
+        self.history = {}
+        self.cached = {}  # Encoded datagrams of the newest snapshot, by base
+        self.message = 0
+        self.winner = -1
+        self.simulation = None
+
+    # Build a new simulation for the current roster, keeping the level
+    def rebuild(self):
+        level = self.simulation.game_info.level if self.simulation is not None else 1
+        self.simulation = Simulation(self.track, self.players[0].sponsor, self.grid_size,
+                                     [player.sponsor for player in self.players[1:]])
+        game_info = self.simulation.game_info
+        game_info.level = level
+        self.simulation.computer_car.next_level(level)
+        if self.simulation.fleet is not None:
+            self.simulation.fleet.next_level(level)
+        self.version = (self.version + 1) % 256
+        self.history.clear()
+        self.cached.clear()
+
+    # Add a player to the race, or to the players waiting for the level to end. If the race cannot be built
+    # with the player's car, the race is left as it was and the error raised.
+    def add(self, player):
+        if self.simulation is not None and self.simulation.game_info.started:
+            self.pending.append(player)
+            return
+        self.players.append(player)
+        try:
+            self.rebuild()
+        except (OSError, pygame.error):
+            self.players.pop()
+            raise
+
+    # Remove a player. During a level its car rolls to a stop and the others race on; the roster changes
+    # when the level ends, or at once if nobody is left racing.
+    def remove(self, address):
+        self.pending = [player for player in self.pending if player.address != address]
+        if any(player.address == address for player in self.players):
+            for table in (self.controls, self.presses, self.used_presses):
+                table.pop(address, None)
+            self.departed.add(address)
+            if self.simulation.game_info.started:
+                if self.active():
+                    return
+                # Nobody is left racing the level, so end it
+                self.used_presses.update(self.presses)
+                self.message, self.winner = 0, -1
+            self.settle()
+
+    # Players still in the race, in roster order
+    def active(self):
+        return [player for player in self.players if player.address not in self.departed]
+
+    # Between levels: drop the players who left, let in those who joined, and rebuild for the new roster
+    def settle(self):
+        if not self.departed and not self.pending:
+            return
+        self.players = self.active() + self.pending
+        self.departed, self.pending = set(), []
+        if self.players:
+            self.rebuild()
+
+    def full(self):
+        return len(self.players) + len(self.pending) >= MAX_PLAYERS
+
+    # Player car of roster entry `index`
+    def car(self, index):
+        return self.simulation.player_car if index == 0 else self.simulation.rivals[index - 1]
+
+    # Race progress index of roster entry `index`
+    def progress_index(self, index):
+        return PLAYER_INDEX if index == 0 else self.simulation.first_rival + index - 1
+
+    # Advance the race by one physics tick. A level starts when any player presses a key, like in the
+    # single-player game; between levels nothing moves.
+    def tick(self):
+        if not self.players:
+            return
+        simulation = self.simulation
+        game_info = simulation.game_info
+        if not game_info.started:
+            if any(self.presses.get(player.address, 0) != self.used_presses.get(player.address, 0)
+                   for player in self.players):
+                self.used_presses.update(self.presses)
+                self.message, self.winner = 0, -1
+                game_info.start_level()
+            return
+
+        controls = [Controls() if player.address in self.departed else self.controls.get(player.address, Controls())
+                    for player in self.players]
+        event = simulation.step(controls[0], controls[1:])
+        if event is not None:
+            self.message = MESSAGES.index(event)
+            self.winner = -1
+            if event != LOST:
+                indices = [self.progress_index(i) for i in range(len(self.players))]
+                self.winner = indices.index(simulation.winner) if simulation.winner in indices else -1
+            self.used_presses.update(self.presses)  # Keys held from the last level do not start the next
+            self.settle()
+
+    # Current state as a vector of fixed-point integers
+    def state(self):
+        simulation = self.simulation
+        game_info = simulation.game_info
+        cars = [self.car(i) for i in range(len(self.players))] + [simulation.computer_car]
+        x = [car.x for car in cars]
+        y = [car.y for car in cars]
+        angle = [car.angle for car in cars]
+        if simulation.fleet is not None:
+            x += simulation.fleet.x.tolist()
+            y += simulation.fleet.y.tolist()
+            angle += simulation.fleet.angle.tolist()
+        poses = np.round(np.column_stack([np.divide(x, POSITION_UNIT), np.divide(y, POSITION_UNIT),
+                                          np.divide(angle, ANGLE_UNIT)])).ravel()
+        fields = [game_info.level, game_info.level_ticks, game_info.started, self.message, self.winner]
+        positions = [simulation.progress.position(self.progress_index(i)) + 1 for i in range(len(self.players))]
+        return np.concatenate([fields, positions, poses]).astype(np.int32)
+
+    # Take a snapshot of the race and keep it as a delta base
+    def snapshot(self):
+        self.seq += 1
+        self.history[self.seq] = self.state()
+        self.history.pop(self.seq - HISTORY, None)
+        self.cached.clear()
+
+    # The newest snapshot as a datagram, as a delta against `base_seq` if that snapshot is still kept.
+    # Players who acknowledged the same snapshot share one encoding.
+    def encode(self, base_seq):
+        base_seq = base_seq if base_seq in self.history else NO_BASE
+        packet = self.cached.get(base_seq)
+        if packet is None:
+            packet = self.cached[base_seq] = encode_snapshot(self.seq, base_seq, self.version,
+                                                            self.history[self.seq], self.history.get(base_seq))
+        return packet
+
+    # Roster datagram for roster entry `index`
+    def roster(self, index):
+        width, height = self.track.width, self.track.height
+        return (ROSTER_HEADER.pack(ROSTER, index, self.version, self.grid_size, width, height, len(self.players),
+                                   _text(self.track.name, 16))
+                + b"".join(ROSTER_ENTRY.pack(_text(player.sponsor, 32), _text(player.username, 16))
+                           for player in self.players))
+
+
+# Define a class serving races over UDP with asyncio. Each race runs at PHYSICS_HZ and sends a snapshot
+# every SNAPSHOT_INTERVAL ticks; `conditioner` (a LinkConditioner) delays and drops datagrams both ways.
+class RaceServer(asyncio.DatagramProtocol):
+    def __init__(self, width=1920, height=1080, grid_size=1, conditioner=None, track=DEFAULT_TRACK):
+        self.track = Track(width, height, track)
+        self.grid_size = grid_size
+        self.conditioner = conditioner
+        self.races = {}
+        self.addresses = {}  # Address of every player: [race, last input number, newest snapshot acknowledged]
+        self.last_seen = {}
+        self.transport = None
+        self.running = False
+        self.ticks = 0
+        self.tick_time = 0.0  # Seconds spent simulating and encoding
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, address):
+        if self.conditioner is None:
+            self.receive(data, address)
+            return
+        delay = self.conditioner.delay()
+        if delay is not None:
+            asyncio.get_running_loop().call_later(delay, self.receive, data, address)
+
+    def send(self, data, address):
+        self.bytes_sent += len(data)
+        if self.conditioner is None:
+            self.transport.sendto(data, address)
+            return
+        delay = self.conditioner.delay()
+        if delay is not None:
+            asyncio.get_running_loop().call_later(delay, self.transport.sendto, data, address)
+
+    # Handle one datagram from a client
+    def receive(self, data, address):
+        self.bytes_received += len(data)
+        if not data:
+            return
+        self.last_seen[address] = time.monotonic()
+        kind = data[0]
+        if kind == INPUT and len(data) == INPUT_PACKET.size and address in self.addresses:
+            _, number, ack, bits, presses = INPUT_PACKET.unpack(data)
+            entry = self.addresses[address]
+            if number <= entry[1]:
+                return  # Older than the controls already applied
+            entry[1], entry[2] = number, ack
+            race = entry[0]
+            race.controls[address] = Controls(*(bool(bits & bit) for bit in (1, 2, 4, 8)))
+            race.presses[address] = presses
+            race.used_presses.setdefault(address, presses)  # Presses from before joining do not count
+        elif kind == JOIN and len(data) == JOIN_PACKET.size:
+            self.join(address, *(_untext(field) for field in JOIN_PACKET.unpack(data)[1:]))
+        elif kind == LEAVE:
+            self.leave(address)
+
+    # Add a player to a race, creating it if needed, and tell its players. A repeated join (the roster
+    # was lost) only gets the roster again.
+    def join(self, address, race_name, sponsor, username):
+        if address in self.addresses:
+            race = self.addresses[address][0]
+            for index, player in enumerate(race.players):
+                if player.address == address:
+                    self.send(race.roster(index), address)
+            return
+        if sponsor not in os.listdir(CARS_DIR):
+            sponsor = NPC_CAR_IMAGE  # Only the game's own car images, never a path from the network
+        race = self.races.get(race_name)
+        if race is None:
+            race = self.races[race_name] = Race(race_name, self.track, self.grid_size)
+        if race.full():
+            return
+        try:
+            race.add(RemotePlayer(address, sponsor, username))
+        except (OSError, pygame.error):
+            if not race.players and not race.pending:
+                del self.races[race_name]
+            return  # The client keeps asking to join, and gets no roster
+        self.addresses[address] = [race, 0, NO_BASE]
+        self.send_roster(race)
+
+    def leave(self, address):
+        entry = self.addresses.pop(address, None)
+        self.last_seen.pop(address, None)
+        if entry is None:
+            return
+        race = entry[0]
+        race.remove(address)
+        if race.players or race.pending:
+            self.send_roster(race)
+        else:
+            del self.races[race.name]
+
+    def send_roster(self, race):
+        for index, player in enumerate(race.players):
+            if player.address not in race.departed:
+                self.send(race.roster(index), player.address)
+
+    # Step every race by one tick and send the snapshots that are due
+    def tick(self):
+        start = time.perf_counter()
+        self.ticks += 1
+        for race in list(self.races.values()):
+            race.tick()
+            if self.ticks % SNAPSHOT_INTERVAL == 0:
+                race.snapshot()
+                for player in race.active():
+                    self.send(race.encode(self.addresses[player.address][2]), player.address)
+        self.tick_time += time.perf_counter() - start
+
+    # Drop silent players and repeat the rosters
+    def housekeeping(self):
+        now = time.monotonic()
+        for address, seen in list(self.last_seen.items()):
+            if now - seen > PLAYER_TIMEOUT:
+                self.leave(address)
+        for race in self.races.values():
+            self.send_roster(race)
+
+    # Serve on (host, port) until stop() is called
+    async def serve(self, host="0.0.0.0", port=PORT):
+        loop = asyncio.get_running_loop()
+        await loop.create_datagram_endpoint(lambda: self, local_addr=(host, port))
+        self.running = True
+        next_tick = next_roster = loop.time()
+        try:
+            while self.running:
+                self.tick()
+                now = loop.time()
+                if now >= next_roster:
+                    self.housekeeping()
+                    next_roster = now + ROSTER_INTERVAL
+                next_tick += 1 / PHYSICS_HZ
+                if next_tick < now - 0.25:
+                    next_tick = now  # Too far behind to catch up; skip ahead rather than run a burst of ticks
+                await asyncio.sleep(max(next_tick - now, 0))
+        finally:
+            self.transport.close()
+
+    def stop(self):
+        self.running = False
+
+    # Bandwidth and cost per player, averaged since the server started
+    def stats(self, seconds):
+        players = max(sum(len(race.players) for race in self.races.values()), 1)
+        return {"players": players, "races": len(self.races),
+                "down_bytes_per_player_s": round(self.bytes_sent / players / seconds),
+                "up_bytes_per_player_s": round(self.bytes_received / players / seconds),
+                "tick_us_per_player": round(self.tick_time / max(self.ticks, 1) / players * 1e6, 1)}
+
+
+# Define a class for the client end of a race: a non-blocking UDP socket polled from the game loop.
+# It keeps the recent snapshots to interpolate the cars between them.
+class RaceClient:
+    def __init__(self, address, sponsor_name, username="player", race="default"):
+        self.address = address
+        self.sponsor = sponsor_name
+        self.username = username
+        self.race = race
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.socket.bind(("0.0.0.0", 0))
+        self.index = None  # Our place in the roster, once the server has sent it
+        self.version = None
+        self.roster = []  # (car image, username) of every player
+        self.grid_size = 1
+        self.server_size = (1920, 1080)
+        self.track = DEFAULT_TRACK  # Track the server races on
+        self.size = 0
+        self.states = {}  # Decoded snapshots, as delta bases and for interpolation
+        self.newest = None
+        self.newest_time = 0.0
+        self.input_number = 0
+        self.presses = 0
+        self.last_join = -JOIN_INTERVAL
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.full_snapshots = 0
+        self.delta_snapshots = 0
+
+    def send(self, data):
+        self.bytes_sent += len(data)
+        try:
+            self.socket.sendto(data, self.address)
+        except OSError:
+            pass  # Nobody listening yet; datagrams may be lost anyway
+
+    # Count a key press, which starts the level when the race is waiting
+    def press(self):
+        self.presses = (self.presses + 1) % 256
+
+    # Send this tick's controls with the newest snapshot received, asking to join until a roster arrives
+    def send_input(self, controls, now=None):
+        now = time.monotonic() if now is None else now
+        if self.index is None:
+            if now - self.last_join >= JOIN_INTERVAL:
+                self.send(JOIN_PACKET.pack(JOIN, _text(self.race, 16), _text(self.sponsor, 32), _text(self.username, 16)))
+                self.last_join = now
+            return
+        self.input_number += 1
+        bits = sum(bit for bit, pressed in zip((1, 2, 4, 8), controls) if pressed)
+        self.send(INPUT_PACKET.pack(INPUT, self.input_number, NO_BASE if self.newest is None else self.newest,
+                                    bits, self.presses))
+
+    # Read every datagram waiting on the socket; returns True if the roster changed
+    def poll(self, now=None):
+        now = time.monotonic() if now is None else now
+        roster_changed = False
+        while True:
+            try:
+                data = self.socket.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                break  # E.g. the server's port is closed
+            self.bytes_received += len(data)
+            if data and data[0] == ROSTER:
+                roster_changed |= self.read_roster(data)
+            elif data and data[0] == SNAPSHOT and self.version is not None:
+                decoded = decode_snapshot(data, self.version, self.size, self.states)
+                if decoded is None:
+                    continue
+                seq, state = decoded
+                self.states[seq] = state
+                if SNAPSHOT_HEADER.unpack_from(data)[2] == NO_BASE:
+                    self.full_snapshots += 1
+                else:
+                    self.delta_snapshots += 1
+                if self.newest is None or seq > self.newest:
+                    self.newest, self.newest_time = seq, now
+                    for old in [old for old in self.states if old <= seq - HISTORY]:
+                        del self.states[old]
+        return roster_changed
+
+    def read_roster(self, data):
+        _, index, version, grid_size, width, height, count, track = ROSTER_HEADER.unpack_from(data)
+        roster = [tuple(_untext(field) for field in ROSTER_ENTRY.unpack_from(data, ROSTER_HEADER.size + i * ROSTER_ENTRY.size))
+                  for i in range(count)]
+        if version == self.version and index == self.index:
+            return False
+        self.index, self.version, self.roster = index, version, roster
+        self.grid_size, self.server_size, self.track = grid_size, (width, height), _untext(track)
+        self.size = state_size(count, grid_size)
+        self.states.clear()
+        self.newest = None
+        return True
+
+    # The two snapshots around the drawing time and how far between them it is: (before, after, alpha).
+    # With `newest`, the newest snapshot and the one before it, without delay. None before the first snapshot.
+    def view(self, now=None, newest=False):
+        if self.newest is None:
+            return None
+        latest = self.states[self.newest]
+        if newest:
+            return self.states.get(self.newest - 1, latest), latest, 1.0
+        now = time.monotonic() if now is None else now
+        snapshots_per_second = PHYSICS_HZ / SNAPSHOT_INTERVAL
+        target = self.newest + (now - self.newest_time) * snapshots_per_second - INTERPOLATION_TICKS / SNAPSHOT_INTERVAL
+        target = min(target, self.newest)
+        seqs = sorted(self.states)
+        before = max([seq for seq in seqs if seq <= target], default=seqs[0])
+        after = min([seq for seq in seqs if seq >= target], default=self.newest)
+        a, b = self.states[before], self.states[after]
+        if after == before or a[0] != b[0] or b[1] < a[1] or a[2] != b[2]:
+            return b, b, 1.0  # Do not slide the cars across a restart
+        return a, b, (target - before) / (after - before)
+
+    # Sponsor images of the other players, in roster order: the rivals of a local simulation
+    def rivals(self):
+        return [sponsor for i, (sponsor, _) in enumerate(self.roster) if i != self.index]
+
+    def close(self):
+        if self.index is not None:
+            self.send(bytes([LEAVE]))
+        self.socket.close()
+
+
+# Pose the cars of an unstepped local Simulation (built with the client's car and rivals) from two
+# snapshot states, for draw() with `alpha`, and copy the race information into its GameInfo
+def pose_simulation(simulation, client, before, after, scale):
+    players = len(client.roster)
+    offset = len(STATE_FIELDS) + players
+    poses_before = before[offset:].reshape(-1, 3) * (POSITION_UNIT * scale, POSITION_UNIT * scale, ANGLE_UNIT)
+    poses_after = after[offset:].reshape(-1, 3) * (POSITION_UNIT * scale, POSITION_UNIT * scale, ANGLE_UNIT)
+
+    rivals = iter(simulation.rivals)
+    cars = [simulation.player_car if i == client.index else next(rivals) for i in range(players)]
+    for car, (prev_x, prev_y, prev_angle), (x, y, angle) in zip(cars + [simulation.computer_car],
+                                                                  poses_before.tolist(), poses_after.tolist()):
+        car.prev_x, car.prev_y, car.prev_angle = prev_x, prev_y, prev_angle
+        car.x, car.y, car.angle = x, y, angle
+    fleet = simulation.fleet
+    if fleet is not None:
+        fleet.prev_x, fleet.prev_y, fleet.prev_angle = (poses_before[players + 1:, i].copy() for i in range(3))
+        fleet.x, fleet.y, fleet.angle = (poses_after[players + 1:, i].copy() for i in range(3))
+
+    player_car = simulation.player_car
+    ticks = SNAPSHOT_INTERVAL if after[1] > before[1] else 1
+    player_car.vel = np.hypot(player_car.x - player_car.prev_x, player_car.y - player_car.prev_y) / scale / TICK_SCALE / ticks
+    game_info = simulation.game_info
+    game_info.level, game_info.level_ticks, game_info.started = int(after[0]), int(after[1]), bool(after[2])
+    game_info.position = int(after[len(STATE_FIELDS) + client.index])
+    game_info.cars = players + client.grid_size
+
+
+# Text shown while the race waits for a key: how the last level ended and which level is next
+def waiting_text(client, state):
+    level, message, winner = int(state[0]), MESSAGES[int(state[3])], int(state[4])
+    name = "You" if winner == client.index else client.roster[winner][1] if 0 <= winner < len(client.roster) else ""
+    prefix = {LEVEL_COMPLETE: f"{name} won the level! ", LOST: "A computer car won! ",
+              GAME_WON: f"{name} won the game! "}.get(message, "")
+    return f"{prefix}Press any key to start level {level}!"
+
+
+# Function to race online: the keyboard drives our car and the server's snapshots pose every car
+def play_online(address, username, sponsor_name, race="default", fps=60):
+    from main import draw, preload, ASSET_LOADER, DIRTY_RECTS  # The single-player drawing path
+    from render import StaticBackground, DirtyRectRenderer
+    from hud import RaceHud
+    from inputs import KeyboardInput
+    from utils import blit_text_center
+
+    clock = pygame.time.Clock()
+    pygame.init()
+    win = pygame.display.get_surface() or pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
+    pygame.display.set_caption("Racing Game! - Online")
+    hud = RaceHud(pygame.font.SysFont("comicsans", 44))
+    preload(*win.get_size())
+    track = ASSET_LOADER.get(("track", DEFAULT_TRACK, *win.get_size()))  # Until the server says which track it races on
+    background = StaticBackground(track.images())
+    background.build(win)
+    renderer = DirtyRectRenderer(background, DIRTY_RECTS)
+
+    client = RaceClient(address, sponsor_name, username, race)
+    keyboard = KeyboardInput()
+    simulation = None
+    run = True
+    while run:
+        clock.tick(fps)
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                run = False
+            elif event.type == pygame.KEYDOWN:
+                client.press()
+
+        if client.poll():
+            if client.track != track.name:
+                preload(*win.get_size(), client.track)
+                track = ASSET_LOADER.get(("track", client.track, *win.get_size()))
+                background = StaticBackground(track.images())
+                background.build(win)
+                renderer = DirtyRectRenderer(background, DIRTY_RECTS)
+            simulation = Simulation(track, sponsor_name, client.grid_size, client.rivals())
+            renderer.invalidate()
+        client.send_input(keyboard(simulation.player_car if simulation is not None else None))
+
+        view = client.view()
+        if simulation is None or view is None:
+            blit_text_center(win, hud.font, "Connecting...")
+            pygame.display.update()
+            continue
+        before, after, alpha = view
+        pose_simulation(simulation, client, before, after, track.width / client.server_size[0])
+        draw(win, renderer, hud, simulation.player_car, simulation.computer_car, simulation.game_info,
+             simulation.fleet, alpha, rivals=simulation.rivals)
+        if not after[2]:
+            blit_text_center(win, hud.font, waiting_text(client, after))
+            pygame.display.update()
+            renderer.invalidate()
+    client.close()
+    pygame.quit()
+
+
+# Run a server on a background thread with its own event loop; returns the server and the thread
+def start_server(host, port, **kwargs):
+    server = RaceServer(**kwargs)
+    thread = threading.Thread(target=asyncio.run, args=(server.serve(host, port),), daemon=True)
+    thread.start()
+    while not server.running and thread.is_alive():
+        time.sleep(0.01)
+    return server, thread
+
+
+# Race autopilot clients against a local server for `seconds` and report bandwidth, server cost per
+# player and how far the interpolated cars were from the newest snapshot
+def run_test(clients, seconds, port, width, height, grid_size, conditioner, fps=60, track=DEFAULT_TRACK):
+    from headless import AutoPilot
+
+    server, thread = start_server("127.0.0.1", port, width=width, height=height, grid_size=grid_size,
+                                  conditioner=conditioner, track=track)
+    track = server.track
+    bots = [RaceClient(("127.0.0.1", port), NPC_CAR_IMAGE if i % 2 else "red_bull.png", f"bot{i}")
+            for i in range(clients)]
+    simulations = [None] * clients
+    pilots = [AutoPilot(track, cruise_vel=3) for _ in bots]
+    start = time.monotonic()
+    frame = 0
+    levels = 0
+    while time.monotonic() - start < seconds:
+        frame += 1
+        for i, bot in enumerate(bots):
+            if bot.poll():
+                simulations[i] = Simulation(track, bot.sponsor, bot.grid_size, bot.rivals())
+            simulation = simulations[i]
+            view = bot.view(newest=True)
+            controls = Controls()
+            if simulation is not None and view is not None:
+                before, after, _ = view
+                if not after[2]:
+                    if frame % fps == 0:
+                        bot.press()  # Start the level a second after it is ready
+                        levels += i == 0
+                        pilots[i].reset()
+                else:
+                    pose_simulation(simulation, bot, before, after, 1.0)
+                    controls = pilots[i](simulation.player_car)
+            bot.send_input(controls)
+        time.sleep(1 / fps)
+    elapsed = time.monotonic() - start
+    stats = server.stats(elapsed)
+    stats.update({"seconds": round(elapsed, 1), "levels_started": levels,
+                  "full_snapshots": sum(bot.full_snapshots for bot in bots),
+                  "delta_snapshots": sum(bot.delta_snapshots for bot in bots),
+                  "snapshot_bytes_per_player_s": round(sum(bot.bytes_received for bot in bots) / clients / elapsed)})
+    for bot in bots:
+        bot.close()
+    server.stop()
+    thread.join(timeout=2)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Host or join online races.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    server_parser = commands.add_parser("server", help="host races")
+    play_parser = commands.add_parser("play", help="join a race")
+    test_parser = commands.add_parser("test", help="race autopilot clients against a local server")
+    for command in (server_parser, test_parser):
+        command.add_argument("--port", type=int, default=PORT)
+        command.add_argument("--width", type=int, default=1920, help="track resolution of the server")
+        command.add_argument("--height", type=int, default=1080)
+        command.add_argument("--grid-size", type=int, default=1, help="computer cars per race")
+        command.add_argument("--track", default=DEFAULT_TRACK, help="track in tracks/")
+        command.add_argument("--latency", type=float, default=0, help="simulated one-way latency in ms")
+        command.add_argument("--jitter", type=float, default=0, help="simulated latency jitter in ms")
+        command.add_argument("--loss", type=float, default=0, help="simulated packet loss in percent")
+    server_parser.add_argument("--host", default="0.0.0.0")
+    play_parser.add_argument("host", help="server address, optionally with :port")
+    play_parser.add_argument("--name", default="player")
+    play_parser.add_argument("--car", default="red_bull.png", help="car image in imgs/cars")
+    play_parser.add_argument("--race", default="default", help="race to join")
+    test_parser.add_argument("--clients", type=int, default=4)
+    test_parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args(argv)
+
+    if args.command == "play":
+        host, _, port = args.host.partition(":")
+        play_online((socket.gethostbyname(host), int(port or PORT)), args.name, args.car, args.race)
+        return
+
+    conditioner = None
+    if args.latency or args.jitter or args.loss:
+        conditioner = LinkConditioner(args.latency / 1000, args.jitter / 1000, args.loss / 100)
+    if args.command == "test":
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        stats = run_test(args.clients, args.seconds, args.port, args.width, args.height, args.grid_size, conditioner,
+                         track=args.track)
+        for name, value in stats.items():
+            print(f"{name:<30} {value}")
+        return
+
+    server = RaceServer(args.width, args.height, args.grid_size, conditioner, args.track)
+    print(f"Serving races on {args.host}:{args.port}")
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
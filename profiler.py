@@ -0,0 +1,155 @@
+# Per-frame phase timings of the game loop, with rolling percentiles, an on-screen overlay and export
+import csv
+import json
+import os
+import platform
+import time
+import numpy as np  # NumPy for the ring buffer and the percentiles
+import pygame
+
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
+
+# Phases of one frame, in the order they run. Time between two marks is charged to the second one,
+# so every nanosecond of a frame lands in exactly one phase.
+PHASES = ("idle", "events", "move_player", "computer_move", "collision", "draw", "display_update")
+
+RING_FRAMES = 600  # Ten seconds at 60 FPS
+PERCENTILES = (50, 95, 99)
+OVERLAY_REFRESH = 0.5  # Seconds between redraws of the overlay text
+
+
+# Nothing to do while the profiler is off; cheaper than checking a flag in every mark
+def _no_mark(phase):
+    pass
+
+
+# Define a class that times the phases of every frame with perf_counter_ns and keeps the last frames in a ring
+class FrameProfiler:
+    def __init__(self, phases=PHASES, size=RING_FRAMES):
+        self.phases = phases
+        self.index = {phase: i for i, phase in enumerate(phases)}
+        self.frames = np.zeros((size, len(phases)), dtype=np.int64)  # Nanoseconds per phase, one row per frame
+        self.count = 0  # Frames recorded since the profiler was last enabled
+        self.current = [0] * len(phases)
+        self.last = 0
+        self.enabled = False
+        self.show_overlay = False
+        self.mark = _no_mark
+        self.overlay = None
+        self.overlay_time = 0
+        self.font = None
+
+    # Start or stop timing; marks cost one no-op call while stopped
+    def enable(self, enabled=True):
+        if enabled and not self.enabled:
+            self.count = 0
+            self.current = [0] * len(self.phases)
+            self.last = time.perf_counter_ns()
+        self.enabled = enabled
+        self.mark = self._mark if enabled else _no_mark
+
+    # Show or hide the overlay, timing frames whenever it is shown
+    def toggle_overlay(self):
+        self.show_overlay = not self.show_overlay
+        if self.show_overlay:
+            self.enable()
+        self.overlay = None
+
+    # Charge the time since the previous mark to `phase`
+    def _mark(self, phase):
+        now = time.perf_counter_ns()
+        self.current[self.index[phase]] += now - self.last
+        self.last = now
+
+    # Drop the time since the last mark, e.g. after the game waited for a key
+    def skip(self):
+        self.last = time.perf_counter_ns()
+
+    # Close the current frame and store it in the ring
+    def end_frame(self):
+        if not self.enabled:
+            return
+        self.frames[self.count % len(self.frames)] = self.current
+        self.count += 1
+        self.current = [0] * len(self.phases)
+
+    # Recorded frames, oldest first, in nanoseconds per phase
+    def recorded(self):
+        size = len(self.frames)
+        if self.count <= size:
+            return self.frames[:self.count]
+        start = self.count % size
+        return np.concatenate([self.frames[start:], self.frames[:start]])
+
+    # Mean, percentiles and maximum in milliseconds of every phase and of the whole frame, over the ring
+    def summary(self):
+        frames = self.recorded()
+        if not len(frames):
+            return {}
+        totals = np.column_stack([frames, frames.sum(axis=1)]) / 1e6
+        percentiles = np.percentile(totals, PERCENTILES, axis=0)
+        summary = {}
+        for i, name in enumerate(self.phases + ("frame",)):
+            summary[name] = {"mean": round(float(totals[:, i].mean()), 4), "max": round(float(totals[:, i].max()), 4)}
+            for percentile, values in zip(PERCENTILES, percentiles):
+                summary[name][f"p{percentile}"] = round(float(values[i]), 4)
+        return summary
+
+    # Draw the percentiles in the top-right corner and return the rect covered (None if hidden).
+    # The text is only re-rendered every OVERLAY_REFRESH seconds.
+    def draw(self, win):
+        if not self.show_overlay:
+            return None
+        now = time.perf_counter()
+        if self.overlay is None or now - self.overlay_time >= OVERLAY_REFRESH:
+            self.overlay = self.render_overlay()
+            self.overlay_time = now
+        rect = self.overlay.get_rect(topright=(win.get_width() - 10, 10))
+        win.blit(self.overlay, rect)
+        return rect
+
+    def render_overlay(self):
+        if self.font is None:
+            self.font = pygame.font.SysFont("monospace", 16)
+        summary = self.summary()
+        lines = [f"{'ms':<15}" + "".join(f"{'p%d' % percentile:>8}" for percentile in PERCENTILES)]
+        for name, stats in summary.items():
+            lines.append(f"{name:<15}" + "".join(f"{stats['p%d' % percentile]:>8.2f}" for percentile in PERCENTILES))
+        lines.append(f"{min(self.count, len(self.frames))} frames")
+
+        rendered = [self.font.render(line, True, (255, 255, 255)) for line in lines]
+        surface = pygame.Surface((max(line.get_width() for line in rendered) + 12,
+                                  sum(line.get_height() for line in rendered) + 12))
+        surface.fill((0, 0, 0))
+        surface.set_alpha(200)
+        y = 6
+        for line in rendered:
+            surface.blit(line, (6, y))
+            y += line.get_height()
+        return surface
+
+    # Write the recorded frames as CSV and the summary as JSON to `directory`, and return both paths
+    def export(self, directory=PROFILE_DIR, name=None):
+        frames = self.recorded()
+        if not len(frames):
+            return None
+        os.makedirs(directory, exist_ok=True)
+        name = name or time.strftime("frames-%Y%m%d-%H%M%S")
+        csv_path = os.path.join(directory, f"{name}.csv")
+        json_path = os.path.join(directory, f"{name}.json")
+
+        with open(csv_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(("frame",) + tuple(f"{phase}_ms" for phase in self.phases) + ("frame_ms",))
+            for i, row in enumerate(frames.tolist()):
+                writer.writerow([i] + [f"{ns / 1e6:.4f}" for ns in row] + [f"{sum(row) / 1e6:.4f}"])
+
+        report = {"frames": len(frames), "phases": self.summary(), "python": platform.python_version(),
+                  "pygame": pygame.version.ver, "platform": platform.platform(), "processor": platform.processor()}
+        with open(json_path, "w") as f:
+            json.dump(report, f, indent=2)
+        return csv_path, json_path
+
+
+# Shared by the game loop and the simulation
+PROFILER = FrameProfiler()
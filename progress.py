@@ -0,0 +1,184 @@
+# Lap progress: the track path split into ordered sectors, with a lookup grid from any pixel to its sector
+import numpy as np  # NumPy for the lookup grid and the per-car progress arrays
+
+# Lookup grid cell size at 1920 px wide; it grows with the screen, so the grid has the same size at every resolution
+SECTOR_CELL_PX = 8
+
+# Most sectors a car may advance (or fall back) between two updates whatever their length. A bigger jump
+# still counts when the sectors it skips are shorter together than a car can drive between two updates
+# (RaceProgress's max_step); otherwise it is a shortcut, or a misread across the grass, and is ignored.
+MAX_SECTOR_SKIP = 2
+
+# Cell-sector pairs measured at once while the lookup grid is built
+PROJECT_CHUNK = 1 << 20
+
+
+# Define a class mapping track pixels to sectors of the closed path, starting at the finish line
+class SectorMap:
+    def __init__(self, path, finish, width, height, scale=1.0):
+        points = np.array(path, dtype=np.float64)
+        self.set_checkpoints(self.start_at(points, np.array(finish, dtype=np.float64)))
+
+        # Nearest sector and lap distance for the centre of every grid cell
+        self.cell = SECTOR_CELL_PX * scale
+        columns, rows = int(np.ceil(width / self.cell)), int(np.ceil(height / self.cell))
+        centers_x, centers_y = np.meshgrid((np.arange(columns) + 0.5) * self.cell, (np.arange(rows) + 0.5) * self.cell)
+        # About PROJECT_CHUNK cell-sector pairs at a time, so a path of many sectors never needs one huge matrix
+        x, y = centers_x.ravel(), centers_y.ravel()
+        chunk = max(1, PROJECT_CHUNK // self.count)
+        parts = [self.project(x[i:i + chunk], y[i:i + chunk]) for i in range(0, len(x), chunk)]
+        sectors, distances = np.concatenate([part[0] for part in parts]), np.concatenate([part[1] for part in parts])
+        self.sector_grid = sectors.reshape(rows, columns).astype(np.int16)
+        self.distance_grid = distances.reshape(rows, columns).astype(np.float32)
+
+    # Rebuild a map from the checkpoints and grids of a built one, e.g. read back from a track bundle
+    @classmethod
+    def from_grids(cls, checkpoints, cell, sector_grid, distance_grid):
+        sectors = cls.__new__(cls)
+        sectors.set_checkpoints(checkpoints)
+        sectors.cell, sectors.sector_grid, sectors.distance_grid = cell, sector_grid, distance_grid
+        return sectors
+
+    # Sector boundaries and lap length of the path through `checkpoints`
+    def set_checkpoints(self, checkpoints):
+        self.checkpoints = checkpoints
+        ends = np.roll(checkpoints, -1, axis=0)
+        lengths = np.hypot(*(ends - checkpoints).T)
+        self.count = len(checkpoints)  # One sector per path segment
+        self.sector_start = np.concatenate([[0.0], np.cumsum(lengths)[:-1]])  # Lap distance where each sector begins
+        self.sector_end = self.sector_start + lengths
+        self.lap_length = float(lengths.sum())
+
+    # Rotate the closed path so it starts at the projection of the finish line onto it
+    @staticmethod
+    def start_at(points, finish):
+        ends = np.roll(points, -1, axis=0)
+        segment = ends - points
+        t = np.clip(((finish - points) * segment).sum(axis=1) / (segment * segment).sum(axis=1), 0, 1)
+        nearest = points + segment * t[:, None]
+        i = int(np.argmin(np.hypot(*(nearest - finish).T)))
+        checkpoints = np.vstack([nearest[i], points[i + 1:], points[:i + 1]])
+        length = np.hypot(*(np.roll(checkpoints, -1, axis=0) - checkpoints).T)
+        return checkpoints[length > 0]  # The finish line can project onto a path point
+
+    # Nearest sector of each point and the lap distance of its projection onto the path
+    def project(self, x, y):
+        starts = self.checkpoints
+        segment = np.roll(starts, -1, axis=0) - starts
+        relative_x = x[:, None] - starts[:, 0]
+        relative_y = y[:, None] - starts[:, 1]
+        t = np.clip((relative_x * segment[:, 0] + relative_y * segment[:, 1]) / (segment * segment).sum(axis=1), 0, 1)
+        distance = np.hypot(relative_x - segment[:, 0] * t, relative_y - segment[:, 1] * t)
+        sector = np.argmin(distance, axis=1)
+        along = self.sector_start[sector] + t[np.arange(len(x)), sector] * (self.sector_end - self.sector_start)[sector]
+        return sector, along
+
+    # Sector of each screen point and its lap distance from the finish line, in constant time per point
+    def lookup(self, x, y):
+        rows, columns = self.sector_grid.shape
+        column = np.minimum(np.maximum(np.asarray(x) // self.cell, 0), columns - 1).astype(np.intp)
+        row = np.minimum(np.maximum(np.asarray(y) // self.cell, 0), rows - 1).astype(np.intp)
+        return self.sector_grid[row, column], self.distance_grid[row, column]
+
+
+# Define a class tracking laps, sectors and split times of a whole field of cars at once. `max_step` is the
+# farthest a car can drive between two updates; a lookup cell is added, which a reading can be off by.
+class RaceProgress:
+    def __init__(self, sectors, count, max_step=0.0):
+        self.sectors = sectors
+        self.count = count
+        self.max_skip = max_step + sectors.cell  # Longest stretch of skipped sectors a car can drive past
+        self.sector = np.zeros(count, dtype=np.int64)
+        self.laps = np.zeros(count, dtype=np.int64)  # Net forward crossings of the finish line
+        self.best_laps = np.zeros(count, dtype=np.int64)
+        self.distance = np.zeros(count)  # Lap distance from the finish line
+        self.sector_ticks = np.full((count, sectors.count), -1, dtype=np.int64)  # Tick each sector was entered this lap
+
+    # Start every car from its current position, with no laps done
+    def reset(self, x, y, tick=0):
+        sector, distance = self.sectors.lookup(x, y)
+        self.sector[:] = sector
+        self.laps[:] = 0
+        self.best_laps[:] = 0
+        self.sector_ticks[:] = -1
+        self.sector_ticks[np.arange(self.count), self.sector] = tick
+        self.update_bounds()
+        self.distance[:] = self.clamp_to_sector(distance)
+
+    # Lap distances where the current sector of every car starts and ends; they only change with the sectors
+    def update_bounds(self):
+        self.sector_low = self.sectors.sector_start[self.sector]
+        self.sector_high = self.sectors.sector_end[self.sector]
+
+    # Keep lap distances within each car's current sector, so a misread cell cannot move a car far
+    def clamp_to_sector(self, distance):
+        return np.minimum(np.maximum(distance, self.sector_low), self.sector_high)
+
+    # Move every car to the sector under its position and return the indices of the cars that
+    # just finished a lap they had not completed before. Laps only change when a car changes sector,
+    # which it does on few ticks, so the other ticks only clamp the lap distances.
+    def update(self, x, y, tick):
+        count = self.sectors.count
+        sector, distance = self.sectors.lookup(x, y)
+        if not (sector != self.sector).any():
+            self.distance = self.clamp_to_sector(distance)
+            return []
+
+        delta = (sector - self.sector + count // 2) % count - count // 2  # Signed sector change, wrapping around the lap
+        forward = (delta >= 1) & ((delta <= MAX_SECTOR_SKIP) | (self.skipped(self.sector, sector) <= self.max_skip))
+        backward = (delta <= -1) & ((delta >= -MAX_SECTOR_SKIP) | (self.skipped(sector, self.sector) <= self.max_skip))
+
+        if forward.any() or backward.any():
+            # Crossing the finish line forwards counts a lap, crossing it backwards takes one away
+            previous = self.sector
+            crossed = forward & (sector < previous)
+            self.laps += crossed
+            self.laps -= backward & (sector > previous)
+
+            self.sector = np.where(forward | backward, sector, previous)
+            self.sector_ticks[crossed] = -1  # A new lap starts with no splits
+            entered = np.flatnonzero(forward)
+            self.sector_ticks[entered, self.sector[entered]] = tick
+            # Sectors driven past within one update are entered in order on the same tick, so the splits of
+            # the lap stay complete
+            for car in np.flatnonzero(forward & (delta > 1)):
+                passed = (previous[car] + np.arange(1, delta[car])) % count
+                self.sector_ticks[car, passed[passed < sector[car]] if crossed[car] else passed] = tick
+            self.update_bounds()
+        self.distance = self.clamp_to_sector(distance)
+
+        finished = np.flatnonzero(self.laps > self.best_laps).tolist()
+        if finished:
+            self.best_laps = np.maximum(self.best_laps, self.laps)
+        return finished
+
+    # Lap distance between the end of sectors `after` and the start of sectors `before`: the length of the
+    # sectors in between, wrapping around the lap
+    def skipped(self, after, before):
+        sectors = self.sectors
+        return (sectors.sector_start[before] - sectors.sector_end[after]) % sectors.lap_length
+
+    # Total distance every car has covered since the start, counting laps
+    def covered(self):
+        return self.laps * self.sectors.lap_length + self.distance
+
+    # Race position of every car (0 = leading): most laps first, then furthest along the lap
+    def ranking(self):
+        order = np.argsort(-self.covered(), kind="stable")
+        positions = np.empty(self.count, dtype=np.int64)
+        positions[order] = np.arange(self.count)
+        return positions
+
+    # Race position of one car (0 = leading), without ranking the whole field
+    def position(self, index):
+        covered = self.covered()
+        return int(np.count_nonzero(covered > covered[index]))
+
+    # Ticks car `index` took through each sector it has completed this lap, in lap order
+    def split_ticks(self, index):
+        entered = self.sector_ticks[index]
+        splits = []
+        for sector in range(self.sectors.count - 1):
+            if entered[sector] >= 0 and entered[sector + 1] >= 0:
+                splits.append(int(entered[sector + 1] - entered[sector]))
+        return splits
@@ -0,0 +1,98 @@
+# Racing line for the computer cars: the path points joined by a closed spline and sampled at
+# equal arc-length steps, so following it is a table lookup per tick
+import math  # Math module for mathematical operations
+import numpy as np  # NumPy for building the table and for whole-fleet queries
+
+# Spacing of the table and how far ahead of its projection a car aims, in pixels at 1920 px wide
+RACING_LINE_STEP_PX = 4
+LOOKAHEAD_PX = 40
+
+# How far along the line a car may get between two updates; a car knocked further than this
+# (by another car) catches up over the next ticks instead of skipping ahead
+SEARCH_AHEAD_PX = 48
+
+# Points sampled per path segment before resampling by arc length
+SPLINE_SAMPLES = 32
+
+
+# Points along a closed centripetal Catmull-Rom spline through `points`, which never overshoots
+# or loops between unevenly spaced points the way a uniform one can
+def catmull_rom(points, samples=SPLINE_SAMPLES):
+    p0, p1, p2, p3 = (np.roll(points, shift, axis=0) for shift in (1, 0, -1, -2))
+    t1 = np.sqrt(np.hypot(*(p1 - p0).T))[:, None]
+    t2 = t1 + np.sqrt(np.hypot(*(p2 - p1).T))[:, None]
+    t3 = t2 + np.sqrt(np.hypot(*(p3 - p2).T))[:, None]
+    t = t1 + (t2 - t1) * (np.arange(samples) / samples)  # One row of parameters per segment
+
+    # Barry and Goldman's pyramid, for every segment and sample at once
+    def lerp(a, b, start, end):
+        weight = ((t - start) / (end - start))[..., None]
+        return a[:, None] + (b - a)[:, None] * weight
+
+    a1 = lerp(p0, p1, 0, t1)
+    a2 = lerp(p1, p2, t1, t2)
+    a3 = lerp(p2, p3, t2, t3)
+    weight = ((t - 0) / t2)[..., None]
+    b1 = a1 + (a2 - a1) * weight
+    weight = ((t - t1) / (t3 - t1))[..., None]
+    b2 = a2 + (a3 - a2) * weight
+    weight = ((t - t1) / (t2 - t1))[..., None]
+    return (b1 + (b2 - b1) * weight).reshape(-1, 2)
+
+
+# Define a class holding the racing line as a table of points every `step` pixels of arc length,
+# through the path points moved by `offset`
+class RacingLine:
+    def __init__(self, path, scale=1.0, offset=(0, 0)):
+        points = np.array(path, dtype=np.float64) + offset
+        points = points[np.hypot(*(np.roll(points, -1, axis=0) - points).T) > 0]  # Scaled paths can repeat points
+        curve = catmull_rom(points)
+
+        # Arc length at every spline sample, then the table at equal steps of it
+        closed = np.vstack([curve, curve[:1]])
+        travelled = np.concatenate([[0.0], np.cumsum(np.hypot(*np.diff(closed, axis=0).T))])
+        self.length = float(travelled[-1])
+        self.count = max(3, int(self.length // (RACING_LINE_STEP_PX * scale)))
+        self.step = self.length / self.count
+        arc = np.arange(self.count) * self.step
+        self.x = np.interp(arc, travelled, closed[:, 0])
+        self.y = np.interp(arc, travelled, closed[:, 1])
+
+        self.lookahead = max(1, round(LOOKAHEAD_PX * scale / self.step))  # In table entries
+        self.search = max(2, round(SEARCH_AHEAD_PX * scale / self.step))
+        self.points = list(zip(self.x.tolist(), self.y.tolist()))  # For single-car queries, cheaper than NumPy
+
+    # Table entry nearest to each point, searching the whole line or only the entries from `start` to `stop`
+    def nearest(self, x, y, start=0, stop=None):
+        stop = self.count if stop is None else stop
+        entries = np.arange(start, stop)
+        distance = np.hypot(self.x[entries % self.count] - np.asarray(x, np.float64)[..., None],
+                            self.y[entries % self.count] - np.asarray(y, np.float64)[..., None])
+        return entries[np.argmin(distance, axis=-1)]
+
+    # Progress (a table entry, counting on past the end of a lap) of a car at (x, y) that was at
+    # `progress` before: the nearest entry a little way ahead, never going back
+    def advance(self, progress, x, y):
+        points, count = self.points, self.count
+        best, best_distance = progress, math.inf
+        for entry in range(progress, progress + self.search + 1):
+            point_x, point_y = points[entry % count]
+            distance = (point_x - x) ** 2 + (point_y - y) ** 2
+            if distance < best_distance:
+                best, best_distance = entry, distance
+        return best
+
+    # advance() for many cars at once
+    def advance_many(self, progress, x, y):
+        entries = progress[:, None] + np.arange(self.search + 1)
+        distance = np.hypot(self.x[entries % self.count] - x[:, None], self.y[entries % self.count] - y[:, None])
+        return entries[np.arange(len(progress)), np.argmin(distance, axis=1)]
+
+    # Point the car at `progress` steers towards
+    def target(self, progress):
+        return self.points[(progress + self.lookahead) % self.count]
+
+    # target() for many cars at once
+    def targets(self, progress):
+        entries = (progress + self.lookahead) % self.count
+        return self.x[entries], self.y[entries]
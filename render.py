@@ -0,0 +1,69 @@
+# Rendering helpers for the race screen
+import pygame
+
+
+# Define a class that composites the static track layers into one display-format surface
+class StaticBackground:
+    def __init__(self, images, color=(0, 0, 0)):
+        self.images = images
+        self.color = color
+        self.surface = None
+
+    # Composite all layers once for the window's current size and pixel format
+    def build(self, win):
+        surface = pygame.Surface(win.get_size()).convert(win)
+        surface.fill(self.color)
+        for img, pos in self.images:
+            # Match the display format first so every blit is a straight copy or a fast alpha blend
+            img = img.convert_alpha(win) if img.get_flags() & pygame.SRCALPHA else img.convert(win)
+            surface.blit(img, pos)
+        self.surface = surface
+
+    # Replace the layers, e.g. after the track was rebuilt for a new resolution
+    def set_images(self, images):
+        self.images = images
+        self.surface = None
+
+    # Draw the background with a single blit, rebuilding it if the window size changed
+    def draw(self, win):
+        if self.surface is None or self.surface.get_size() != win.get_size():
+            self.build(win)
+        win.blit(self.surface, (0, 0))
+
+
+# Define a class that repaints and flips only the parts of the window that changed
+class DirtyRectRenderer:
+    def __init__(self, background, enabled=True):
+        self.background = background
+        self.enabled = enabled
+        self.previous_rects = []
+        self.full_repaint = True
+
+    # Repaint and flip the whole window on the next frame, e.g. after an overlay or level change
+    def invalidate(self):
+        self.full_repaint = True
+
+    # Start a frame: restore the background under everything drawn in the previous frame
+    def begin(self, win):
+        background = self.background
+        if background.surface is None or background.surface.get_size() != win.get_size():
+            self.full_repaint = True
+        if self.full_repaint or not self.enabled:
+            background.draw(win)
+        else:
+            for rect in self.previous_rects:
+                win.blit(background.surface, rect, rect)
+
+    # Finish a frame: flip the old and new bounding rects of everything drawn in it
+    def end(self, rects):
+        if self.full_repaint or not self.enabled:
+            pygame.display.update()
+        else:
+            pygame.display.update(self.previous_rects + rects)
+        self.previous_rects = rects
+        self.full_repaint = False
+
+    # Flip a rect drawn over the finished frame, e.g. a message, and restore the background under it next frame
+    def overlay(self, rect):
+        pygame.display.update(rect)
+        self.previous_rects.append(rect)
@@ -0,0 +1,412 @@
+# Replays: every physics tick of a race (controls and the poses of the player and computer cars)
+# in a compact binary file, written on a background thread and read back through a memory map
+import argparse  # Command line parsing
+import json  # JSON index of the best laps
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+from collections import namedtuple
+from simulation import Controls, LEVEL_COMPLETE, LOST, GAME_WON, PHYSICS_HZ
+from utils import rotation_cache, ROTATION_STEP, ROTATION_CACHE_MAX_BYTES  # Rotations of the ghost car
+from trackbundle import DEFAULT_TRACK  # Track of replays recorded before tracks were named
+
+REPLAY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "replays")
+
+# File layout: header, then one record per tick, then (once the file is closed) the offsets of the
+# keyframes and a trailer. A keyframe holds the full state and starts every KEYFRAME_INTERVAL ticks;
+# the ticks in between store each pose as the step from the tick before, with every position
+# rounded against the last keyframe so the error never builds up. A step that does not fit, e.g.
+# when the cars are put back on the grid, is stored as an extra keyframe.
+MAGIC = b"RGREPLAY"
+VERSION = 2
+# Header fields: magic, version, screen size, physics rate, keyframe interval, sponsor image, username, track
+HEADER = struct.Struct("<8sHHHHH32s32s16s")
+# Version 1 headers have no track field; those races were all driven on the default track
+HEADER_V1 = struct.Struct("<8sHHHHH32s32s")
+# Record fields: flags, then level, level ticks and the six poses (keyframe) or six steps (delta)
+KEYFRAME = struct.Struct("<BBI6f")
+DELTA = struct.Struct("<B6b")
+# Trailer fields: magic, frame count, keyframe offset count
+TRAILER = struct.Struct("<8sII")
+TRAILER_MAGIC = b"RGRINDEX"
+
+KEYFRAME_INTERVAL = 120  # One second of physics ticks
+FLUSH_BYTES = 64 * 1024  # About a minute of racing per background write
+
+# Step sizes of the delta records: 1/16 px and 1/16 degree, so a car can move up to 8 px and
+# turn up to 8 degrees per tick without a keyframe
+POSITION_UNIT = 1 / 16
+ANGLE_UNIT = 1 / 16
+UNITS = (POSITION_UNIT, POSITION_UNIT, ANGLE_UNIT) * 2
+
+# Flag bits: the four controls in bits 0-3, keyframe, and the event code in bits 5-6
+KEYFRAME_BIT = 0x10
+EVENT_SHIFT = 5
+EVENTS = (None, LEVEL_COMPLETE, LOST, GAME_WON)
+
+# One tick of a replay: the controls, the event it ended with, and each car's (x, y, angle)
+ReplayFrame = namedtuple("ReplayFrame", ["controls", "event", "level", "level_ticks", "player", "computer"])
+
+
+# Define a class that runs file writes in order on one daemon thread, so the game loop never waits for the disk
+class BackgroundWriter:
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    # Queue `function(*args)`, starting the thread on first use
+    def submit(self, function, *args):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="replay-writer", daemon=True)
+                self.thread.start()
+        self.jobs.put((function, args))
+
+    def _run(self):
+        while True:
+            function, args = self.jobs.get()
+            try:
+                function(*args)
+            except OSError:
+                pass  # A full or read-only disk only costs the replay
+            finally:
+                self.jobs.task_done()
+
+    # Block until every queued write is done, e.g. before the game exits
+    def wait(self):
+        self.jobs.join()
+
+
+# Shared by every replay and ghost file
+WRITER = BackgroundWriter()
+
+
+# Pack a string into a fixed-size header field
+def _text(value, size=32):
+    return value.encode("utf-8")[:size]
+
+
+# Define a class that encodes frames and appends them to a replay file
+class ReplayWriter:
+    def __init__(self, path, width, height, physics_hz, sponsor="", username="", background=True, track=DEFAULT_TRACK):
+        self.background = background
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.file = open(path, "wb")
+        self.buffer = bytearray(HEADER.pack(MAGIC, VERSION, width, height, physics_hz, KEYFRAME_INTERVAL,
+                                            _text(sponsor), _text(username), _text(track, 16)))
+        self.offset = len(self.buffer)  # File offset of the next record
+        self.frames = 0
+        self.keyframes = []  # Offsets of the keyframes that start every interval
+        self.last = None  # (level, ticks, keyframe poses, steps since the keyframe) of the previous frame
+
+    # Append one frame, as a step from the previous one when it fits
+    def write(self, frame):
+        flags = sum(bit for bit, pressed in zip((1, 2, 4, 8), frame.controls) if pressed)
+        flags |= EVENTS.index(frame.event) << EVENT_SHIFT
+        poses = frame.player + frame.computer
+
+        steps = None
+        last = self.last
+        if self.frames % KEYFRAME_INTERVAL and last[0] == frame.level and last[1] + 1 == frame.level_ticks:
+            totals = [round((value - base) / unit) for value, base, unit in zip(poses, last[2], UNITS)]
+            steps = [total - previous for total, previous in zip(totals, last[3])]
+            if not all(-128 <= step <= 127 for step in steps):
+                steps = None
+
+        if steps is None:
+            if self.frames % KEYFRAME_INTERVAL == 0:
+                self.keyframes.append(self.offset)
+            record = KEYFRAME.pack(flags | KEYFRAME_BIT, frame.level, frame.level_ticks, *poses)
+            self.last = (frame.level, frame.level_ticks, KEYFRAME.unpack(record)[3:], (0,) * 6)  # Rounded to float32
+        else:
+            record = DELTA.pack(flags, *steps)
+            self.last = (frame.level, frame.level_ticks, last[2], totals)
+
+        self.buffer += record
+        self.offset += len(record)
+        self.frames += 1
+        if len(self.buffer) >= FLUSH_BYTES:
+            self.flush()
+
+    # Hand the buffered records to the writer thread
+    def flush(self):
+        if self.buffer:
+            self._write(self.file.write, bytes(self.buffer))
+            self.buffer.clear()
+
+    # Write the keyframe offsets and the trailer, then close the file
+    def close(self):
+        self.buffer += struct.pack(f"<{len(self.keyframes)}I", *self.keyframes)
+        self.buffer += TRAILER.pack(TRAILER_MAGIC, self.frames, len(self.keyframes))
+        self.flush()
+        self._write(self.file.close)
+
+    def _write(self, function, *args):
+        if self.background:
+            WRITER.submit(function, *args)
+        else:
+            function(*args)
+
+
+# Write a whole list of frames to `path` at once, replacing the file atomically
+def write_replay(path, frames, width, height, physics_hz, sponsor="", username="", track=DEFAULT_TRACK):
+    temporary = f"{path}.{os.getpid()}.tmp"
+    writer = ReplayWriter(temporary, width, height, physics_hz, sponsor, username, background=False, track=track)
+    for frame in frames:
+        writer.write(frame)
+    writer.close()
+    os.replace(temporary, path)
+
+
+# Define a class that reads a replay through a memory map and seeks to any frame from the nearest keyframe
+class Replay:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version = struct.unpack_from("<8sH", self.data)
+            header = HEADER_V1 if version == 1 else HEADER
+            (_, _, self.width, self.height, self.physics_hz, self.interval,
+             sponsor, username, *track) = header.unpack_from(self.data)
+        except struct.error:
+            magic = version = None
+        if magic != MAGIC or version not in (1, VERSION):
+            self.data.close()
+            raise ValueError(f"{path} is not a replay file")
+        self.header_size = header.size
+        self.sponsor = sponsor.rstrip(b"\0").decode("utf-8", "replace")
+        self.username = username.rstrip(b"\0").decode("utf-8", "replace")
+        self.track = track[0].rstrip(b"\0").decode("utf-8", "replace") if track else DEFAULT_TRACK
+        self.keyframes, self.frames = self.read_index()
+        self.cursor = None  # (index, offset of the next record, state, frame) of the last frame read
+
+    # Keyframe offsets and frame count from the trailer, or by scanning the records if the file
+    # was not closed (the game crashed or is still writing it)
+    def read_index(self):
+        data = self.data
+        if len(data) >= self.header_size + TRAILER.size:
+            magic, frames, count = TRAILER.unpack_from(data, len(data) - TRAILER.size)
+            start = len(data) - TRAILER.size - 4 * count
+            if magic == TRAILER_MAGIC and start >= self.header_size:
+                return list(struct.unpack_from(f"<{count}I", data, start)), frames
+
+        keyframes, frames, offset = [], 0, self.header_size
+        while offset < len(data):
+            size = KEYFRAME.size if data[offset] & KEYFRAME_BIT else DELTA.size
+            if offset + size > len(data):
+                break  # Cut off in the middle of a record
+            if frames % self.interval == 0:
+                keyframes.append(offset)
+            offset += size
+            frames += 1
+        return keyframes, frames
+
+    def __len__(self):
+        return self.frames
+
+    # Frame `index`, from the keyframe at or before it (or from the last frame read, if that is closer).
+    # The records on the way are only summed; just the last one is turned into a frame.
+    def frame(self, index):
+        if not 0 <= index < self.frames:
+            raise IndexError("replay frame out of range")
+        cursor = self.cursor
+        if cursor is not None and cursor[0] == index:
+            return cursor[3]
+        if cursor is not None and cursor[0] < index and cursor[0] // self.interval == index // self.interval:
+            current, offset, (level, level_ticks, poses, totals), _ = cursor
+            totals = list(totals)
+        else:
+            current, offset = index // self.interval * self.interval - 1, self.keyframes[index // self.interval]
+
+        data = self.data
+        while current < index:
+            flags = data[offset]
+            if flags & KEYFRAME_BIT:
+                _, level, level_ticks, *poses = KEYFRAME.unpack_from(data, offset)
+                totals = [0] * 6
+                offset += KEYFRAME.size
+            else:
+                for i, step in enumerate(DELTA.unpack_from(data, offset)[1:]):
+                    totals[i] += step
+                level_ticks += 1
+                offset += DELTA.size
+            current += 1
+
+        state = (level, level_ticks, poses, tuple(totals))
+        values = [base + total * unit for base, total, unit in zip(poses, totals, UNITS)]
+        controls = Controls(*(bool(flags & bit) for bit in (1, 2, 4, 8)))
+        frame = ReplayFrame(controls, EVENTS[flags >> EVENT_SHIFT & 3], level, level_ticks,
+                            tuple(values[:3]), tuple(values[3:]))
+        self.cursor = (current, offset, state, frame)
+        return frame
+
+    __getitem__ = frame
+
+    def __iter__(self):
+        return (self.frame(index) for index in range(self.frames))
+
+    def close(self):
+        self.data.close()
+
+
+# Define a class keeping the fastest lap of every level of a track and the ghost file it was driven in
+class BestLaps:
+    def __init__(self, directory=REPLAY_DIR, track=DEFAULT_TRACK):
+        self.directory = directory
+        self.track = track
+        # The default track keeps the names from before there were other tracks
+        self.suffix = "" if track == DEFAULT_TRACK else f"-{track}"
+        self.path = os.path.join(directory, f"best_laps{self.suffix}.json")
+        try:
+            with open(self.path) as f:
+                self.laps = {int(level): ticks for level, ticks in json.load(f).items()}
+        except (OSError, ValueError):
+            self.laps = {}
+
+    def ghost_path(self, level):
+        return os.path.join(self.directory, f"ghost{self.suffix}-level-{level:02d}.replay")
+
+    # Check whether a lap of `ticks` beats the best of its level
+    def improves(self, level, ticks):
+        return level not in self.laps or ticks < self.laps[level]
+
+    # Store a new best lap and its frames as the level's ghost, on the writer thread
+    def save(self, level, frames, width, height, physics_hz, sponsor="", username=""):
+        self.laps[level] = len(frames)
+        laps = dict(self.laps)
+        WRITER.submit(write_replay, self.ghost_path(level), frames, width, height, physics_hz, sponsor, username,
+                      self.track)
+        WRITER.submit(self._write_index, laps)
+
+    def _write_index(self, laps):
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as f:
+            json.dump({str(level): ticks for level, ticks in sorted(laps.items())}, f)
+        os.replace(temporary, self.path)
+
+    # The best lap of a level as a Replay, or None if there is none (or it cannot be read)
+    def ghost(self, level):
+        try:
+            return Replay(self.ghost_path(level))
+        except (OSError, ValueError):
+            return None
+
+
+# Define a class that records a Simulation tick by tick and keeps the best lap of every level
+class Recorder:
+    def __init__(self, simulation, username="", sponsor_name="", directory=REPLAY_DIR, physics_hz=PHYSICS_HZ,
+                 best_laps=None):
+        self.simulation = simulation
+        self.username = username
+        self.sponsor_name = sponsor_name
+        self.physics_hz = physics_hz
+        self.best_laps = best_laps or BestLaps(directory, simulation.track.name)
+
+        # One file per race, named after the time it started
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        self.path = os.path.join(directory, f"{stamp}.replay")
+        suffix = 1
+        while os.path.exists(self.path):
+            suffix += 1
+            self.path = os.path.join(directory, f"{stamp}-{suffix}.replay")
+        track = simulation.track
+        self.writer = ReplayWriter(self.path, track.width, track.height, physics_hz, sponsor_name, username,
+                                   track=track.name)
+        self.lap = []  # Frames of the level being driven
+        self.lap_level = None
+
+    # Record the tick the simulation just ran with `controls`, which ended with `event`
+    def record(self, controls, event):
+        simulation = self.simulation
+        game_info, player_car, computer_car = simulation.game_info, simulation.player_car, simulation.computer_car
+        frame = ReplayFrame(controls, event, game_info.level, game_info.level_ticks,
+                            (player_car.x, player_car.y, player_car.angle),
+                            (computer_car.x, computer_car.y, computer_car.angle))
+        self.writer.write(frame)
+
+        if event is None:
+            if game_info.level_ticks == 1:
+                self.lap, self.lap_level = [], game_info.level
+            if self.lap_level is not None:
+                self.lap.append(frame)
+            return
+
+        # The event tick already put the cars back on the grid, so the lap ends with the tick before it
+        if event in (LEVEL_COMPLETE, GAME_WON) and self.lap and self.best_laps.improves(self.lap_level, len(self.lap)):
+            track = simulation.track
+            self.best_laps.save(self.lap_level, self.lap, track.width, track.height, self.physics_hz,
+                                self.sponsor_name, self.username)
+        self.lap, self.lap_level = [], None
+
+    # Finish the replay file; with `wait`, block until it and any ghosts are on disk
+    def close(self, wait=False):
+        self.writer.close()
+        if wait:
+            WRITER.wait()
+
+
+# Define a class that draws a see-through car along a recorded lap, in step with the live race
+class GhostCar:
+    ALPHA = 110
+
+    def __init__(self, img, width):
+        self.width = width  # Screen width, to scale laps recorded at another resolution
+        self.rotations = rotation_cache(img, ROTATION_STEP, ROTATION_CACHE_MAX_BYTES, self.ALPHA)
+        self.lap = None
+        self.scale = 1.0
+
+    # Follow a lap (a Replay), or nothing
+    def set_lap(self, lap):
+        if self.lap is not None:
+            self.lap.close()
+        self.lap = lap
+        self.scale = self.width / lap.width if lap is not None else 1.0
+
+    # Draw the ghost where the lap was `level_ticks` ticks in, `alpha` of the way from the tick before,
+    # and return the rect it covers (None once the lap is over)
+    def draw(self, win, level_ticks, alpha=1.0):
+        lap = self.lap
+        if lap is None or level_ticks > len(lap):
+            return None
+        previous = lap.frame(max(level_ticks - 2, 0)).player
+        current = lap.frame(max(level_ticks - 1, 0)).player
+        x, y, angle = (before + (after - before) * alpha for before, after in zip(previous, current))
+        return self.rotations.blit(win, (x * self.scale, y * self.scale), angle)[1]
+
+
+# Print a short summary of replay files, or play one back
+def main():
+    parser = argparse.ArgumentParser(description="Show what is in replay files.")
+    parser.add_argument("paths", nargs="*", help="replay files (default: every replay in replays/)")
+    parser.add_argument("--watch", action="store_true", help="play the first replay back in a window")
+    args = parser.parse_args()
+    paths = args.paths
+    if not paths and os.path.isdir(REPLAY_DIR):
+        paths = sorted(os.path.join(REPLAY_DIR, name) for name in os.listdir(REPLAY_DIR) if name.endswith(".replay"))
+
+    if args.watch and paths:
+        from main import watch_replay  # Only the player needs the game's rendering
+        watch_replay(paths[0])
+        return
+
+    for path in paths:
+        try:
+            replay = Replay(path)
+        except (OSError, ValueError) as error:
+            print(f"{path}: {error}")
+            continue
+        levels = sorted({frame.level for frame in replay}) if len(replay) else []
+        seconds = len(replay) / replay.physics_hz
+        size = os.path.getsize(path)
+        print(f"{os.path.basename(path)}: {replay.username or '-'} in {replay.sponsor or '-'} on {replay.track}, "
+              f"{replay.width}x{replay.height}, {len(replay)} ticks ({seconds:.1f} s), levels {levels}, "
+              f"{size / 1024:.1f} KiB ({size / max(seconds, 1 / replay.physics_hz) / 1024:.2f} KiB/s)")
+        replay.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+# Screens of the game as scenes run by one frame loop: each frame the current scene handles the events,
+# moves on by the frame time and draws itself, so no screen ever blocks the window with a loop or a sleep
+import heapq
+import itertools
+import time
+import pygame  # Pygame library for the clock and the events
+from profiler import PROFILER  # Per-frame phase timings
+from inputs import real_clock  # Default time source
+
+UNFOCUSED_FPS = 10  # Frame rate cap of animated scenes while the window does not have the focus
+MIN_FPS = 10  # Lowest frame rate the CPU target may bring an animated scene down to
+PACING_WINDOW = 1.0  # Seconds of frames the CPU usage is measured over before the frame rate is adapted
+
+
+# Define the base class of a scene. `fps` caps the frame rate while it is shown.
+# Static scenes only change on input or timers: the manager sleeps until an event or a timer comes and
+# draws them only while `dirty` is set. Every event but mouse motion, and every timer, sets it; scenes
+# with hover highlights set it themselves when the highlight changes.
+class Scene:
+    fps = 60
+    static = False
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.dirty = True
+
+    # Called when the scene becomes the current one
+    def enter(self):
+        pass
+
+    def handle_event(self, event):
+        pass
+
+    # Move on by `dt` seconds
+    def update(self, dt):
+        pass
+
+    def draw(self):
+        pass
+
+
+# Define a class choosing the frame rate cap of animated scenes: the scene's own cap, never above `max_fps`,
+# at most UNFOCUSED_FPS while the window is in the background, and lowered further while the process uses
+# more than `cpu_target` of one core (e.g. 0.5), measured with process_time over PACING_WINDOW
+class FramePacer:
+    def __init__(self, max_fps=None, cpu_target=None, min_fps=MIN_FPS):
+        self.max_fps = max_fps
+        self.cpu_target = cpu_target
+        self.min_fps = min_fps
+        self.scale = 1.0  # Share of the cap the CPU target currently allows
+        self.usage = None  # CPU share of the last measured window
+        self.window_start = None  # (wall time, CPU time) at the start of the current window
+
+    # Frame rate cap for a scene capped at `fps`
+    def fps(self, fps, focused=True):
+        if self.max_fps is not None:
+            fps = min(fps, self.max_fps)
+        if not focused:
+            fps = min(fps, UNFOCUSED_FPS)
+        return max(min(fps, self.min_fps), fps * self.scale)
+
+    # Count one frame; adapts the scale once a window of frames is complete
+    def measure(self):
+        wall, cpu = time.perf_counter(), time.process_time()
+        if self.window_start is None:
+            self.window_start = (wall, cpu)
+            return
+        start_wall, start_cpu = self.window_start
+        if wall - start_wall < PACING_WINDOW:
+            return
+        self.window_start = (wall, cpu)
+        self.usage = (cpu - start_cpu) / (wall - start_wall)
+        if self.cpu_target is None:
+            return
+        if self.usage > self.cpu_target:
+            # The work per frame is roughly constant, so the usage scales with the frame rate
+            self.scale = max(0.05, self.scale * self.cpu_target / self.usage)
+        elif self.usage < self.cpu_target * 0.8:
+            self.scale = min(1.0, self.scale * 1.1)
+
+    # Stop measuring, e.g. while the manager sleeps on a static scene
+    def pause(self):
+        self.window_start = None
+
+
+# Define a class running the current scene in a single frame loop, with timers that fire between frames
+class SceneManager:
+    def __init__(self, time_source=real_clock, max_fps=None, cpu_target=None):
+        self.time_source = time_source
+        self.clock = pygame.time.Clock()
+        self.pacer = FramePacer(max_fps, cpu_target)
+        self.focused = True
+        self.scene = None
+        self.running = False
+        self.timers = []  # Heap of (due time, order, callback) for the current scene
+        self.order = itertools.count()
+        self.exit_callbacks = []
+        self.now = 0.0
+
+    # Make `scene` the current scene from the next frame on. Timers of the previous scene are dropped.
+    def switch(self, scene):
+        self.scene = scene
+        self.timers = []
+        scene.dirty = True
+        scene.enter()
+
+    # Call `callback` after `seconds`, unless the scene changes first
+    def after(self, seconds, callback):
+        heapq.heappush(self.timers, (self.now + seconds, next(self.order), callback))
+
+    # Call `callback` when the loop ends, e.g. to close files a scene opened
+    def on_exit(self, callback):
+        self.exit_callbacks.append(callback)
+
+    def quit(self):
+        self.running = False
+
+    # Wait for the next frame and return its events. Static scenes sleep in pygame.event.wait until an
+    # event comes or the next timer is due; a scripted time source cannot be slept on, so it gets frames.
+    def next_events(self, scene):
+        if not scene.static or self.time_source is not real_clock:
+            self.clock.tick(self.pacer.fps(scene.fps, self.focused))
+            self.pacer.measure()
+            return pygame.event.get()
+
+        self.pacer.pause()
+        if self.timers:
+            timeout = int((self.timers[0][0] - self.time_source()) * 1000) + 1
+            if timeout <= 0:
+                return pygame.event.get()
+            first = pygame.event.wait(timeout)
+        else:
+            first = pygame.event.wait()
+        events = pygame.event.get()
+        if first.type != pygame.NOEVENT:
+            events.insert(0, first)
+        # Restart the frame clock after the sleep, so the first frame after it does not count the idle time
+        self.clock.tick()
+        self.now = self.time_source()
+        return events
+
+    # Run frames from `scene` on until a scene quits or the window is closed
+    def run(self, scene):
+        self.running = True
+        self.now = self.time_source()
+        self.switch(scene)
+        while self.running:
+            events = self.next_events(self.scene)
+            PROFILER.mark("idle")
+
+            for event in events:
+                if event.type == pygame.QUIT:
+                    self.quit()
+                    break
+                if event.type == pygame.WINDOWFOCUSLOST:
+                    self.focused = False
+                elif event.type == pygame.WINDOWFOCUSGAINED:
+                    self.focused = True
+                scene = self.scene
+                scene.handle_event(event)
+                if event.type != pygame.MOUSEMOTION:
+                    scene.dirty = True
+            if not self.running:
+                break
+            PROFILER.mark("events")
+
+            now = self.time_source()
+            dt, self.now = now - self.now, now
+            while self.timers and self.timers[0][0] <= now:
+                heapq.heappop(self.timers)[2]()
+                self.scene.dirty = True
+            scene = self.scene
+            scene.update(dt)
+            if self.running and (scene.dirty or not scene.static):
+                scene.dirty = False
+                scene.draw()
+            PROFILER.end_frame()
+
+        for callback in self.exit_callbacks:
+            callback()
+        self.exit_callbacks = []
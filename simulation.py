@@ -0,0 +1,506 @@
+# Game state and physics, independent of any display surface
+import math  # Math module for mathematical operations
+import os  # Paths of the car images
+import numpy as np  # NumPy for the per-car progress arrays
+import struct  # Packing the race state for checksums
+import zlib  # CRC32 of the race state
+from collections import namedtuple
+from functools import lru_cache
+from utils import rotation_cache, ROTATION_STEP, ROTATION_CACHE_MAX_BYTES  # Pre-baked car rotations
+from spritecache import SPRITES  # Scaled images and masks kept on disk between runs
+from fleet import NpcFleet, grid_positions  # Batched computer cars for larger grids
+from distancefield import WallContact  # Wall contacts for collision response
+from collision import Body, CollisionWorld  # Broad phase for car-to-car tests
+from progress import RaceProgress  # Laps, positions and splits
+from racingline import RacingLine  # Spline through the path points for the computer cars
+from trackbundle import load_layout, DEFAULT_TRACK  # Compiled track images, masks, path and grids
+from profiler import PROFILER  # Phase timings, when profiling is on
+
+# Physics runs at a fixed tick rate, independent of the render frame rate.
+# Speeds, accelerations and turn rates are expressed per 1/BASE_HZ of a second.
+PHYSICS_HZ = 120
+BASE_HZ = 60
+TICK_SCALE = BASE_HZ / PHYSICS_HZ
+
+# Share of the speed into a wall that a car keeps, reversed, after hitting it head-on
+WALL_RESTITUTION = 0.5
+
+# Distance two touching cars are pushed apart per tick, and the collision grid cell size, at 1920 px wide
+CAR_PUSH = 1.0
+COLLISION_CELL = 128
+
+# Body kinds of the cars in the collision world
+CAR_KINDS = ("player", "computer", "fleet")
+
+# Level, level ticks, the player car's pose and speed, the computer car's pose, speed and racing line progress
+STATE = struct.Struct("<qq4d4dq")
+
+# Index of the player car in the race progress arrays; the computer car is 1 and the fleet follows
+PLAYER_INDEX = 0
+
+# Width and height of the screen car sizes and speeds were tuned on
+original_width, original_height = 1920, 1080
+
+# Events returned by a simulation step
+LOST = "lost"
+LEVEL_COMPLETE = "level_complete"
+GAME_WON = "game_won"
+
+# Driver input for one step, produced by the keyboard or by a scripted controller
+Controls = namedtuple("Controls", ["left", "right", "forward", "backward"], defaults=[False] * 4)
+
+
+# Car images, found from this file so the game runs from any working directory, and their scale factors
+CARS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "imgs", "cars")
+PLAYER_CAR_SCALE = 0.7
+NPC_CAR_IMAGE = "mclaren.png"
+NPC_CAR_SCALE = 0.8
+
+
+# Load a car image from imgs/cars and scale it, once per (filename, factor)
+@lru_cache(maxsize=None)
+def load_car_image(filename, factor):
+    return SPRITES.load(os.path.join(CARS_DIR, filename), factor)[0]
+
+
+# Define a class to hold the static track geometry for one screen resolution
+class Track:
+    def __init__(self, width, height, name=DEFAULT_TRACK):
+        self.width, self.height = width, height
+        self.name = name
+
+        # Images scaled to the screen with their collision masks and positions, the computer cars' path,
+        # the start positions, the signed distance field of the border (queried for wall collisions instead
+        # of the mask) and the sectors of the path for lap progress, all read from the track's bundle
+        layout = load_layout(name, width, height)
+        self.reference_width = layout.reference_size[0]  # Screen width the path was recorded on
+        self.grass, self.image, self.border, self.finish = layout.grass, layout.image, layout.border, layout.finish
+        self.border_mask, self.finish_mask = layout.border_mask, layout.finish_mask
+        self.grass_pos, self.track_pos, self.border_pos = layout.grass_pos, layout.track_pos, layout.border_pos
+        self.finish_pos = layout.finish_pos
+        self.border_field = layout.border_field
+        self.player_start, self.computer_start = layout.player_start, layout.computer_start
+        self.path = layout.path
+        self.sectors = layout.sectors
+        self.racing_lines = {}
+
+    # Smooth line through the path points, sampled by arc length, for the centre of a computer car of
+    # the given size. The points were placed for the car's top-left corner, so the line is shifted by half
+    # the car to keep the centre on the same route. Built once per car size.
+    def racing_line(self, car_size):
+        line = self.racing_lines.get(car_size)
+        if line is None:
+            offset = (car_size[0] / 2, car_size[1] / 2)
+            line = self.racing_lines[car_size] = RacingLine(self.path, self.width / self.reference_width, offset)
+        return line
+
+    # Static images in drawing order, with their positions
+    def images(self):
+        return [(self.grass, self.grass_pos), (self.image, self.track_pos),
+                (self.finish, self.finish_pos), (self.border, self.track_pos)]
+
+
+# Define a class to store game information
+class GameInfo:
+    LEVELS = 10  # Number of levels in the game
+    def __init__(self, level=1):
+        self.level = level
+        self.started = False
+        self.level_ticks = 0
+        self.position = 1  # Race position of the player car
+        self.cars = 1
+
+    # Move to the next level
+    def next_level(self):
+        self.level += 1
+        self.started = False
+
+    # Reset the game information
+    def reset(self):
+        self.level = 1
+        self.started = False
+        self.level_ticks = 0
+
+    # Check if the game is finished
+    def game_finished(self):
+        return self.level > self.LEVELS
+
+    # Start the current level
+    def start_level(self):
+        self.started = True
+        self.level_ticks = 0
+
+    # Count one physics tick of the current level
+    def tick(self):
+        if self.started:
+            self.level_ticks += 1
+
+    # Get the simulated time elapsed in the current level
+    def get_level_time(self):
+        if not self.started:
+            return 0
+        return round(self.level_ticks / PHYSICS_HZ)
+
+# Define an abstract class for cars
+class AbstractCar:
+    def __init__(self, max_vel, rotation_vel):
+        self.img = self.IMG
+        self.max_vel = max_vel
+        self.vel = 0
+        self.rotation_vel = rotation_vel
+        self.angle = 90
+        self.x, self.y = self.START_POS
+        self.prev_x, self.prev_y, self.prev_angle = self.x, self.y, self.angle
+        self.acceleration = 0.1
+        self.rotations = rotation_cache(self.img, ROTATION_STEP, ROTATION_CACHE_MAX_BYTES)
+        self.update_mask() # Update the mask initially
+        self.body = Body(self.KIND, self.mask_rect, self.mask, bump=self.bump)
+
+    # Rotate the car
+    def rotate(self, left=False, right=False):
+        if left:
+            self.angle += self.rotation_vel * TICK_SCALE
+        elif right:
+            self.angle -= self.rotation_vel * TICK_SCALE
+
+    # Update the collision mask of the car
+    def update_mask(self):
+        _, self.mask, self.mask_rect = self.rotations.lookup((self.x, self.y), self.angle)
+
+    # Remember the pose at the start of a physics tick, for render interpolation
+    def save_pose(self):
+        self.prev_x, self.prev_y, self.prev_angle = self.x, self.y, self.angle
+
+    # Draw the car on the window, `alpha` of the way from the previous tick's pose to the current one,
+    # and return the rect it covers
+    def draw(self, win, alpha=1.0):
+        x = self.prev_x + (self.x - self.prev_x) * alpha
+        y = self.prev_y + (self.y - self.prev_y) * alpha
+        angle = self.prev_angle + (self.angle - self.prev_angle) * alpha
+        return self.rotations.blit(win, (x, y), angle)[1]
+
+    # Move the car forward
+    def move_forward(self):
+        self.vel = min(self.vel + self.acceleration * TICK_SCALE, self.max_vel)
+        self.move()
+
+    # Move the car backward
+    def move_backward(self):
+        self.vel = max(self.vel - self.acceleration * TICK_SCALE, -self.max_vel/2)
+        self.move()
+
+    # Move the car based on its velocity and angle
+    def move(self):
+        radians = math.radians(self.angle)
+        vertical = math.cos(radians) * self.vel * TICK_SCALE
+        horizontal = math.sin(radians) * self.vel * TICK_SCALE
+
+        self.y -= vertical
+        self.x -= horizontal
+        self.update_mask() # Update the mask after rotation
+
+    # Check for collision between the car and an obstacle placed at (x, y)
+    def collide(self, mask, x=0, y=0):
+        offset_x = int(self.mask_rect.left - x)
+        offset_y = int(self.mask_rect.top - y)
+        poi = mask.overlap(self.mask, (offset_x, offset_y))
+        return poi
+
+    # Centres of the three circles covering the car (middle, front, back) and their radius
+    def footprint(self):
+        width, height = self.img.get_size()
+        radius = width / 2
+        radians = math.radians(self.angle)
+        heading_x, heading_y = -math.sin(radians), -math.cos(radians)
+        center_x, center_y = self.x + width / 2, self.y + height / 2
+        offset = max(height / 2 - radius, 0)
+        points = [(center_x + heading_x * t, center_y + heading_y * t) for t in (0, offset, -offset)]
+        return points, radius
+
+    # Get the deepest contact of the car with the walls of a distance field, or None
+    def wall_contact(self, field):
+        width, height = self.img.get_size()
+        if field.clear_of_walls(self.x + width / 2, self.y + height / 2, max(width, height) / 2):
+            return None  # Far from any wall, one lookup is enough
+        points, radius = self.footprint()
+        return field.contact(points, radius)
+
+    # Get pushed out of another car
+    def bump(self, contact):
+        self.x += contact.normal_x * contact.depth
+        self.y += contact.normal_y * contact.depth
+        self.update_mask()
+
+    # Reset the car position and attributes
+    def reset(self):
+        self.x, self.y = self.START_POS
+        self.angle = 90
+        self.vel = 0
+        self.save_pose()
+        self.update_mask()
+
+# Define the player car class
+class PlayerCar(AbstractCar):
+    KIND = "player"
+
+    def __init__(self, max_vel, rotation_vel, sponsor_name, track, start=None):
+        self.IMG = load_car_image(sponsor_name, PLAYER_CAR_SCALE)
+        self.START_POS = start or track.player_start
+        super().__init__(max_vel, rotation_vel)
+
+    # Reduce the speed of the player car
+    def reduce_speed(self):
+        self.vel = max(self.vel - self.acceleration / 2 * TICK_SCALE, 0)
+        self.move()
+
+    # Push the player car out of a wall and keep only the part of its speed along the wall,
+    # so glancing hits slide and head-on hits bounce back
+    def slide(self, contact):
+        self.x += contact.normal_x * contact.depth
+        self.y += contact.normal_y * contact.depth
+
+        radians = math.radians(self.angle)
+        into_wall = -math.sin(radians) * contact.normal_x - math.cos(radians) * contact.normal_y
+        if self.vel * into_wall < 0:
+            self.vel -= (1 + WALL_RESTITUTION) * self.vel * into_wall * into_wall
+        self.update_mask()
+
+    # Another car pushing the player car slows it down like a wall would
+    def bump(self, contact):
+        self.slide(contact)
+
+# Define the computer-controlled car class
+class ComputerCar(AbstractCar):
+    KIND = "computer"
+
+    def __init__(self, max_vel, rotation_vel, track, path=None):
+        self.IMG = load_car_image(NPC_CAR_IMAGE, NPC_CAR_SCALE)
+        self.START_POS = track.computer_start
+        super().__init__(max_vel, rotation_vel)
+        self.path = track.path if path is None else path
+        if path is None:
+            self.line = track.racing_line(self.img.get_size())
+        else:
+            self.line = RacingLine(path, track.width / track.reference_width, (self.img.get_width() / 2, self.img.get_height() / 2))
+        self.progress = int(self.line.nearest(*self.center()))  # Racing line entry the car has reached
+        self.vel = max_vel
+
+    # Centre of the car, the point that follows the racing line
+    def center(self):
+        return self.x + self.img.get_width() / 2, self.y + self.img.get_height() / 2
+
+    # Turn towards the point a little way ahead of the car on the racing line
+    def calculate_angle(self):
+        center_x, center_y = self.center()
+        target_x, target_y = self.line.target(self.progress)
+
+        # Cars move along (-sin(angle), -cos(angle)), so this is the heading that faces the target
+        desired_angle = math.degrees(math.atan2(center_x - target_x, center_y - target_y))
+        difference_in_angle = (desired_angle - self.angle + 180) % 360 - 180
+        self.angle += math.copysign(min(self.rotation_vel * TICK_SCALE, abs(difference_in_angle)), difference_in_angle)
+
+    # Move the progress along the racing line to the car's projection onto it
+    def update_path_point(self):
+        self.progress = self.line.advance(self.progress, *self.center())
+
+    # Move the car along the racing line
+    def move(self):
+        self.calculate_angle()
+        super().move()
+        self.update_path_point()
+
+    # Move to the next level
+    def next_level(self, level):
+        self.reset()
+        self.vel = self.max_vel + (level - 1) * 0.2
+        self.progress = int(self.line.nearest(*self.center()))
+
+# Apply one step of driver input to the player car
+def move_player(player_car, controls):
+    moved = False
+
+    if controls.left:
+        player_car.rotate(left=True)
+    if controls.right:
+        player_car.rotate(right=True)
+    if controls.forward:
+        moved = True
+        player_car.move_forward()
+    if controls.backward:
+        moved = True
+        player_car.move_backward()
+
+    if not moved:
+        player_car.reduce_speed()
+
+# Push the player car out of the track walls it touches, returning the contact (or None)
+def handle_wall_collision(player_car, track):
+    wall_contact = player_car.wall_contact(track.border_field)
+    if wall_contact is not None:
+        player_car.slide(wall_contact)
+    return wall_contact
+
+# Handle the cars that just completed a lap (RaceProgress indices), returning the resulting event (if any).
+# `rivals` maps the indices of other players' cars to the cars: a lap by any of the players completes
+# the level for all of them, a lap by a computer car loses it.
+def handle_finish(finished, player_car, computer_car, game_info, rivals=None):
+    rivals = rivals or {}
+    event = None
+
+    if any(index != PLAYER_INDEX and index not in rivals for index in finished):
+        event = LOST
+        game_info.reset()
+    elif finished:
+        event = LEVEL_COMPLETE
+        game_info.next_level()
+
+    if event is not None:
+        player_car.reset()
+        for car in rivals.values():
+            car.reset()
+        computer_car.next_level(game_info.level)
+
+    return event
+
+# Define a class holding the whole race state, stepped without any display
+class Simulation:
+    # grid_size is the number of computer cars; all but the first are driven as one NpcFleet.
+    # rivals are the car images of further player cars, driven by other players (see step); they
+    # start at the front of the grid, ahead of the fleet.
+    def __init__(self, track, sponsor_name, grid_size=1, rivals=()):
+        self.track = track
+        self.player_car = PlayerCar(7, 4, sponsor_name, track)
+        self.computer_car = ComputerCar(2, 4, track)
+        self.game_info = GameInfo()
+
+        self.rivals = []
+        npc_width, npc_height = self.computer_car.img.get_size()
+        for rival, x, y in zip(rivals, *grid_positions(track, npc_width, npc_height, len(rivals))):
+            width, height = load_car_image(rival, PLAYER_CAR_SCALE).get_size()
+            start = (float(x) + (npc_width - width) / 2, float(y) + (npc_height - height) / 2)
+            self.rivals.append(PlayerCar(7, 4, rival, track, start))
+
+        self.fleet = None
+        if grid_size > 1:
+            self.fleet = NpcFleet(grid_size - 1, self.computer_car.img, 2, 4, track,
+                                  ROTATION_STEP, ROTATION_CACHE_MAX_BYTES, skip=len(self.rivals))
+
+        # Cars in one collision world, so each car is only tested against its neighbours. Finishing is
+        # decided by the race progress, which needs no collision test.
+        scale = track.width / original_width
+        self.car_push = CAR_PUSH * scale
+        self.world = CollisionWorld(COLLISION_CELL * scale)
+        for car in [self.player_car, self.computer_car] + self.rivals:
+            self.world.add(car.body)
+        if self.fleet is not None:
+            for body in self.fleet.bodies:
+                self.world.add(body)
+
+        # Lap progress of the player, the computer car, the fleet and the rivals, in that order. No car is
+        # faster than the player cars, so none drives farther than their top speed in one tick.
+        self.first_rival = 2 + (self.fleet.count if self.fleet is not None else 0)
+        self.progress = RaceProgress(track.sectors, self.first_rival + len(self.rivals),
+                                     self.player_car.max_vel * TICK_SCALE)
+        self.rival_indices = {self.first_rival + i: car for i, car in enumerate(self.rivals)}
+        self.progress.reset(*self.car_centers())
+        self.game_info.cars = self.progress.count
+        self.wall_contact = None  # The player car's wall contact in the last tick
+        self.winner = None  # Progress index of the player who completed the last level
+
+    # Centres of all cars, in race progress order
+    def car_centers(self):
+        cars = (self.player_car, self.computer_car)
+        x = [car.x + car.img.get_width() / 2 for car in cars]
+        y = [car.y + car.img.get_height() / 2 for car in cars]
+        if self.fleet is not None or self.rivals:
+            fleet_x = self.fleet.x + self.fleet.width / 2 if self.fleet is not None else []
+            fleet_y = self.fleet.y + self.fleet.height / 2 if self.fleet is not None else []
+            return (np.concatenate([x, fleet_x, [car.x + car.img.get_width() / 2 for car in self.rivals]]),
+                    np.concatenate([y, fleet_y, [car.y + car.img.get_height() / 2 for car in self.rivals]]))
+        return np.array(x), np.array(y)
+
+    # CRC32 of everything that decides how the race goes on: car poses and speeds, the computer cars'
+    # racing line progress, sectors, laps, level and tick. Chained through `previous`, it checksums a whole run,
+    # so two runs match only if every tick of them matched bit for bit.
+    def checksum(self, previous=0):
+        player_car, computer_car, game_info = self.player_car, self.computer_car, self.game_info
+        crc = zlib.crc32(STATE.pack(game_info.level, game_info.level_ticks,
+                                    player_car.x, player_car.y, player_car.angle, player_car.vel,
+                                    computer_car.x, computer_car.y, computer_car.angle, computer_car.vel,
+                                    computer_car.progress), previous)
+        arrays = [self.progress.sector, self.progress.laps, self.progress.distance]
+        if self.fleet is not None:
+            arrays += [self.fleet.x, self.fleet.y, self.fleet.angle, self.fleet.vel, self.fleet.progress]
+        for array in arrays:
+            crc = zlib.crc32(array.astype(array.dtype.newbyteorder("<"), copy=False).tobytes(), crc)
+        for car in self.rivals:
+            crc = zlib.crc32(struct.pack("<4d", car.x, car.y, car.angle, car.vel), crc)
+        return crc
+
+    # Seconds the player car took through each sector it has completed in this level
+    def split_times(self):
+        return [ticks / PHYSICS_HZ for ticks in self.progress.split_ticks(PLAYER_INDEX)]
+
+    # Move every car's collision body to the car's current pose
+    def sync_bodies(self):
+        for car in [self.player_car, self.computer_car] + self.rivals:
+            self.world.move(car.body, car.mask_rect, car.mask)
+        if self.fleet is not None:
+            for body, (mask, rect) in zip(self.fleet.bodies, self.fleet.shapes()):
+                self.world.move(body, rect, mask)
+
+    # Push every pair of touching cars apart along the line between their centres
+    def push_cars_apart(self):
+        for a, b, _ in self.world.pairs(CAR_KINDS):
+            (a_x, a_y), (b_x, b_y) = a.rect.center, b.rect.center
+            distance = math.hypot(a_x - b_x, a_y - b_y)
+            normal_x, normal_y = ((a_x - b_x) / distance, (a_y - b_y) / distance) if distance else (1.0, 0.0)
+            a.bump(WallContact(self.car_push, normal_x, normal_y))
+            b.bump(WallContact(self.car_push, -normal_x, -normal_y))
+
+    # Advance the race by one physics tick and return the resulting event (if any).
+    # rival_controls holds the controls of each rival car; missing ones let the car roll.
+    def step(self, controls, rival_controls=()):
+        self.player_car.save_pose()
+        self.computer_car.save_pose()
+        self.game_info.tick()
+
+        move_player(self.player_car, controls)
+        for car, car_controls in zip(self.rivals, list(rival_controls) + [Controls()] * len(self.rivals)):
+            car.save_pose()
+            move_player(car, car_controls)
+        PROFILER.mark("move_player")
+        self.computer_car.move()
+        if self.fleet is not None:
+            self.fleet.save_pose()
+            self.fleet.move(TICK_SCALE)
+        PROFILER.mark("computer_move")
+
+        self.wall_contact = handle_wall_collision(self.player_car, self.track)
+        for car in self.rivals:
+            handle_wall_collision(car, self.track)
+        self.sync_bodies()
+
+        finished = self.progress.update(*self.car_centers(), self.game_info.level_ticks)
+        event = handle_finish(finished, self.player_car, self.computer_car, self.game_info, self.rival_indices)
+        if event == LEVEL_COMPLETE:
+            self.winner = finished[0]
+
+        if self.game_info.game_finished():
+            event = GAME_WON
+            self.game_info.reset()
+            self.player_car.reset()
+            for car in self.rivals:
+                car.reset()
+            self.computer_car.next_level(self.game_info.level)
+
+        if event is not None:
+            if self.fleet is not None:
+                self.fleet.next_level(self.game_info.level)
+            self.progress.reset(*self.car_centers())
+        else:
+            self.push_cars_apart()
+
+        self.game_info.position = self.progress.position(PLAYER_INDEX) + 1
+        PROFILER.mark("collision")
+        return event
@@ -0,0 +1,176 @@
+# Persistent on-disk cache of scaled images and their collision masks, so warm starts skip
+# all image scaling and mask building
+import hashlib
+import mmap
+import os
+import struct
+import zlib
+import numpy as np
+import pygame
+from utils import scale_image
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "sprites")
+
+# Entry layout: header, raw pixels (RGBA or RGB, row-major), then the mask as (y, x_start, x_end)
+# runs of set bits in int32. The CRC covers everything after the header.
+MAGIC = b"RGSPRITE"
+VERSION = 1
+# Header fields: magic, version, source sha1, resolution, factor, size, alpha, mask, colour key, run count, CRC
+HEADER = struct.Struct("<8sH20sIIdIIBBB3sII")
+RUN = np.dtype("<i4")
+
+
+# Define a class that stores prepared surfaces and masks under .cache/sprites
+class SpriteCache:
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = directory
+        self.digests = {}  # Source sha1 by (path, mtime, size), so each file is hashed once per run
+        self.hits = 0
+        self.misses = 0
+
+    # sha1 of the source file, recomputed only when the file changed on disk
+    def digest(self, path):
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        digest = self.digests.get(key)
+        if digest is None:
+            with open(path, "rb") as f:
+                digest = hashlib.sha1(f.read()).digest()
+            self.digests[key] = digest
+        return digest
+
+    # Entry file for one (source, resolution, factor), e.g. border2-3fa2c1e07b9d-3840x2160-x1.3333.sprite
+    def entry_path(self, path, digest, resolution, factor):
+        name = os.path.splitext(os.path.basename(path))[0]
+        resolution_tag = "%dx%d" % resolution if resolution else "any"
+        return os.path.join(self.directory, f"{name}-{digest.hex()[:12]}-{resolution_tag}-x{factor:.6g}.sprite")
+
+    # Get the image at `path` scaled by `factor` (and its mask if `mask` is set), from disk if
+    # it was prepared before. `resolution` is the screen size the factor was derived from.
+    def load(self, path, factor, resolution=None, mask=False):
+        digest = self.digest(path)
+        entry = self.entry_path(path, digest, resolution, factor)
+        cached = self.read(entry, digest, resolution, factor, mask)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        surface = pygame.image.load(path)
+        if factor != 1:
+            surface = scale_image(surface, factor)
+        surface_mask = pygame.mask.from_surface(surface) if mask else None
+        self.write(entry, digest, resolution, factor, surface, surface_mask)
+        return surface, surface_mask
+
+    # Read an entry through a temporary memory map, or return None (and delete the file) if it is missing,
+    # stale or corrupt. The pixels and mask runs are copied out, so the mapping and its file are closed.
+    def read(self, entry, digest, resolution, factor, mask):
+        try:
+            with open(entry, "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):  # ValueError: empty file
+            return None
+        with data:
+            return self.decode(data, entry, digest, resolution, factor, mask)
+
+    def decode(self, data, entry, digest, resolution, factor, mask):
+
+        try:
+            (magic, version, source_digest, res_w, res_h, entry_factor,
+             width, height, alpha, has_mask, has_colorkey, colorkey, runs, crc) = HEADER.unpack_from(data)
+        except struct.error:
+            magic = None
+        pixel_bytes = width * height * (4 if alpha else 3) if magic else 0
+        valid = (magic == MAGIC and version == VERSION and source_digest == digest
+                 and (res_w, res_h) == (resolution or (0, 0)) and entry_factor == factor
+                 and (has_mask or not mask)
+                 and len(data) == HEADER.size + pixel_bytes + runs * 3 * RUN.itemsize
+                 and zlib.crc32(memoryview(data)[HEADER.size:]) == crc)
+        if not valid:
+            self.discard(entry)
+            return None
+
+        # Slices of the map are copies, so nothing keeps it open
+        pixels = data[HEADER.size:HEADER.size + pixel_bytes]
+        surface = pygame.image.frombytes(pixels, (width, height), "RGBA" if alpha else "RGB")
+        if has_colorkey:
+            surface.set_colorkey(tuple(colorkey))  # Palette car images are transparent by colour key
+        surface_mask = None
+        if mask:
+            spans = np.frombuffer(data[HEADER.size + pixel_bytes:], RUN).reshape(-1, 3)
+            surface_mask = self.mask_from_runs((width, height), spans)
+        return surface, surface_mask
+
+    # Write an entry atomically, replacing older entries of the same image for this resolution and factor
+    def write(self, entry, digest, resolution, factor, surface, surface_mask):
+        alpha = bool(surface.get_flags() & pygame.SRCALPHA)
+        pixels = pygame.image.tobytes(surface, "RGBA" if alpha else "RGB")
+        colorkey = surface.get_colorkey()
+        spans = self.mask_runs(surface_mask) if surface_mask is not None else np.empty((0, 3), RUN)
+        payload = pixels + spans.tobytes()
+        header = HEADER.pack(MAGIC, VERSION, digest, *(resolution or (0, 0)), factor, *surface.get_size(),
+                             alpha, surface_mask is not None, colorkey is not None, bytes(colorkey[:3] if colorkey else (0, 0, 0)),
+                             len(spans), zlib.crc32(payload))
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            filename = os.path.basename(entry)
+            name, _, *variant = filename.rsplit("-", 3)
+            for other in os.listdir(self.directory):
+                other_name, _, *other_variant = other.rsplit("-", 3) + ["", ""]
+                if other != filename and (other_name, other_variant[:2]) == (name, variant):
+                    self.discard(os.path.join(self.directory, other))  # Built from an older version of the source
+            temporary = f"{entry}.{os.getpid()}.tmp"
+            with open(temporary, "wb") as f:
+                f.write(header)
+                f.write(payload)
+            os.replace(temporary, entry)
+        except OSError:
+            pass  # A read-only or full disk only costs the next start its warm cache
+
+    @staticmethod
+    def discard(entry):
+        try:
+            os.remove(entry)
+        except OSError:
+            pass
+
+    # Encode a mask as the (y, x_start, x_end) runs of set bits in each row
+    @staticmethod
+    def mask_runs(mask):
+        return SpriteCache.bits_runs(SpriteCache.mask_bits(mask))
+
+    # Set bits of a mask as a boolean array indexed [y, x]
+    @staticmethod
+    def mask_bits(mask):
+        return pygame.surfarray.array_red(mask.to_surface()).T > 0
+
+    # Encode a boolean [y, x] array as the (y, x_start, x_end) runs of True in each row
+    @staticmethod
+    def bits_runs(bits):
+        edges = np.diff(np.pad(bits, ((0, 0), (1, 1))).astype(np.int8), axis=1)
+        rows, starts = np.nonzero(edges == 1)
+        _, ends = np.nonzero(edges == -1)
+        return np.stack([rows, starts, ends], axis=1).astype(RUN)
+
+    # Rebuild a mask by stamping one filled row segment per run
+    @staticmethod
+    def mask_from_runs(size, spans):
+        mask = pygame.mask.Mask(size)
+        segments = {}
+        for y, start, end in spans.tolist():
+            segment = segments.get(end - start)
+            if segment is None:
+                segment = segments[end - start] = pygame.mask.Mask((end - start, 1), fill=True)
+            mask.draw(segment, (start, y))
+        return mask
+
+    # Delete every entry, e.g. from a settings screen or after changing the image files by hand
+    def clear(self):
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                self.discard(os.path.join(self.directory, name))
+
+
+# Shared by the track and car loaders
+SPRITES = SpriteCache()
@@ -0,0 +1,420 @@
+# Compiled track bundles: one versioned file per circuit with its source images and, for every compiled
+# screen resolution, the scaled images, the border and finish mask bitsets, the computer cars' path, the
+# start positions, the wall distance field and the sector grid. Loading a track is one read of the file
+# and a few decompressions; nothing is scaled or measured again.
+#
+# A circuit is described by tracks/<name>.json (images, scales, finish and start positions, path).
+# tracks/<name>.track is used when it was compiled from the current description; otherwise the game
+# compiles each resolution it needs into its own bundle in .cache/tracks on first use.
+#
+#   python trackbundle.py compile tracks/classic.json             # tracks/classic.track, common resolutions
+#   python trackbundle.py compile tracks/classic.json --resolution 1366x768 --resolution 1920x1080
+#   python trackbundle.py info tracks/classic.track
+#   python trackbundle.py list
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from collections import namedtuple
+import numpy as np  # NumPy for the mask bitsets and the field and sector grids
+import pygame  # Pygame library for images and masks
+from utils import scale_image
+from spritecache import SpriteCache  # Mask run encoding, shared with the sprite cache
+from distancefield import DistanceField  # Wall distances for collisions
+from progress import SectorMap  # Sectors for lap progress
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+TRACKS_DIR = os.path.join(ROOT, "tracks")
+CACHE_DIR = os.path.join(ROOT, ".cache", "tracks")
+DEFAULT_TRACK = "classic"
+
+# Resolutions `compile` builds unless others are given; the game caches any other one in a bundle of its own
+COMMON_RESOLUTIONS = ((1280, 720), (1366, 768), (1920, 1080), (2560, 1440), (3840, 2160))
+
+# File layout: header, JSON metadata, then the blobs the metadata points to, zlib-compressed in bundles
+# meant to be shipped. The game's cache stores images as they are, where loading speed matters more than
+# size, and still compresses the masks and grids, which are decoded anyway and shrink several times.
+# The header's CRC covers the metadata, and every blob has its own, checked when it is decoded.
+MAGIC = b"RGTRACK\0"
+VERSION = 1
+# Header fields: magic, version, metadata length, metadata CRC
+HEADER = struct.Struct("<8sHII")
+ALIGNMENT = 8  # Blobs start at multiples of this from the start of the file, so grids can be used in place
+
+# Images of a description
+IMAGE_ROLES = ("grass", "track", "border", "finish")
+
+# Everything a Track needs at one screen resolution
+TrackLayout = namedtuple("TrackLayout", ["name", "reference_size", "grass", "image", "border", "border_mask",
+                                         "finish", "finish_mask", "grass_pos", "track_pos", "border_pos",
+                                         "finish_pos", "player_start", "computer_start", "path", "border_field",
+                                         "sectors"])
+
+
+def _resolution_key(width, height):
+    return "%dx%d" % (width, height)
+
+
+# Parse "1920x1080"
+def parse_resolution(text):
+    width, _, height = text.lower().partition("x")
+    return int(width), int(height)
+
+
+# Read a track description; image paths are relative to the description file
+def read_description(path):
+    with open(path) as f:
+        description = json.load(f)
+    directory = os.path.dirname(os.path.abspath(path))
+    for role in IMAGE_ROLES:
+        description[role]["image"] = os.path.normpath(os.path.join(directory, description[role]["image"]))
+    return description
+
+
+# sha1 of a description and its images, stored in bundles compiled from it to tell when they are stale
+def description_digest(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        digest.update(f.read())
+    description = read_description(path)
+    for role in IMAGE_ROLES:
+        with open(description[role]["image"], "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+# Build the layout of a track at one resolution from its description and source images. `shared` holds the
+# images whose scale does not depend on the screen, built once for all resolutions.
+def build_layout(name, description, sources, width, height, shared=None):
+    reference_width, reference_height = description["reference_size"]
+    width_scale_factor = width / reference_width
+    height_scale_factor = height / reference_height
+    if shared is None:
+        shared = build_shared(description, sources)
+    grass, finish, finish_mask = shared
+
+    # The track image fills a share of the screen width; the border is scaled by the same factor
+    track_scale = (width / sources["track"].get_width()) * description["track"]["screen_width"]
+    border = scale_image(sources["border"], track_scale)
+    border_mask = pygame.mask.from_surface(border)
+    image = scale_image(sources["track"], track_scale)
+
+    # Centre the images
+    grass_pos = ((width - grass.get_width()) / 2, (height - grass.get_height()) / 2)
+    track_pos = ((width - image.get_width()) / 2, (height - image.get_height()) / 2)
+    border_pos = ((width - border.get_width()) / 2, (height - border.get_height()) / 2)
+    finish_x, finish_y = description["finish"]["position"]
+    finish_pos = (width * finish_x, height * finish_y)
+    player_start = (width * description["player_start"][0], height * description["player_start"][1])
+    computer_start = (width * description["computer_start"][0], height * description["computer_start"][1])
+
+    path = [(int(x * width_scale_factor), int(y * height_scale_factor)) for x, y in description["path"]]
+    border_field = DistanceField(border_mask, border_pos, width_scale_factor)
+    finish_center = (finish_pos[0] + finish.get_width() / 2, finish_pos[1] + finish.get_height() / 2)
+    sectors = SectorMap(path, finish_center, width, height, width_scale_factor)
+    return TrackLayout(name, (reference_width, reference_height), grass, image, border, border_mask, finish,
+                       finish_mask, grass_pos, track_pos, border_pos, finish_pos, player_start, computer_start,
+                       path, border_field, sectors)
+
+
+# Grass and finish line images, and the finish mask, which have the same size at every resolution
+def build_shared(description, sources):
+    grass = scale_image(sources["grass"], description["grass"]["scale"])
+    finish = sources["finish"]
+    if description["finish"]["scale"] != 1:
+        finish = scale_image(finish, description["finish"]["scale"])
+    return grass, finish, pygame.mask.from_surface(finish)
+
+
+# Define a class collecting blobs and the metadata entries that point to them. `compress` applies to
+# images, `compress_grids` (the same by default) to masks and arrays.
+class BundleWriter:
+    def __init__(self, compress=True, compress_grids=None):
+        self.compress = compress
+        self.compress_grids = compress if compress_grids is None else compress_grids
+        self.chunks = []
+        self.size = 0
+
+    def add(self, data, compress, **entry):
+        if compress:
+            data = zlib.compress(data, 6)
+        entry.update(offset=self.size, length=len(data), compressed=compress, crc=zlib.crc32(data))
+        padding = -len(data) % ALIGNMENT
+        self.chunks.append(data + bytes(padding))
+        self.size += len(data) + padding
+        return entry
+
+    def image(self, surface):
+        image_format = "RGBA" if surface.get_flags() & pygame.SRCALPHA else "RGB"
+        return self.add(pygame.image.tobytes(surface, image_format), self.compress, kind="image",
+                        size=list(surface.get_size()), format=image_format)
+
+    # A mask as rows of packed bits
+    def mask(self, mask):
+        return self.add(np.packbits(SpriteCache.mask_bits(mask), axis=1).tobytes(), self.compress_grids,
+                        kind="bits", size=list(mask.get_size()))
+
+    def array(self, array):
+        array = np.ascontiguousarray(array)
+        return self.add(array.tobytes(), self.compress_grids, kind="array", dtype=array.dtype.str, shape=list(array.shape))
+
+    # The whole bundle file
+    def finish(self, metadata):
+        meta = json.dumps(metadata, separators=(",", ":")).encode()
+        meta += b" " * (-(HEADER.size + len(meta)) % ALIGNMENT)
+        return b"".join([HEADER.pack(MAGIC, VERSION, len(meta), zlib.crc32(meta)), meta, *self.chunks])
+
+
+# Compile a description into bundle bytes for the given resolutions. Without `include_sources` the bundle
+# cannot build layouts for other resolutions, which the game's one-resolution cache bundles never need.
+def compile_bundle(description_path, resolutions=COMMON_RESOLUTIONS, compress=True, compress_grids=None,
+                   include_sources=True):
+    name = os.path.splitext(os.path.basename(description_path))[0]
+    description = read_description(description_path)
+    sources = {role: pygame.image.load(description[role]["image"]) for role in IMAGE_ROLES}
+    shared = build_shared(description, sources)
+    writer = BundleWriter(compress, compress_grids)
+
+    metadata = {
+        "name": name,
+        "title": description.get("name", name),
+        "digest": description_digest(description_path),
+        "description": {key: value for key, value in description.items() if key not in IMAGE_ROLES},
+        "scales": {role: {key: value for key, value in description[role].items() if key != "image"}
+                   for role in IMAGE_ROLES},
+        "sources": {role: writer.image(sources[role]) for role in IMAGE_ROLES} if include_sources else {},
+        "shared": {"grass": writer.image(shared[0]), "finish": writer.image(shared[1]),
+                   "finish_mask": writer.mask(shared[2])},
+        "layouts": {},
+    }
+    for width, height in sorted(set(resolutions)):
+        layout = build_layout(name, description, sources, width, height, shared)
+        field, sectors = layout.border_field, layout.sectors
+        metadata["layouts"][_resolution_key(width, height)] = {
+            "grass_pos": layout.grass_pos, "track_pos": layout.track_pos, "border_pos": layout.border_pos,
+            "finish_pos": layout.finish_pos, "player_start": layout.player_start,
+            "computer_start": layout.computer_start, "path": layout.path,
+            "field": {"cell": field.cell, "band": field.band, "distance": writer.array(field.distance),
+                      "gradient_x": writer.array(field.gradient_x), "gradient_y": writer.array(field.gradient_y)},
+            "sectors": {"cell": sectors.cell, "checkpoints": writer.array(sectors.checkpoints),
+                        "sector_grid": writer.array(sectors.sector_grid),
+                        "distance_grid": writer.array(sectors.distance_grid)},
+            "image": writer.image(layout.image),
+            "border": writer.image(layout.border),
+            "border_mask": writer.mask(layout.border_mask),
+        }
+    return writer.finish(metadata)
+
+
+# Write bytes to `path` atomically
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+# Define a class reading a bundle through one memory map of its file and decoding layouts from it.
+# Uncompressed images and grids are views of the mapped file, so they are never copied, and only the
+# resolutions that are used are ever read from disk.
+class TrackBundle:
+    def __init__(self, data, path="<bundle>"):
+        try:
+            magic, version, meta_length, crc = HEADER.unpack_from(data)
+        except struct.error:
+            magic = version = None
+        if (magic != MAGIC or version != VERSION or len(data) < HEADER.size + meta_length
+                or zlib.crc32(memoryview(data)[HEADER.size:HEADER.size + meta_length]) != crc):
+            raise ValueError(f"{path} is not a track bundle")
+        self.path = path
+        self.metadata = json.loads(bytes(data[HEADER.size:HEADER.size + meta_length]))
+        self.blobs = memoryview(data)[HEADER.size + meta_length:]
+        self.name = self.metadata["name"]
+        self.title = self.metadata["title"]
+        self.digest = self.metadata["digest"]
+        self.built = {}  # Layouts built from the source images, for resolutions the bundle was not compiled for
+
+    @classmethod
+    def read(cls, path):
+        with open(path, "rb") as f:
+            # Copy-on-write mapping: pages are shared with the OS file cache until a surface is drawn on
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        return cls(data, path)
+
+    # The bundle at `path`, or None if it is missing or damaged
+    @classmethod
+    def try_read(cls, path):
+        try:
+            return cls.read(path)
+        except (OSError, ValueError):  # ValueError: empty or not a bundle
+            return None
+
+    @property
+    def resolutions(self):
+        return [parse_resolution(key) for key in self.metadata["layouts"]]
+
+    def has(self, width, height):
+        return _resolution_key(width, height) in self.metadata["layouts"]
+
+    # Decompress and decode one blob
+    def blob(self, entry):
+        data = self.blobs[entry["offset"]:entry["offset"] + entry["length"]]
+        if len(data) != entry["length"] or zlib.crc32(data) != entry["crc"]:
+            raise ValueError(f"{self.path} is damaged")
+        if entry["compressed"]:
+            data = bytearray(zlib.decompress(data))
+        if entry["kind"] == "image":
+            return pygame.image.frombuffer(data, entry["size"], entry["format"])
+        if entry["kind"] == "bits":
+            width, height = entry["size"]
+            bits = np.unpackbits(np.frombuffer(data, np.uint8).reshape(height, -1), axis=1, count=width)
+            return SpriteCache.mask_from_runs((width, height), SpriteCache.bits_runs(bits.astype(bool)))
+        return np.frombuffer(data, entry["dtype"]).reshape(entry["shape"])
+
+    # Description of the track as compiled, with the image roles' scales but no image paths
+    def description(self):
+        description = dict(self.metadata["description"])
+        description.update(self.metadata["scales"])
+        return description
+
+    # Layout of the track at a resolution, decoded from the bundle or built from its source images
+    def layout(self, width, height):
+        meta = self.metadata
+        shared = meta["shared"]
+        grass, finish, finish_mask = self.blob(shared["grass"]), self.blob(shared["finish"]), self.blob(shared["finish_mask"])
+        entry = meta["layouts"].get(_resolution_key(width, height))
+        if entry is None:
+            layout = self.built.get((width, height))
+            if layout is None and not meta["sources"]:
+                raise ValueError(f"{self.path} has no {_resolution_key(width, height)} layout")
+            if layout is None:
+                sources = {role: self.blob(source) for role, source in meta["sources"].items()}
+                layout = self.built[width, height] = build_layout(self.name, self.description(), sources, width,
+                                                                  height, (grass, finish, finish_mask))
+            return layout
+
+        field, sectors = entry["field"], entry["sectors"]
+        border_pos = tuple(entry["border_pos"])
+        border_field = DistanceField.from_grids(self.blob(field["distance"]), self.blob(field["gradient_x"]),
+                                                self.blob(field["gradient_y"]), field["cell"], border_pos,
+                                                field["band"])
+        sector_map = SectorMap.from_grids(self.blob(sectors["checkpoints"]), sectors["cell"],
+                                          self.blob(sectors["sector_grid"]), self.blob(sectors["distance_grid"]))
+        return TrackLayout(self.name, tuple(meta["description"]["reference_size"]), grass, self.blob(entry["image"]),
+                           self.blob(entry["border"]), self.blob(entry["border_mask"]), finish, finish_mask,
+                           tuple(entry["grass_pos"]), tuple(entry["track_pos"]), border_pos,
+                           tuple(entry["finish_pos"]), tuple(entry["player_start"]), tuple(entry["computer_start"]),
+                           [tuple(point) for point in entry["path"]], border_field, sector_map)
+
+
+# Names of the tracks in tracks/, from their descriptions and compiled bundles
+def track_names():
+    if not os.path.isdir(TRACKS_DIR):
+        return []
+    names = {os.path.splitext(filename)[0] for filename in os.listdir(TRACKS_DIR)
+             if filename.endswith((".json", ".track"))}
+    return sorted(names, key=lambda name: (name != DEFAULT_TRACK, name))
+
+
+# Display name of a track
+def track_title(name):
+    description_path = os.path.join(TRACKS_DIR, name + ".json")
+    if os.path.exists(description_path):
+        with open(description_path) as f:
+            return json.load(f).get("name", name)
+    bundle = TrackBundle.try_read(os.path.join(TRACKS_DIR, name + ".track"))
+    return bundle.title if bundle is not None else name
+
+
+# Cached bundle of one resolution of the named track
+def cache_path(name, resolution):
+    return os.path.join(CACHE_DIR, f"{name}-{_resolution_key(*resolution)}.track")
+
+
+# Find or compile a bundle of the named track that has the resolution. A shipped bundle is used when it
+# is up to date with the description (or there is no description); otherwise the cached bundle of the
+# resolution is used, and compiled when it is missing or stale. Other resolutions are left alone.
+def find_bundle(name, resolution):
+    shipped = os.path.join(TRACKS_DIR, name + ".track")
+    description_path = os.path.join(TRACKS_DIR, name + ".json")
+    if not os.path.exists(description_path):
+        if not os.path.exists(shipped):
+            raise ValueError(f"there is no track named {name!r} in {TRACKS_DIR}")
+        return TrackBundle.read(shipped)
+
+    digest = description_digest(description_path)
+    cached_path = cache_path(name, resolution)
+    for path in (shipped, cached_path):
+        bundle = TrackBundle.try_read(path)
+        if bundle is not None and bundle.digest == digest and bundle.has(*resolution):
+            return bundle
+
+    data = compile_bundle(description_path, [resolution], compress=False, compress_grids=True,
+                          include_sources=False)
+    try:
+        write_file(cached_path, data)
+        return TrackBundle.read(cached_path)
+    except OSError:
+        # A read-only or full disk only costs the next start the compile
+        return TrackBundle(bytearray(data), cached_path)
+
+
+# Bundles found so far by track name and resolution; tracks are built on the asset loader's thread too
+BUNDLES = {}
+BUNDLES_LOCK = threading.Lock()
+
+
+# Layout of the named track at a resolution. A damaged cached bundle is compiled again.
+def load_layout(name, width, height):
+    key = (name, width, height)
+    with BUNDLES_LOCK:
+        bundle = BUNDLES.get(key)
+        if bundle is None:
+            bundle = BUNDLES[key] = find_bundle(name, (width, height))
+        try:
+            return bundle.layout(width, height)
+        except ValueError:
+            if os.path.dirname(bundle.path) != CACHE_DIR:
+                raise
+            os.remove(bundle.path)
+            bundle = BUNDLES[key] = find_bundle(name, (width, height))
+            return bundle.layout(width, height)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile and inspect track bundles.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    compile_parser = commands.add_parser("compile", help="compile a track description into a bundle")
+    compile_parser.add_argument("description", help="track description, e.g. tracks/classic.json")
+    compile_parser.add_argument("-o", "--output", help="bundle file (default: next to the description)")
+    compile_parser.add_argument("--resolution", action="append", type=parse_resolution,
+                                help="screen size to pre-scale for, e.g. 1920x1080 (repeatable; default: common sizes)")
+    compile_parser.add_argument("--raw", action="store_true", help="store the blobs uncompressed: bigger, faster to load")
+    info_parser = commands.add_parser("info", help="show what a bundle contains")
+    info_parser.add_argument("bundle")
+    commands.add_parser("list", help="list the tracks in tracks/")
+    args = parser.parse_args(argv)
+
+    if args.command == "compile":
+        output = args.output or os.path.splitext(args.description)[0] + ".track"
+        write_file(os.path.abspath(output), compile_bundle(args.description, args.resolution or COMMON_RESOLUTIONS,
+                                                                not args.raw))
+        print(f"Wrote {output} ({os.path.getsize(output) / 1e6:.1f} MB)")
+    elif args.command == "info":
+        bundle = TrackBundle.read(args.bundle)
+        print(f"{bundle.title} ({bundle.name}), {os.path.getsize(args.bundle) / 1e6:.1f} MB, "
+              f"compiled from {bundle.digest[:12]}")
+        for width, height in bundle.resolutions:
+            print(f"  {width}x{height}")
+    else:
+        for name in track_names():
+            print(f"{name}: {track_title(name)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,95 @@
-import pygame
-
-def scale_image(img, factor):
-    size = round(img.get_width() * factor), round(img.get_height() * factor)
-    return pygame.transform.scale(img, size)
-
-
-def blit_rotate_center(win, image, top_left, angle):
-    rotated_image = pygame.transform.rotate(image, angle)
-    new_rect = rotated_image.get_rect(
-        center=image.get_rect(topleft=top_left).center)
-    win.blit(rotated_image, new_rect.topleft)
-    return rotated_image, new_rect
-
-
-def blit_text_center(win, font, text):
-    render = font.render(text, 1, (200, 200, 200))
-    win.blit(render, (win.get_width()/2 - render.get_width() /
-                      2, win.get_height()/2 - render.get_height()/2))
+import pygame
+import math
+import threading
+from hud import TEXT_CACHE
+
+def scale_image(img, factor):
+    size = round(img.get_width() * factor), round(img.get_height() * factor)
+    return pygame.transform.scale(img, size)
+
+
+def blit_rotate_center(win, image, top_left, angle):
+    rotated_image = pygame.transform.rotate(image, angle)
+    new_rect = rotated_image.get_rect(
+        center=image.get_rect(topleft=top_left).center)
+    win.blit(rotated_image, new_rect.topleft)
+    return rotated_image, new_rect
+
+
+def blit_text_center(win, font, text):
+    render = TEXT_CACHE.render(font, text, (200, 200, 200))
+    return win.blit(render, (win.get_width()/2 - render.get_width() /
+                             2, win.get_height()/2 - render.get_height()/2))
+
+
+# Blit lines of text centred on the window, the line at index `highlight` in `highlight_color`, and return
+# the rect they cover
+def blit_lines_center(win, font, lines, highlight=None, highlight_color=(255, 215, 0)):
+    renders = [TEXT_CACHE.render(font, line, highlight_color if i == highlight else (200, 200, 200))
+               for i, line in enumerate(lines)]
+    y = win.get_height()/2 - sum(render.get_height() for render in renders)/2
+    rects = []
+    for render in renders:
+        rects.append(win.blit(render, (win.get_width()/2 - render.get_width()/2, y)))
+        y += render.get_height()
+    return rects[0].unionall(rects[1:])
+
+
+# Angle resolution (degrees) and memory cap (bytes) of the pre-baked car rotations
+ROTATION_STEP = 2
+ROTATION_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+
+class RotationCache:
+    # Rotated surfaces and collision masks of one image at quantized angles
+    def __init__(self, image, step=ROTATION_STEP, max_bytes=ROTATION_CACHE_MAX_BYTES):
+        self.size = image.get_size()
+
+        # Coarsen the angle resolution until the estimated footprint fits the budget
+        count = max(1, round(360 / step))
+        while count > 1 and self.estimate_bytes(image, count) > max_bytes:
+            count //= 2
+        self.count = count
+        self.step = 360 / count
+
+        self.frames = []
+        for i in range(count):
+            rotated_image = pygame.transform.rotate(image, i * self.step)
+            self.frames.append((rotated_image, pygame.mask.from_surface(rotated_image)))
+
+    # Upper bound of the memory used by `count` rotations (32-bit pixels plus 1-bit mask)
+    @staticmethod
+    def estimate_bytes(image, count):
+        diagonal = math.ceil(math.hypot(*image.get_size()))
+        return count * diagonal * diagonal * 33 // 8
+
+    # Get the cached (image, mask, rect) for a car drawn at top_left with the given angle
+    def lookup(self, top_left, angle):
+        rotated_image, mask = self.frames[round(angle / self.step) % self.count]
+        new_rect = rotated_image.get_rect(
+            center=pygame.Rect(top_left, self.size).center)
+        return rotated_image, mask, new_rect
+
+    # Cached equivalent of blit_rotate_center
+    def blit(self, win, top_left, angle):
+        rotated_image, _, new_rect = self.lookup(top_left, angle)
+        win.blit(rotated_image, new_rect.topleft)
+        return rotated_image, new_rect
+
+
+# Rotation caches by (image, step, budget, alpha): every car drawn with the same image shares one
+ROTATION_CACHES = {}
+ROTATION_CACHES_LOCK = threading.Lock()
+
+
+# The shared rotations of `image`; with `alpha`, of a see-through copy of it, e.g. for a ghost car
+def rotation_cache(image, step=ROTATION_STEP, max_bytes=ROTATION_CACHE_MAX_BYTES, alpha=None):
+    key = (image, step, max_bytes, alpha)
+    with ROTATION_CACHES_LOCK:
+        cache = ROTATION_CACHES.get(key)
+        if cache is None:
+            cache = ROTATION_CACHES[key] = RotationCache(image, step, max_bytes)
+            if alpha is not None:
+                for rotated_image, _ in cache.frames:
+                    rotated_image.set_alpha(alpha)
+    return cache